@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import os
 from pathlib import Path
 from typing import Any, Dict
 
@@ -66,3 +67,27 @@ def get_path(key: str, default_relative: str | None = None) -> Path:
         rel = default_relative
 
     return (workspace_root / rel).resolve()
+
+
+def get_staging_config() -> Dict[str, Any]:
+    """
+    Liefert den Abschnitt "staging" aus paths.json (node-lokales Staging, siehe
+    scripts/node_staging.py), ergänzt um Defaults und workspace_root.
+
+    local_root wird mit Umgebungsvariablen expandiert (z.B. "${TMPDIR}/dachs_stage");
+    ist TMPDIR nicht gesetzt, wird /tmp verwendet.
+    """
+    cfg = _load_paths_config()
+    staging = dict(cfg.get("staging") or {})
+    staging.setdefault("enabled", False)
+    staging.setdefault("local_root", "${TMPDIR}/dachs_stage")
+    staging.setdefault("sync_interval_s", 300)
+
+    local_root = str(staging["local_root"])
+    if "TMPDIR" in local_root and not os.environ.get("TMPDIR"):
+        local_root = local_root.replace("${TMPDIR}", "/tmp").replace("$TMPDIR", "/tmp")
+    staging["local_root"] = os.path.expandvars(local_root)
+    if staging.get("shared_inputs_root"):
+        staging["shared_inputs_root"] = os.path.expandvars(str(staging["shared_inputs_root"]))
+    staging["workspace_root"] = str(Path(cfg.get("workspace_root", REPO_ROOT)))
+    return staging
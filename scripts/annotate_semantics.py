@@ -35,6 +35,11 @@ Erweitertes Logging:
 Sharding:
 - Die Menge der Eingabedateien kann über (--num-shards, --shard-id) auf mehrere
   Jobs (z. B. SLURM-Array) verteilt werden.
+- Mit --shard-plan (scripts/shard_plan.py --stage annotate) werden die Dateien
+  nach offenen Chunks per LPT auf die Shards verteilt statt per Modulo.
+- Mit --work-queue (scripts/work_queue.py) ziehen alle Array-Tasks Dateien
+  dynamisch per Lease aus einer gemeinsamen Queue; --num-shards/--shard-id
+  werden dann ignoriert und zusätzliche Tasks erhöhen einfach den Durchsatz.
 """
 
 from __future__ import annotations
@@ -45,6 +50,7 @@ import json
 import logging
 import os
 import re
+import sys
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -75,6 +81,34 @@ spec.loader.exec_module(paths_utils)
 get_path = paths_utils.get_path
 REPO_ROOT = paths_utils.REPO_ROOT  # gleiche Logik wie in paths_utils.py
 
+# Ollama-Readiness/Warm-up (scripts/ollama_warmup.py), gleiche Lade-Logik
+_warmup_spec = importlib.util.spec_from_file_location("dachs_ollama_warmup", THIS_DIR / "ollama_warmup.py")
+ollama_warmup = importlib.util.module_from_spec(_warmup_spec)
+assert _warmup_spec.loader is not None
+sys.modules["dachs_ollama_warmup"] = ollama_warmup  # für dataclasses im geladenen Modul
+_warmup_spec.loader.exec_module(ollama_warmup)
+
+# Shard-Plan (scripts/shard_plan.py) für größenbewusste Verteilung
+_plan_spec = importlib.util.spec_from_file_location("dachs_shard_plan", THIS_DIR / "shard_plan.py")
+shard_plan = importlib.util.module_from_spec(_plan_spec)
+assert _plan_spec.loader is not None
+sys.modules["dachs_shard_plan"] = shard_plan
+_plan_spec.loader.exec_module(shard_plan)
+
+# Lease-basierte Work-Queue (scripts/work_queue.py) für dynamische Verteilung
+_queue_spec = importlib.util.spec_from_file_location("dachs_work_queue", THIS_DIR / "work_queue.py")
+work_queue = importlib.util.module_from_spec(_queue_spec)
+assert _queue_spec.loader is not None
+sys.modules["dachs_work_queue"] = work_queue
+_queue_spec.loader.exec_module(work_queue)
+
+# Node-lokales Staging (scripts/node_staging.py), konfiguriert über paths.json
+_staging_spec = importlib.util.spec_from_file_location("dachs_node_staging", THIS_DIR / "node_staging.py")
+node_staging = importlib.util.module_from_spec(_staging_spec)
+assert _staging_spec.loader is not None
+sys.modules["dachs_node_staging"] = node_staging
+_staging_spec.loader.exec_module(node_staging)
+
 # Taxonomie- und LLM-Konfig-Pfade im Repo
 TAXONOMY_DIR = REPO_ROOT / "config" / "taxonomy"
 LLM_CONFIG_PATH = REPO_ROOT / "config" / "LLM" / "semantic_llm.json"
@@ -152,6 +186,9 @@ class LLMSemanticClassifier:
         self.max_tokens = int(config.get("max_tokens", 512))
         # Sicherheits-Limit für Chunk-Textlänge (in Zeichen)
         self.max_chars = int(config.get("max_chars", 4000))
+        # keep_alive bei jedem Request mitschicken, sonst fällt Ollama auf den
+        # Server-Default (5 min) zurück und entlädt das Modell zwischendurch
+        self.keep_alive = ollama_warmup.parse_keep_alive(config.get("keep_alive"))
 
     def classify_chunk(
         self,
@@ -354,6 +391,7 @@ Now produce the JSON classification and enrichment for the MAIN CHUNK.
             ],
             "temperature": self.temperature,
             "stream": False,
+            "keep_alive": self.keep_alive,
             # kein explizites format=json hier – wir parsen selbst robust
             "options": {
                 "num_predict": self.max_tokens,
@@ -998,6 +1036,40 @@ def main() -> None:
         default=0,
         help="Shard-Index dieses Jobs (0-basiert).",
     )
+    parser.add_argument(
+        "--shard-plan",
+        type=str,
+        default=None,
+        help="Optional: Shard-Plan aus scripts/shard_plan.py (--stage annotate) statt Modulo-Verteilung.",
+    )
+    parser.add_argument(
+        "--work-queue",
+        type=str,
+        default=None,
+        help="Optional: Queue-Verzeichnis auf dem Workspace; Dateien werden per Lease dynamisch gezogen.",
+    )
+    parser.add_argument(
+        "--lease-ttl",
+        type=float,
+        default=work_queue.DEFAULT_LEASE_TTL_S,
+        help="Lease-Timeout (s) für --work-queue; abgelaufene Leases werden neu vergeben.",
+    )
+    parser.add_argument(
+        "--no-staging",
+        action="store_true",
+        help="Node-lokales Staging aus paths.json ignorieren und direkt im Workspace lesen/schreiben.",
+    )
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="Readiness-Check und Modell-Warm-up vor der Annotation überspringen.",
+    )
+    parser.add_argument(
+        "--ready-timeout",
+        type=float,
+        default=None,
+        help="Max. Wartezeit (s) auf den Ollama-Server (Default: ready_timeout_s aus der LLM-Config oder 600).",
+    )
 
     args = parser.parse_args()
 
@@ -1041,8 +1113,23 @@ def main() -> None:
         logging.warning("Keine JSONL-Dateien in %s gefunden.", input_dir)
         return
 
-    # Sharding anwenden: einfacher Modulo-Split über den Index
-    if args.num_shards == 1:
+    queue = None
+    if args.work_queue:
+        queue = work_queue.WorkQueue(Path(args.work_queue).expanduser().resolve(), lease_ttl_s=args.lease_ttl)
+        # Gewicht = Dateigröße: große Dateien zuerst vergeben, damit sie nicht am Ende allein laufen
+        queue.ensure_seeded([(f.name, f.stat().st_size) for f in files_all], stage="annotate")
+        status = queue.status()
+        logging.info("Work-Queue: %s", status)
+        if status["pending"] == 0 and status["leased"] == 0:
+            logging.info("Work-Queue ist bereits abgearbeitet – nichts zu tun.")
+            return
+        files = files_all
+    # Sharding anwenden: Shard-Plan (LPT nach offenen Chunks) oder einfacher Modulo-Split
+    elif args.shard_plan:
+        plan = shard_plan.load_shard_plan(Path(args.shard_plan).expanduser().resolve())
+        files = shard_plan.files_for_shard(plan, args.shard_id, args.num_shards, files_all, stage="annotate")
+        logging.info("Shard-Plan: %s", args.shard_plan)
+    elif args.num_shards == 1:
         files = files_all
     else:
         files = [
@@ -1051,13 +1138,14 @@ def main() -> None:
             if idx % args.num_shards == args.shard_id
         ]
 
-    logging.info(
-        "Sharding-Konfiguration: num_shards=%d, shard_id=%d, files_total=%d, files_in_this_shard=%d",
-        args.num_shards,
-        args.shard_id,
-        len(files_all),
-        len(files),
-    )
+    if queue is None:
+        logging.info(
+            "Sharding-Konfiguration: num_shards=%d, shard_id=%d, files_total=%d, files_in_this_shard=%d",
+            args.num_shards,
+            args.shard_id,
+            len(files_all),
+            len(files),
+        )
 
     if not files:
         logging.warning(
@@ -1068,6 +1156,23 @@ def main() -> None:
         )
         return
 
+    # Erst Arbeit ziehen, wenn das Modell geladen ist (kein "sleep 5" + Kaltstart im ersten Chunk)
+    if not args.no_warmup:
+        ready_timeout = args.ready_timeout
+        if ready_timeout is None:
+            ready_timeout = float(llm_config.get("ready_timeout_s", 600))
+        try:
+            ollama_warmup.ensure_models_ready(
+                base_url=classifier.base_url,
+                models=[classifier.model],
+                keep_alive=classifier.keep_alive,
+                ready_timeout_s=ready_timeout,
+                telemetry_path=get_path("logs", "logs") / "telemetry" / "llm_warmup.jsonl",
+                context={"script": "annotate_semantics.py", "shard_id": args.shard_id},
+            )
+        except Exception as e:
+            raise SystemExit(f"LLM-Warm-up fehlgeschlagen: {e}")
+
     output_dir.mkdir(parents=True, exist_ok=True)
 
     # globales Fortschrittsobjekt für den ganzen Job
@@ -1078,10 +1183,38 @@ def main() -> None:
         "job_start_time": time.time(),
     }
 
-    for in_file in files:
-        rel = in_file.name
-        out_file = output_dir / rel
-        process_file(in_file, out_file, classifier, taxonomies, progress)
+    staging_cfg = paths_utils.get_staging_config()
+    staging = node_staging.NodeStaging.from_config(
+        Path(staging_cfg["workspace_root"]),
+        None if args.no_staging else staging_cfg,
+    ).start()
+
+    def _process_staged(in_file: Path, out_file: Path) -> None:
+        # process_file schreibt die Ausgabe komplett neu -> erst nach Abschluss zurücksyncen
+        local_out = staging.track_output(out_file, append_only=False)
+        process_file(staging.stage_in(in_file), local_out, classifier, taxonomies, progress)
+        staging.release_output(out_file)
+        # Mit Queue gilt das Item nach der Rückkehr als erledigt -> Ausgabe sofort sichern;
+        # ein fehlgeschlagener Sync gibt die Lease frei (drain_queue)
+        staging.checkpoint(force=queue is not None, raise_errors=queue is not None)
+
+    if queue is not None:
+        files_by_name = {f.name: f for f in files_all}
+
+        def _handle(name: str) -> None:
+            in_file = files_by_name.get(name)
+            if in_file is None:
+                raise FileNotFoundError(f"Queue-Item nicht im Eingabeverzeichnis: {name}")
+            _process_staged(in_file, output_dir / name)
+
+        work_queue.drain_queue(queue, _handle)
+    else:
+        for in_file in files:
+            rel = in_file.name
+            out_file = output_dir / rel
+            _process_staged(in_file, out_file)
+
+    staging.finalize()
 
     logging.info("Semantische Anreicherung abgeschlossen.")
 
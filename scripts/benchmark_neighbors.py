@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+benchmark_neighbors.py
+
+Benchmark der Nachbarsuche über FaissRetriever – so, wie generate_qa_candidates.py
+sie benutzt – mit Verlauf über Versionen hinweg.
+
+Gemessen pro Variante und Thread-Zahl (--threads):
+- Latenz: Einzelanfragen get_neighbors_for_chunks([anker]) -> p50/p99 in ms
+- Durchsatz: Anker blockweise (--batch-size, wie neighbors.faiss_prefetch_block)
+  -> Anfragen/s
+- overlap@k: Anteil der exakten Flat-Nachbarn (aus dem Embedding-Store), den die
+  Variante ebenfalls liefert
+- recall@k / hit@k: Fragen aus qa_final bzw. qa_candidates als Anfragen (mit dem
+  Modell aus contextual_config.json kodiert); Ground Truth sind ihre Quell-Chunks
+  (source_chunks bzw. source_ids). recall@k = mittlerer Anteil der Quell-Chunks
+  unter den Top-k, hit@k = Anteil der Fragen mit mindestens einem Treffer
+- Allokation: Bytes pro Anfrage für einen Block (tracemalloc), einmal mit den
+  NeighborHit-Objekten und einmal als vollständige Dicts (to_dict(), wie die
+  Treffer vor NeighborHit aussahen) als Vergleichswert
+
+Varianten (--variants, kommagetrennt):
+  current   aktuelle Generation, wie geladen (inkl. kNN-Graph, falls vorhanden)
+  flat      exakter Flat-Index aus dem Embedding-Store (Baseline für overlap@k)
+  hier<D>   aktuelle Generation, zweistufig über den Dokument-Index (top_docs=D)
+  sonst     Index-Varianten wie in benchmark_retrieval.py (z.B. flat:sq8, hnsw:sq8),
+            werden aus dem Embedding-Store gebaut
+
+Anker sind zufällig gezogene Chunks des Korpus (--seed, fest für Vergleiche).
+
+Jeder Lauf wird als eine Zeile an <workspace_root>/logs/benchmarks/neighbors_history.jsonl
+angehängt (Git-Commit, --label, Generation, Ergebnisse); die Tabelle zeigt die
+Änderung gegenüber dem letzten Lauf mit denselben Parametern.
+
+Beispiel:
+  python scripts/benchmark_neighbors.py \\
+      --workspace-root /beegfs/scratch/workspace/es_phdoeble-rag_pipeline \\
+      --variants current,hier16,flat:sq8 --threads 1,8 --label "nach Umbau X"
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import logging
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.benchmark_retrieval import load_vectors, parse_variant  # type: ignore
+from scripts.embed_chunks import (  # type: ignore
+    DEFAULT_EMBEDDING_CONFIG,
+    DEFAULT_INDEX_PARAMS,
+    build_faiss_index,
+    faiss,
+    load_embedding_config,
+)
+from scripts.faiss_retriever import FaissRetriever  # type: ignore
+
+logger = logging.getLogger("benchmark_neighbors")
+
+DEFAULT_VARIANTS = "current,flat"
+DEFAULT_THREADS = "1"
+HISTORY_NAME = "neighbors_history.jsonl"
+# Vergleich mit dem letzten Lauf nur bei gleichen Parametern
+COMPARE_KEYS = ("indices_generation", "top_k", "num_anchors", "batch_size", "seed", "num_questions")
+
+
+def git_commit(repo_root: Path) -> Optional[str]:
+    """Kurzer Commit-Hash des Repos (None außerhalb eines Git-Checkouts)."""
+    try:
+        out = subprocess.run(
+            ["git", "-C", str(repo_root), "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if out.returncode != 0:
+        return None
+    return out.stdout.strip() or None
+
+
+def load_qa_pairs(qa_dir: Path, limit: int, seed: int) -> List[Tuple[str, List[str]]]:
+    """
+    (Frage, Quell-chunk_ids) aus allen *.jsonl in qa_dir: qa_candidates
+    (question/source_chunks) oder qa_final (instruction/source_ids "chunk:<id>").
+    Stichprobe von höchstens limit Paaren.
+    """
+    pairs: List[Tuple[str, List[str]]] = []
+    bad = 0
+    for path in sorted(qa_dir.glob("*.jsonl")):
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    bad += 1
+                    continue
+                question = rec.get("question") or rec.get("instruction")
+                sources = rec.get("source_chunks")
+                if isinstance(sources, str):
+                    sources = [sources]
+                if sources is None:
+                    sources = [
+                        s[len("chunk:"):] for s in rec.get("source_ids") or [] if isinstance(s, str) and s.startswith("chunk:")
+                    ]
+                sources = [s for s in sources or [] if isinstance(s, str) and s]
+                if isinstance(question, str) and question.strip() and sources:
+                    pairs.append((question, sources))
+    if bad:
+        logger.warning("%d kaputte JSONL-Zeilen in %s übersprungen.", bad, qa_dir)
+    if len(pairs) > limit:
+        pairs = random.Random(seed).sample(pairs, limit)
+    return pairs
+
+
+def resolve_qa_dir(workspace_root: Path, source: str, qa_dir: Optional[str]) -> Optional[Path]:
+    if qa_dir:
+        return Path(qa_dir)
+    candidates = {
+        "final": [workspace_root / "qa_final" / "jsonl"],
+        "candidates": [workspace_root / "qa_candidates" / "jsonl"],
+        "auto": [workspace_root / "qa_final" / "jsonl", workspace_root / "qa_candidates" / "jsonl"],
+    }.get(source, [])
+    for path in candidates:
+        if path.is_dir() and any(path.glob("*.jsonl")):
+            return path
+    return None
+
+
+def with_index(retriever: FaissRetriever, index: Any) -> FaissRetriever:
+    """
+    Flache Kopie des Retrievers mit anderem Index und ohne kNN-Graph; Meta-Store,
+    Vektordatei, Modell und Embedding-Cache werden geteilt.
+    """
+    clone = copy.copy(retriever)
+    clone.index = index
+    clone._is_flat = isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+    clone.knn_graph = None
+    clone._filter_cache = {}
+    clone._result_cache = {}
+    return clone
+
+
+def neighbor_ids(retriever: FaissRetriever, anchors: Sequence[str], top_k: int, top_docs: Optional[int]) -> List[List[int]]:
+    found = retriever.get_neighbors_for_chunks(anchors, top_k=top_k, top_docs=top_docs)
+    return [[int(h["faiss_id"]) for h in found.get(a, [])] for a in anchors]
+
+
+def overlap_at_k(ids: List[List[int]], base_ids: List[List[int]], top_k: int) -> float:
+    hits = sum(len(set(row) & set(base_row)) for row, base_row in zip(ids, base_ids))
+    return hits / float(max(1, top_k * len(base_ids)))
+
+
+def measure_workload(
+    retriever: FaissRetriever,
+    anchors: Sequence[str],
+    top_k: int,
+    batch_size: int,
+    single_queries: int,
+    threads: int,
+    top_docs: Optional[int],
+) -> Dict[str, float]:
+    """Latenz der Einzelanfragen (p50/p99) und Durchsatz der Block-Anfragen."""
+    lat: List[float] = []
+    for anchor in anchors[:single_queries]:
+        t = time.perf_counter()
+        retriever.get_neighbors_for_chunks([anchor], top_k=top_k, num_threads=threads, top_docs=top_docs)
+        lat.append((time.perf_counter() - t) * 1000.0)
+
+    t0 = time.perf_counter()
+    for start in range(0, len(anchors), batch_size):
+        retriever.get_neighbors_for_chunks(
+            anchors[start : start + batch_size], top_k=top_k, num_threads=threads, top_docs=top_docs
+        )
+    batch_s = time.perf_counter() - t0
+    return {
+        "single_ms_p50": float(np.percentile(lat, 50)) if lat else 0.0,
+        "single_ms_p99": float(np.percentile(lat, 99)) if lat else 0.0,
+        "queries_per_s": len(anchors) / batch_s if batch_s > 0 else 0.0,
+    }
+
+
+def measure_alloc(
+    retriever: FaissRetriever,
+    anchors: Sequence[str],
+    top_k: int,
+    top_docs: Optional[int],
+    as_dicts: bool = False,
+) -> float:
+    """
+    Bytes, die die Ergebnisse eines Blocks pro Anfrage belegen (tracemalloc);
+    as_dicts: Treffer als vollständige Dicts (to_dict()) statt NeighborHit.
+    """
+    tracemalloc.start()
+    try:
+        found = retriever.get_neighbors_for_chunks(anchors, top_k=top_k, top_docs=top_docs)
+        if as_dicts:
+            found = {cid: [hit.to_dict() for hit in hits] for cid, hits in found.items()}
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del found
+    return current / max(1, len(anchors))
+
+
+def measure_recall(
+    retriever: FaissRetriever,
+    vectors: np.ndarray,
+    sources: Sequence[Sequence[str]],
+    top_k: int,
+    top_docs: Optional[int],
+) -> Dict[str, float]:
+    """recall@k und hit@k der QA-Fragen (Quell-Chunks per chunk_id oder chunk_uid)."""
+    t0 = time.perf_counter()
+    results = retriever.get_neighbors_for_vectors(vectors, top_k=top_k, top_docs=top_docs)
+    search_s = time.perf_counter() - t0
+    recall = 0.0
+    hits = 0
+    for hits_row, wanted in zip(results, sources):
+        found = {str(h.get("chunk_id")) for h in hits_row} | {str(h.get("chunk_uid")) for h in hits_row}
+        matched = sum(1 for cid in set(wanted) if cid in found)
+        recall += matched / len(set(wanted))
+        hits += matched > 0
+    n = max(1, len(sources))
+    return {
+        "recall_at_k": recall / n,
+        "hit_at_k": hits / n,
+        "question_ms": search_s * 1000.0 / n,
+    }
+
+
+def load_previous(history_path: Path, run: Dict[str, Any]) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    """Ergebnisse des letzten Laufs mit denselben Parametern: (Variante, Threads) -> Zeile."""
+    if not history_path.is_file():
+        return {}
+    previous: Optional[Dict[str, Any]] = None
+    with history_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if all(rec.get(key) == run.get(key) for key in COMPARE_KEYS):
+                previous = rec
+    if previous is None:
+        return {}
+    return {(r["variant"], int(r["threads"])): r for r in previous.get("results", [])}
+
+
+def _delta(row: Dict[str, Any], prev: Optional[Dict[str, Any]], key: str) -> str:
+    if not prev or prev.get(key) in (None, 0) or row.get(key) is None:
+        return "-"
+    return f"{(row[key] / prev[key] - 1.0) * 100.0:+.0f}%"
+
+
+def _kb(value: Optional[float]) -> str:
+    return f"{value / 1024.0:.1f}" if value is not None else "-"
+
+
+def format_table(rows: List[Dict[str, Any]], previous: Dict[Tuple[str, int], Dict[str, Any]], top_k: int) -> str:
+    header = (
+        f"{'Variante':<18} {'Thr':>3} {'p50 ms':>8} {'p99 ms':>8} {'q/s':>9} {'Δp50':>6} {'Δq/s':>6} "
+        f"{f'ovl@{top_k}':>8} {f'rec@{top_k}':>8} {f'hit@{top_k}':>8} {'Δrec':>7} {'KB/q':>7} {'Dict':>7}"
+    )
+    lines = [header, "-" * len(header)]
+
+    def num(value: Optional[float], fmt: str) -> str:
+        return format(value, fmt) if value is not None else "-"
+
+    for r in rows:
+        prev = previous.get((r["variant"], int(r["threads"])))
+        d_rec = "-"
+        if prev and prev.get("recall_at_k") is not None and r.get("recall_at_k") is not None:
+            d_rec = f"{r['recall_at_k'] - prev['recall_at_k']:+.3f}"
+        lines.append(
+            f"{r['variant']:<18} {r['threads']:>3} {r['single_ms_p50']:>8.3f} {r['single_ms_p99']:>8.3f} "
+            f"{r['queries_per_s']:>9.0f} {_delta(r, prev, 'single_ms_p50'):>6} {_delta(r, prev, 'queries_per_s'):>6} "
+            f"{num(r.get('overlap_at_k'), '8.3f'):>8} {num(r.get('recall_at_k'), '8.3f'):>8} "
+            f"{num(r.get('hit_at_k'), '8.3f'):>8} {d_rec:>7} {_kb(r.get('alloc_bytes_per_query')):>7} "
+            f"{_kb(r.get('alloc_dict_bytes_per_query')):>7}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Nachbarsuche benchmarken: Latenz, Durchsatz, overlap@k und recall@k (QA als Ground Truth)."
+    )
+    parser.add_argument("--workspace-root", required=True, help="Workspace-Root mit indices/faiss.")
+    parser.add_argument(
+        "--variants", default=DEFAULT_VARIANTS, help=f"Kommagetrennte Varianten (Default: {DEFAULT_VARIANTS})."
+    )
+    parser.add_argument(
+        "--threads", default=DEFAULT_THREADS, help=f"Kommagetrennte OpenMP-Thread-Zahlen (Default: {DEFAULT_THREADS})."
+    )
+    parser.add_argument("--num-anchors", type=int, default=2000, help="Anzahl Anker-Chunks (Stichprobe).")
+    parser.add_argument("--single-queries", type=int, default=300, help="Anzahl Einzelanfragen für p50/p99.")
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="Anker pro Block-Anfrage (wie neighbors.faiss_prefetch_block)."
+    )
+    parser.add_argument("--top-k", type=int, default=16, help="k für Suche, overlap@k und recall@k (top_k_faiss).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed für Anker- und Fragen-Stichprobe.")
+    parser.add_argument(
+        "--qa-source",
+        choices=("auto", "final", "candidates", "none"),
+        default="auto",
+        help="Ground Truth für recall@k: qa_final, qa_candidates (auto: qa_final, falls vorhanden) oder keine.",
+    )
+    parser.add_argument("--qa-dir", default=None, help="Verzeichnis mit QA-JSONL (überschreibt --qa-source).")
+    parser.add_argument("--num-questions", type=int, default=1000, help="Anzahl QA-Fragen (Stichprobe).")
+    parser.add_argument("--device", default="cpu", help="Gerät für das Anfrage-Modell (recall@k).")
+    parser.add_argument("--no-knn-graph", action="store_true", help="'current' ohne vorberechneten kNN-Graphen.")
+    parser.add_argument(
+        "--embedding-config",
+        default=DEFAULT_EMBEDDING_CONFIG,
+        help="Embedding-Config mit index_params als Basis der Index-Varianten.",
+    )
+    parser.add_argument("--label", default=None, help="Freitext zum Lauf (z.B. Version/Änderung) für den Verlauf.")
+    parser.add_argument(
+        "--history",
+        default=None,
+        help=f"Verlaufsdatei (JSONL, Default: <workspace_root>/logs/benchmarks/{HISTORY_NAME}).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
+
+    workspace_root = Path(args.workspace_root).resolve()
+    threads = [int(t) for t in args.threads.split(",") if t.strip()]
+    top_k = int(args.top_k)
+    retriever = FaissRetriever(str(workspace_root), use_knn_graph=not args.no_knn_graph, query_device=args.device)
+    indices_root = Path(retriever.indices_root)
+    ntotal = int(retriever.index.ntotal)
+
+    rng = np.random.default_rng(args.seed)
+    rows = np.sort(rng.choice(ntotal, size=min(int(args.num_anchors), ntotal), replace=False))
+    anchors: List[str] = []
+    for row in rows:
+        rec = retriever.meta[int(row)]
+        key = rec.get("chunk_uid") or rec.get("chunk_id")
+        if key:
+            anchors.append(str(key))
+    logger.info("Korpus: %d Vektoren, %d Anker, k=%d", ntotal, len(anchors), top_k)
+
+    # Ground Truth: QA-Fragen einmal kodieren (Modell wie beim Index-Build)
+    questions: List[Tuple[str, List[str]]] = []
+    question_vectors: Optional[np.ndarray] = None
+    qa_dir = resolve_qa_dir(workspace_root, args.qa_source, args.qa_dir) if args.qa_source != "none" else None
+    if qa_dir is not None:
+        questions = load_qa_pairs(qa_dir, int(args.num_questions), args.seed)
+        if questions:
+            try:
+                question_vectors = retriever.encode_queries([q for q, _ in questions])
+                logger.info("%d QA-Fragen aus %s als Ground Truth.", len(questions), qa_dir)
+            except (RuntimeError, ValueError, OSError) as exc:
+                logger.error("QA-Fragen konnten nicht kodiert werden – kein recall@k: %s", exc)
+                questions = []
+    elif args.qa_source != "none":
+        logger.warning("Keine QA-Dateien gefunden – kein recall@k.")
+
+    vectors = None
+    config: Dict[str, Any] = retriever.config
+    base_params = dict(DEFAULT_INDEX_PARAMS)
+    emb_cfg = load_embedding_config(args.embedding_config)
+    base_params.update({k: v for k, v in (emb_cfg.get("index_params") or {}).items() if k in base_params})
+    use_ip = retriever.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+    def exact_vectors() -> np.ndarray:
+        nonlocal vectors, config
+        if vectors is None:
+            vectors, config = load_vectors(indices_root)
+        return vectors
+
+    # Baseline für overlap@k: exakter Flat-Index
+    try:
+        flat = with_index(retriever, build_faiss_index(exact_vectors(), use_inner_product=use_ip, logger=logger))
+        base_ids: Optional[List[List[int]]] = neighbor_ids(flat, anchors, top_k, None)
+    except (OSError, KeyError, ValueError) as exc:
+        logger.error("Keine Flat-Baseline (Embedding-Store fehlt?) – kein overlap@k: %s", exc)
+        flat, base_ids = None, None
+
+    results: List[Dict[str, Any]] = []
+    for spec in [v.strip() for v in args.variants.split(",") if v.strip()]:
+        top_docs: Optional[int] = None
+        params: Optional[Dict[str, Any]] = None
+        try:
+            if spec == "current":
+                variant = retriever
+                params = config.get("index_params")
+            elif spec == "flat":
+                if flat is None:
+                    raise ValueError("keine Flat-Baseline")
+                variant = flat
+            elif spec.startswith("hier") and spec[4:].isdigit():
+                if retriever.doc_index is None:
+                    raise ValueError("kein Dokument-Index (scripts/doc_index.py)")
+                variant = with_index(retriever, retriever.index)
+                top_docs = int(spec[4:])
+                params = {"top_docs": top_docs}
+            else:
+                params = parse_variant(spec, base_params)
+                index = build_faiss_index(exact_vectors(), use_inner_product=use_ip, logger=logger, params=params)
+                variant = with_index(retriever, index)
+        except (RuntimeError, ValueError, OSError) as exc:
+            logger.error("Variante '%s' übersprungen: %s", spec, exc)
+            continue
+
+        index_type = type(faiss.downcast_index(variant.index)).__name__
+        if variant.knn_graph is not None:
+            index_type = f"KnnGraph(k={variant.knn_graph.k})+{index_type}"
+        quality: Dict[str, Any] = {"overlap_at_k": None, "recall_at_k": None, "hit_at_k": None, "question_ms": None}
+        if base_ids is not None:
+            quality["overlap_at_k"] = overlap_at_k(neighbor_ids(variant, anchors, top_k, top_docs), base_ids, top_k)
+        if questions and question_vectors is not None:
+            quality.update(measure_recall(variant, question_vectors, [s for _, s in questions], top_k, top_docs))
+        alloc = measure_alloc(variant, anchors[: args.batch_size], top_k, top_docs)
+        alloc_dicts = measure_alloc(variant, anchors[: args.batch_size], top_k, top_docs, as_dicts=True)
+
+        for num_threads in threads:
+            stats = measure_workload(
+                variant, anchors, top_k, args.batch_size, args.single_queries, num_threads, top_docs
+            )
+            results.append(
+                {
+                    "variant": spec,
+                    "threads": num_threads,
+                    "index_type": index_type,
+                    "params": params,
+                    **stats,
+                    **quality,
+                    "alloc_bytes_per_query": alloc,
+                    "alloc_dict_bytes_per_query": alloc_dicts,
+                }
+            )
+            logger.info(
+                "Variante '%s' (%d Threads): p50 %.3f ms, %.0f q/s, recall@%d %s",
+                spec,
+                num_threads,
+                stats["single_ms_p50"],
+                stats["queries_per_s"],
+                top_k,
+                f"{quality['recall_at_k']:.3f}" if quality["recall_at_k"] is not None else "-",
+            )
+
+    run: Dict[str, Any] = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "label": args.label,
+        "git_commit": git_commit(DEFAULT_REPO_ROOT),
+        "workspace_root": str(workspace_root),
+        "indices_generation": retriever.load_stats.get("generation") or indices_root.name,
+        "num_vectors": ntotal,
+        "metric": config.get("metric"),
+        "top_k": top_k,
+        "num_anchors": len(anchors),
+        "batch_size": int(args.batch_size),
+        "seed": int(args.seed),
+        "num_questions": len(questions),
+        "qa_dir": str(qa_dir) if qa_dir is not None else None,
+        "results": results,
+    }
+    history_path = (
+        Path(args.history) if args.history else workspace_root / "logs" / "benchmarks" / HISTORY_NAME
+    )
+    previous = load_previous(history_path, run)
+    print(format_table(results, previous, top_k))
+
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with history_path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(run, ensure_ascii=False) + "\n")
+    logger.info("Lauf an Verlauf angehängt: %s", history_path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+benchmark_retrieval.py
+
+Vergleicht FAISS-Indexvarianten auf dem eigenen Korpus gegen die exakte
+float32-Flat-Baseline (IndexFlatIP/L2, wie bisher von embed_chunks.py gebaut).
+
+Gemessen pro Variante:
+- Speicher: Größe des serialisierten Index (≈ RAM pro QA-Array-Task), Bytes/Vektor
+- Build-Zeit (inkl. Training)
+- Latenz: Batch-Suche (ms/Anfrage) und Einzelanfragen (p50/p95)
+- overlap@k: mittlerer Anteil der Baseline-Top-k, den die Variante ebenfalls findet
+
+Eingabe sind die exakten Vektoren aus dem Embedding-Store von embed_chunks.py
+(indices/faiss/embedding_store.f32); als Anfragen dienen zufällig gezogene
+Chunks des Korpus – wie bei der Nachbarsuche in generate_qa_candidates.py.
+
+Varianten (--variants, kommagetrennt), Bausteine mit ":" verbunden:
+  <index_type>[:float32|fp16|sq8][:pca<D>|opq<D>]
+  z.B. flat:fp16, flat:sq8, flat:sq8:pca256, hnsw:sq8, ivf_pq:opq256
+  "current" misst den aktuell gebauten Index (contextual.index).
+  "hier<D>" misst die zweistufige Suche von FaissRetriever über den
+  Dokument-Index (scripts/doc_index.py): erst die D besten Dokumente, dann
+  deren Chunks; MB = Größe der Zentroide, Build s = 0 (baut embed_chunks.py).
+
+Beispiel:
+  python scripts/benchmark_retrieval.py \
+      --workspace-root /beegfs/scratch/workspace/es_phdoeble-rag_pipeline \
+      --variants flat:fp16,flat:sq8,flat:sq8:pca256,current \
+      --num-queries 2000 --top-k 10
+
+Ergebnis: Tabelle auf stdout und JSON unter <workspace_root>/logs/benchmarks/.
+
+Nachbarsuche über FaissRetriever (Latenz p50/p99, Durchsatz je Thread-Zahl,
+recall@k mit QA-Paaren als Ground Truth, Verlauf): scripts/benchmark_neighbors.py.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.embed_chunks import (  # type: ignore
+    DEFAULT_EMBEDDING_CONFIG,
+    DEFAULT_INDEX_PARAMS,
+    INDEX_TYPES,
+    STORAGE_TYPES,
+    apply_search_params,
+    build_faiss_index,
+    faiss,
+    load_embedding_config,
+    normalize_index_type,
+)
+from scripts.faiss_retriever import FaissRetriever  # type: ignore
+from scripts.index_generations import resolve_index_dir  # type: ignore
+
+logger = logging.getLogger("benchmark_retrieval")
+
+DEFAULT_VARIANTS = "flat:fp16,flat:sq8,flat:sq8:pca256,current"
+
+
+def parse_variant(spec: str, base_params: Dict[str, Any]) -> Dict[str, Any]:
+    """Übersetzt eine Variante wie "flat:sq8:pca256" in index_params für embed_chunks."""
+    params = dict(base_params)
+    params.update({"index_type": "flat", "storage": "float32", "reduce": None, "reduce_dim": None})
+    for token in spec.strip().lower().split(":"):
+        if not token:
+            continue
+        if token in INDEX_TYPES or token.startswith("faiss_"):
+            params["index_type"] = normalize_index_type(token)
+        elif token in STORAGE_TYPES:
+            params["storage"] = token
+        elif token[:3] in ("pca", "opq") and token[3:].isdigit():
+            params["reduce"] = token[:3]
+            params["reduce_dim"] = int(token[3:])
+        else:
+            raise ValueError(f"Unbekannter Baustein '{token}' in Variante '{spec}'.")
+    return params
+
+
+def load_vectors(indices_root: Path) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Exakte Vektoren (np.memmap) und contextual_config.json."""
+    config_path = indices_root / "contextual_config.json"
+    with config_path.open("r", encoding="utf-8") as f:
+        config = json.load(f)
+    vec_path = indices_root / "embedding_store.f32"
+    if not vec_path.is_file() and config.get("vectors_path"):
+        vec_path = Path(config["vectors_path"])
+    num_vectors = int(config["num_vectors"])
+    dim = int(config["embedding_dim"])
+    if not vec_path.is_file() or vec_path.stat().st_size != num_vectors * dim * 4:
+        raise FileNotFoundError(
+            f"Vektordatei fehlt oder passt nicht zu {config_path}: {vec_path} "
+            "(embed_chunks.py einmal neu laufen lassen)."
+        )
+    vectors = np.memmap(vec_path, dtype="float32", mode="r", shape=(num_vectors, dim))
+    return vectors, config
+
+
+def index_nbytes(index: "faiss.Index") -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def measure(
+    index: Any,
+    queries: np.ndarray,
+    top_k: int,
+    single_queries: int,
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Batch-Suche über alle Anfragen plus Einzelanfragen für die Latenzverteilung.
+    index: FAISS-Index oder eine Suchfunktion (queries, k) -> (D, I).
+    """
+    search = index.search if hasattr(index, "search") else index
+    t0 = time.perf_counter()
+    _, ids = search(queries, top_k)
+    batch_s = time.perf_counter() - t0
+
+    lat: List[float] = []
+    for i in range(min(single_queries, queries.shape[0])):
+        t = time.perf_counter()
+        search(queries[i:i + 1], top_k)
+        lat.append((time.perf_counter() - t) * 1000.0)
+
+    stats = {
+        "batch_ms_per_query": batch_s * 1000.0 / max(1, queries.shape[0]),
+        "single_ms_p50": float(np.percentile(lat, 50)) if lat else 0.0,
+        "single_ms_p95": float(np.percentile(lat, 95)) if lat else 0.0,
+    }
+    return ids, stats
+
+
+def overlap_at_k(ids: np.ndarray, base_ids: np.ndarray) -> float:
+    k = base_ids.shape[1]
+    hits = 0
+    for row, base_row in zip(ids, base_ids):
+        hits += len(set(int(x) for x in row if x >= 0) & set(int(x) for x in base_row if x >= 0))
+    return hits / float(k * base_ids.shape[0])
+
+
+def format_table(rows: List[Dict[str, Any]], top_k: int) -> str:
+    header = (
+        f"{'Variante':<22} {'Typ':<22} {'MB':>9} {'B/Vek':>7} {'Build s':>8} "
+        f"{'ms/q':>7} {'p50 ms':>7} {'p95 ms':>7} {f'ovl@{top_k}':>8}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(
+            f"{r['variant']:<22} {r['index_type']:<22} {r['index_mb']:>9.2f} {r['bytes_per_vector']:>7.0f} "
+            f"{r['build_s']:>8.1f} {r['batch_ms_per_query']:>7.3f} {r['single_ms_p50']:>7.3f} "
+            f"{r['single_ms_p95']:>7.3f} {r['overlap_at_k']:>8.3f}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="FAISS-Indexvarianten (fp16/SQ8/PCA/OPQ/IVF/HNSW) gegen die float32-Flat-Baseline messen."
+    )
+    parser.add_argument("--workspace-root", required=True, help="Workspace-Root mit indices/faiss.")
+    parser.add_argument(
+        "--variants",
+        default=DEFAULT_VARIANTS,
+        help=f"Kommagetrennte Varianten (Default: {DEFAULT_VARIANTS}).",
+    )
+    parser.add_argument("--num-queries", type=int, default=1000, help="Anzahl Anfrage-Chunks (Stichprobe).")
+    parser.add_argument("--single-queries", type=int, default=200, help="Anzahl Einzelanfragen für p50/p95.")
+    parser.add_argument("--top-k", type=int, default=10, help="k für Suche und overlap@k.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed für die Anfrage-Stichprobe.")
+    parser.add_argument("--threads", type=int, default=None, help="FAISS-OpenMP-Threads (Default: FAISS-Default).")
+    parser.add_argument(
+        "--embedding-config",
+        default=DEFAULT_EMBEDDING_CONFIG,
+        help="Embedding-Config mit index_params (nlist, pq_m, nprobe, ...) als Basis der Varianten.",
+    )
+    parser.add_argument("--output-json", default=None, help="Ergebnis-JSON (Default: logs/benchmarks/...).")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
+
+    workspace_root = Path(args.workspace_root).resolve()
+    indices_root = Path(resolve_index_dir(str(workspace_root / "indices" / "faiss")))
+    if args.threads:
+        faiss.omp_set_num_threads(int(args.threads))
+
+    try:
+        vectors, config = load_vectors(indices_root)
+    except (OSError, KeyError, ValueError) as exc:
+        logger.error("%s", exc)
+        return 1
+    num_vectors, dim = vectors.shape
+    use_ip = config.get("metric", "IP") == "IP"
+    logger.info("Korpus: %d Vektoren, dim=%d, Metrik=%s", num_vectors, dim, config.get("metric"))
+
+    base_params = dict(DEFAULT_INDEX_PARAMS)
+    emb_cfg = load_embedding_config(args.embedding_config)
+    base_params.update({k: v for k, v in (emb_cfg.get("index_params") or {}).items() if k in base_params})
+
+    rng = np.random.default_rng(args.seed)
+    n_queries = min(int(args.num_queries), num_vectors)
+    rows = np.sort(rng.choice(num_vectors, size=n_queries, replace=False))
+    queries = np.ascontiguousarray(vectors[rows], dtype="float32")
+    top_k = min(int(args.top_k), num_vectors)
+
+    t0 = time.perf_counter()
+    baseline = build_faiss_index(vectors, use_inner_product=use_ip, logger=logger)
+    build_s = time.perf_counter() - t0
+    base_ids, base_stats = measure(baseline, queries, top_k, args.single_queries)
+    base_bytes = index_nbytes(baseline)
+
+    results: List[Dict[str, Any]] = [
+        {
+            "variant": "baseline",
+            "index_type": type(baseline).__name__,
+            "params": None,
+            "index_mb": base_bytes / 1e6,
+            "bytes_per_vector": base_bytes / num_vectors,
+            "build_s": build_s,
+            **base_stats,
+            "overlap_at_k": 1.0,
+        }
+    ]
+    del baseline
+    retriever: Optional[FaissRetriever] = None
+
+    for spec in [v.strip() for v in args.variants.split(",") if v.strip()]:
+        params: Optional[Dict[str, Any]] = None
+        if spec.startswith("hier") and spec[4:].isdigit():
+            if retriever is None:
+                retriever = FaissRetriever(str(workspace_root), indices_root=str(indices_root))
+            if retriever.doc_index is None:
+                logger.error("Variante '%s' übersprungen: kein Dokument-Index (scripts/doc_index.py).", spec)
+                continue
+            top_docs = int(spec[4:])
+            ids, stats = measure(
+                lambda q, k: retriever.search_hierarchical(q, k, top_docs), queries, top_k, args.single_queries
+            )
+            nbytes = int(retriever.doc_index.centroids.nbytes)
+            results.append(
+                {
+                    "variant": spec,
+                    "index_type": f"DocIndex+{type(faiss.downcast_index(retriever.index)).__name__}",
+                    "params": {"top_docs": top_docs, "num_docs": retriever.doc_index.num_docs},
+                    "index_mb": nbytes / 1e6,
+                    "bytes_per_vector": nbytes / num_vectors,
+                    "build_s": 0.0,
+                    **stats,
+                    "overlap_at_k": overlap_at_k(ids, base_ids),
+                }
+            )
+            logger.info("Variante '%s': overlap@%d = %.3f", spec, top_k, results[-1]["overlap_at_k"])
+            continue
+        try:
+            if spec == "current":
+                index = faiss.read_index(str(indices_root / "contextual.index"))
+                apply_search_params(index, config.get("index_params") or {})
+                params = config.get("index_params")
+                build_s = 0.0
+            else:
+                params = parse_variant(spec, base_params)
+                t0 = time.perf_counter()
+                index = build_faiss_index(vectors, use_inner_product=use_ip, logger=logger, params=params)
+                build_s = time.perf_counter() - t0
+        except (RuntimeError, ValueError, OSError) as exc:
+            logger.error("Variante '%s' übersprungen: %s", spec, exc)
+            continue
+
+        ids, stats = measure(index, queries, top_k, args.single_queries)
+        nbytes = index_nbytes(index)
+        results.append(
+            {
+                "variant": spec,
+                "index_type": type(faiss.downcast_index(index)).__name__,
+                "params": params,
+                "index_mb": nbytes / 1e6,
+                "bytes_per_vector": nbytes / num_vectors,
+                "build_s": build_s,
+                **stats,
+                "overlap_at_k": overlap_at_k(ids, base_ids),
+            }
+        )
+        logger.info("Variante '%s': overlap@%d = %.3f", spec, top_k, results[-1]["overlap_at_k"])
+        del index
+
+    print(format_table(results, top_k))
+
+    if args.output_json:
+        out_path = Path(args.output_json)
+    else:
+        ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out_path = workspace_root / "logs" / "benchmarks" / f"benchmark_retrieval_{ts}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "workspace_root": str(workspace_root),
+                "num_vectors": int(num_vectors),
+                "embedding_dim": int(dim),
+                "metric": config.get("metric"),
+                "num_queries": int(n_queries),
+                "top_k": int(top_k),
+                "results": results,
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    logger.info("Ergebnis geschrieben: %s", out_path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
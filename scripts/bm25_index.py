@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+bm25_index.py
+
+Kompakter invertierter Index (BM25) neben dem FAISS-Index, Schlüssel faiss_id.
+
+Problem:
+- Exakte technische Bezeichner (GT-Power-Templatenamen, Symbole wie T_∞,
+  Parameter-Keys) trifft all-mpnet-base-v2 schlecht; die passenden Chunks
+  fehlen dann in den QA-Kontexten.
+
+Aufbau (in der Generation unter bm25/, alle Arrays als .npy, gemappt):
+- header.json:        Version, num_docs, avgdl, k1, b, Tokenizer-Version
+- terms.json:         Terme, Position = term_id
+- postings_offsets:   int64 (num_terms + 1), CSR über die Postings
+- postings_docs:      int32 faiss_ids je Term (aufsteigend)
+- postings_weights:   float32, fertiges BM25-Gewicht idf * tf-Sättigung pro
+                      (Term, Chunk) – eine Anfrage ist damit nur noch eine Summe
+- doc_len:            int32 Tokens pro faiss_id (0 = kein Text gefunden)
+Text = title + content wie beim Embedding (build_text_from_chunk in embed_chunks.py).
+
+Tokenisierung: zusammengesetzte Bezeichner bleiben als Ganzes erhalten
+(t_∞, pipe.round, eng-cylinder) und werden zusätzlich in Teile zerlegt
+(auch CamelCase: PipeRound -> piperound, pipe, round); casefold, keine
+Stammformreduktion (de/en gemischt).
+
+Anfrage: seltene Terme zuerst; überschreitet die Bewertung das Zeitbudget
+(budget_ms), werden die restlichen, häufigsten Terme ausgelassen.
+FaissRetriever.search_hybrid() fusioniert die Ränge mit der Dense-Suche (RRF).
+
+CLI (für die aktuelle Generation nachbauen; embed_chunks.py baut ihn sonst mit):
+
+  python scripts/bm25_index.py --workspace-root <ws> [--parse-workers 8]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from array import array
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.index_generations import refresh_manifest, resolve_index_dir  # type: ignore
+
+logger = logging.getLogger("bm25_index")
+
+BM25_SUBDIR = "bm25"
+BM25_VERSION = 1
+TOKENIZER_VERSION = 1
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+DEFAULT_BUDGET_MS = 50.0
+
+# Wortzeichen plus Symbole, die in Formelnamen vorkommen (T_∞, ∂p/∂x)
+_WORD = r"[\w∞∂∇°µΩ]"
+_TOKEN_RE = re.compile(rf"{_WORD}+(?:[._\-/:]{_WORD}+)*")
+_PART_SPLIT_RE = re.compile(r"[._\-/:]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens für Index und Anfrage (Bezeichner ganz + Teile, casefold)."""
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(text):
+        word = match.group(0)
+        tokens.append(word.casefold())
+        parts = [p for p in _PART_SPLIT_RE.split(word) if p]
+        if parts != [word]:
+            tokens.extend(p.casefold() for p in parts)
+        for part in parts:
+            if not part.islower() and not part.isupper():
+                camel = _CAMEL_RE.findall(part)
+                if len(camel) > 1:
+                    tokens.extend(c.casefold() for c in camel)
+    return tokens
+
+
+def bm25_dir(indices_dir: str) -> str:
+    return os.path.join(indices_dir, BM25_SUBDIR)
+
+
+class BM25Writer:
+    """Sammelt Postings pro Chunk und schreibt den Index (tmp-Verzeichnis + os.replace)."""
+
+    def __init__(self, out_dir: str, num_docs: int, k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> None:
+        self.out_dir = out_dir
+        self.num_docs = int(num_docs)
+        self.k1 = float(k1)
+        self.b = float(b)
+        self._vocab: Dict[str, int] = {}
+        self._terms = array("i")
+        self._docs = array("i")
+        self._tfs = array("i")
+        self.doc_len = np.zeros(self.num_docs, dtype=np.int32)
+
+    def add(self, faiss_id: int, text: str) -> None:
+        counts = Counter(tokenize(text))
+        self.doc_len[faiss_id] = sum(counts.values())
+        vocab = self._vocab
+        for term, tf in counts.items():
+            tid = vocab.get(term)
+            if tid is None:
+                tid = vocab[term] = len(vocab)
+            self._terms.append(tid)
+            self._docs.append(faiss_id)
+            self._tfs.append(tf)
+
+    def commit(self, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        terms = np.frombuffer(self._terms, dtype=np.int32)
+        docs = np.frombuffer(self._docs, dtype=np.int32)
+        tfs = np.frombuffer(self._tfs, dtype=np.int32).astype(np.float32)
+        num_terms = len(self._vocab)
+
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        counts = np.bincount(terms, minlength=num_terms)
+        offsets = np.zeros(num_terms + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        df = counts.astype(np.float64)
+
+        indexed = int(np.count_nonzero(self.doc_len))
+        avgdl = float(self.doc_len.sum()) / max(1, indexed)
+        # Lucene-Variante: idf >= 0 auch für sehr häufige Terme
+        idf = np.log1p((indexed - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[docs] / max(avgdl, 1e-9))
+        weights = (idf[terms] * tfs * (self.k1 + 1.0) / (tfs + norm)).astype(np.float32)
+
+        tmp_dir = f"{self.out_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "postings_offsets.npy"), offsets)
+        np.save(os.path.join(tmp_dir, "postings_docs.npy"), docs)
+        np.save(os.path.join(tmp_dir, "postings_weights.npy"), weights)
+        np.save(os.path.join(tmp_dir, "doc_len.npy"), self.doc_len)
+        with open(os.path.join(tmp_dir, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(list(self._vocab), f, ensure_ascii=False)
+        header = {
+            "version": BM25_VERSION,
+            "tokenizer": TOKENIZER_VERSION,
+            "num_docs": self.num_docs,
+            "indexed_docs": indexed,
+            "num_terms": num_terms,
+            "num_postings": int(len(docs)),
+            "avgdl": round(avgdl, 3),
+            "k1": self.k1,
+            "b": self.b,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            **(extra or {}),
+        }
+        with open(os.path.join(tmp_dir, "header.json"), "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False, indent=2)
+
+        old_dir = self.out_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.isdir(self.out_dir):
+            os.replace(self.out_dir, old_dir)
+        os.replace(tmp_dir, self.out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return header
+
+
+class BM25Index:
+    """Gemappter BM25-Index; das Term-Vokabular wird erst bei der ersten Anfrage geladen."""
+
+    def __init__(self, index_dir: str) -> None:
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "header.json"), "r", encoding="utf-8") as f:
+            self.header: Dict[str, Any] = json.load(f)
+        self.num_docs = int(self.header["num_docs"])
+        self.offsets = self._load("postings_offsets")
+        self.docs = self._load("postings_docs")
+        self.weights = self._load("postings_weights")
+        self._vocab: Optional[Dict[str, int]] = None
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.index_dir, name + ".npy"), mmap_mode="r")
+
+    @property
+    def vocab(self) -> Dict[str, int]:
+        if self._vocab is None:
+            t0 = time.time()
+            with open(os.path.join(self.index_dir, "terms.json"), "r", encoding="utf-8") as f:
+                self._vocab = {term: tid for tid, term in enumerate(json.load(f))}
+            logger.info("BM25-Vokabular geladen: %d Terme (%.1fs).", len(self._vocab), time.time() - t0)
+        return self._vocab
+
+    def search(
+        self,
+        text: str,
+        top_k: int,
+        budget_ms: float = DEFAULT_BUDGET_MS,
+        admits: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (faiss_ids, Scores) der top_k besten Chunks, absteigend. admits: optionale
+        Maske zulässiger faiss_ids (z.B. _CompiledFilter.admits). Terme werden
+        nach Seltenheit bewertet, bis budget_ms erreicht ist (mindestens einer).
+        """
+        vocab = self.vocab
+        tids = sorted({vocab[t] for t in tokenize(text) if t in vocab})
+        if not tids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        starts = np.asarray([self.offsets[t] for t in tids], dtype=np.int64)
+        ends = np.asarray([self.offsets[t + 1] for t in tids], dtype=np.int64)
+        order = np.argsort(ends - starts, kind="stable")
+
+        t0 = time.perf_counter()
+        deadline = t0 + max(0.0, budget_ms) / 1000.0
+        doc_parts: List[np.ndarray] = []
+        weight_parts: List[np.ndarray] = []
+        for n, pos in enumerate(order):
+            if n and time.perf_counter() > deadline:
+                logger.debug("BM25-Budget erschöpft: %d/%d Terme bewertet (%r).", n, len(order), text[:80])
+                break
+            doc_parts.append(np.asarray(self.docs[starts[pos] : ends[pos]]))
+            weight_parts.append(np.asarray(self.weights[starts[pos] : ends[pos]]))
+
+        docs = np.concatenate(doc_parts)
+        weights = np.concatenate(weight_parts)
+        if admits is not None:
+            keep = admits(docs)
+            docs, weights = docs[keep], weights[keep]
+        if not len(docs):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # Summe pro Chunk ohne dichtes Array über alle num_docs
+        uniq, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        k = min(int(top_k), len(uniq))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((uniq[top], -scores[top]))]
+        return uniq[top].astype(np.int64), scores[top]
+
+
+def load_bm25_index(indices_dir: str, ntotal: int) -> Optional[BM25Index]:
+    """Lädt den BM25-Index der Generation, falls vorhanden und passend; sonst None."""
+    index_dir = bm25_dir(indices_dir)
+    if not os.path.isfile(os.path.join(index_dir, "header.json")):
+        return None
+    index = BM25Index(index_dir)
+    header = index.header
+    if (
+        int(header.get("version", 0)) != BM25_VERSION
+        or int(header.get("tokenizer", 0)) != TOKENIZER_VERSION
+        or index.num_docs != int(ntotal)
+    ):
+        logger.warning("BM25-Index in %s passt nicht zum FAISS-Index – nur Dense-Suche.", index_dir)
+        return None
+    return index
+
+
+def build_bm25_index(
+    indices_dir: str,
+    records: Iterable[Tuple[str, Dict[str, Any]]],
+    lookup: Callable[[str], Optional[int]],
+    num_docs: int,
+    k1: float = DEFAULT_K1,
+    b: float = DEFAULT_B,
+) -> Dict[str, Any]:
+    """
+    Baut bm25/ aus (Text, Meta)-Paaren (wie iter_chunks in embed_chunks.py);
+    lookup: chunk_uid -> faiss_id (Chunks ohne faiss_id werden übersprungen).
+    """
+    t0 = time.time()
+    writer = BM25Writer(bm25_dir(indices_dir), num_docs, k1, b)
+    skipped = 0
+    for text, meta in records:
+        fid = lookup(str(meta.get("chunk_uid")))
+        if fid is None:
+            skipped += 1
+            continue
+        writer.add(fid, text)
+    header = writer.commit(extra={"build_seconds": round(time.time() - t0, 1)})
+    logger.info(
+        "BM25-Index geschrieben: %s (%d/%d Chunks, %d Terme, %d Postings, %.1fs)%s",
+        bm25_dir(indices_dir),
+        header["indexed_docs"],
+        num_docs,
+        header["num_terms"],
+        header["num_postings"],
+        header["build_seconds"],
+        f" – {skipped} Chunks ohne faiss_id übersprungen" if skipped else "",
+    )
+    return header
+
+
+def build_for_generation(
+    indices_dir: str,
+    normalized_root: str,
+    meta_name: str = "contextual_meta.jsonl",
+    exclude_unknown: bool = False,
+    parse_workers: int = 1,
+) -> Dict[str, Any]:
+    """Liest die Chunks erneut aus semantic/json und baut den BM25-Index der Generation."""
+    # embed_chunks importiert dieses Modul – daher hier lokal
+    from scripts.embed_chunks import iter_chunks  # type: ignore
+    from scripts.meta_store import MetaStore, store_dir_for  # type: ignore
+
+    store = MetaStore(store_dir_for(os.path.join(indices_dir, meta_name)))
+    return build_bm25_index(
+        indices_dir,
+        iter_chunks(normalized_root, logger, exclude_unknown=exclude_unknown, parse_workers=parse_workers),
+        store.lookup,
+        len(store),
+    )
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="BM25-Index für die aktuelle Index-Generation bauen.")
+    parser.add_argument("--workspace-root", required=True, help="Workspace-Root mit semantic/json und indices/faiss.")
+    parser.add_argument("--meta-name", default="contextual_meta.jsonl", help="Name der Meta-JSONL.")
+    parser.add_argument("--parse-workers", type=int, default=1, help="Prozesse zum Parsen der Eingabedateien.")
+    parser.add_argument(
+        "--exclude-unknown", action="store_true", help="Wie beim Index-Build: language=='unknown' auslassen."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
+    workspace_root = os.path.abspath(args.workspace_root)
+    index_dir = resolve_index_dir(os.path.join(workspace_root, "indices", "faiss"))
+    build_for_generation(
+        index_dir,
+        os.path.join(workspace_root, "semantic", "json"),
+        meta_name=args.meta_name,
+        exclude_unknown=args.exclude_unknown,
+        parse_workers=args.parse_workers,
+    )
+    refresh_manifest(index_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+doc_index.py
+
+Dokument-Index (Zentroide) für die zweistufige Nachbarsuche.
+
+Problem:
+- Die Nachbarsuche geht über alle Chunks des Korpus, obwohl die brauchbaren
+  Nachbarn meist aus wenigen verwandten Dokumenten stammen.
+
+Aufbau (in der Generation unter doc_index/, alle Arrays als .npy, gemappt):
+- header.json:   Version, num_docs, ntotal, dim, Anteil zusammenhängender Dokumente
+- doc_ids.json:  doc_id je Zeile
+- centroids:     float32 (num_docs, dim) – Mittel der L2-normalisierten
+                 Chunk-Embeddings je doc_id, wieder normalisiert
+- run_offsets:   int64 (num_docs + 1), CSR über runs
+- runs:          int64 (num_runs, 2) – faiss_id-Bereiche [start, end) je Dokument
+
+embed_chunks.py vergibt faiss_ids in Korpus-Reihenfolge, die Chunks eines
+Dokuments liegen also zusammenhängend (ein Bereich pro Dokument). Nur im
+inkrementellen Modus werden neue Chunks hinten angehängt; ein Dokument hat
+dann mehrere Bereiche.
+
+Suche (FaissRetriever, top_docs=D): Anfrage gegen die Zentroide (Kosinus),
+dann exakte Suche nur über die Chunk-Bereiche der D besten Dokumente.
+Recall/Latenz gegen die Flat-Suche: scripts/benchmark_retrieval.py --variants hier16,...
+
+CLI (für die aktuelle Generation nachbauen; embed_chunks.py baut ihn sonst mit):
+
+  python scripts/doc_index.py --workspace-root <ws>
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.index_generations import refresh_manifest, resolve_index_dir  # type: ignore
+
+logger = logging.getLogger("doc_index")
+
+DOC_INDEX_SUBDIR = "doc_index"
+DOC_INDEX_VERSION = 1
+DEFAULT_TOP_DOCS = 16
+BUILD_BLOCK_SIZE = 65536
+
+
+def doc_index_dir(indices_dir: str) -> str:
+    return os.path.join(indices_dir, DOC_INDEX_SUBDIR)
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+class DocIndex:
+    """Gemappter Dokument-Index: Zentroide plus faiss_id-Bereiche je Dokument."""
+
+    def __init__(self, index_dir: str) -> None:
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "header.json"), "r", encoding="utf-8") as f:
+            self.header: Dict[str, Any] = json.load(f)
+        self.num_docs = int(self.header["num_docs"])
+        self.ntotal = int(self.header["ntotal"])
+        self.centroids = self._load("centroids")
+        self.run_offsets = self._load("run_offsets")
+        self.runs = self._load("runs")
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.index_dir, name + ".npy"), mmap_mode="r")
+
+    def chunk_ids(self, docs: Sequence[int]) -> np.ndarray:
+        """Alle faiss_ids der Dokumente (Zeilen) docs, aufsteigend je Bereich."""
+        parts = [
+            np.arange(start, end, dtype=np.int64)
+            for d in docs
+            for start, end in self.runs[self.run_offsets[d] : self.run_offsets[d + 1]]
+        ]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+def load_doc_index(indices_dir: str, ntotal: int, dim: int) -> Optional[DocIndex]:
+    """Lädt den Dokument-Index der Generation, falls vorhanden und passend; sonst None."""
+    index_dir = doc_index_dir(indices_dir)
+    if not os.path.isfile(os.path.join(index_dir, "header.json")):
+        return None
+    index = DocIndex(index_dir)
+    if (
+        int(index.header.get("version", 0)) != DOC_INDEX_VERSION
+        or index.ntotal != int(ntotal)
+        or int(index.header.get("dim", 0)) != int(dim)
+    ):
+        logger.warning("Dokument-Index in %s passt nicht zum FAISS-Index – keine zweistufige Suche.", index_dir)
+        return None
+    return index
+
+
+def build_doc_index(indices_dir: str, vectors: np.ndarray, doc_ids: Sequence[Any]) -> Dict[str, Any]:
+    """
+    Baut doc_index/ aus den exakten Vektoren (Zeile = faiss_id, z.B. der
+    Embedding-Store) und der doc_id je faiss_id.
+    """
+    t0 = time.time()
+    ntotal, dim = int(vectors.shape[0]), int(vectors.shape[1])
+    if len(doc_ids) != ntotal:
+        raise ValueError(f"{len(doc_ids)} doc_ids für {ntotal} Vektoren.")
+    names: Dict[str, int] = {}
+    codes = np.fromiter((names.setdefault(str(d), len(names)) for d in doc_ids), dtype=np.int64, count=ntotal)
+    num_docs = len(names)
+
+    # Zentroide blockweise (der Store kann größer als der RAM sein)
+    sums = np.zeros((num_docs, dim), dtype=np.float64)
+    for start in range(0, ntotal, BUILD_BLOCK_SIZE):
+        block = _normalize_rows(np.asarray(vectors[start : start + BUILD_BLOCK_SIZE], dtype=np.float32))
+        block_codes = codes[start : start + BUILD_BLOCK_SIZE]
+        order = np.argsort(block_codes, kind="stable")
+        uniq, first = np.unique(block_codes[order], return_index=True)
+        sums[uniq] += np.add.reduceat(block[order], first, axis=0)
+    centroids = _normalize_rows(sums).astype(np.float32)
+
+    # Bereiche: neuer Bereich, wo die faiss_ids eines Dokuments nicht lückenlos sind
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    breaks = np.flatnonzero((np.diff(sorted_codes) != 0) | (np.diff(order) != 1)) + 1
+    run_starts = np.concatenate([[0], breaks])
+    run_ends = np.concatenate([breaks, [ntotal]])
+    runs = np.stack([order[run_starts], order[run_ends - 1] + 1], axis=1).astype(np.int64)
+    run_offsets = np.zeros(num_docs + 1, dtype=np.int64)
+    run_offsets[1:] = np.cumsum(np.bincount(sorted_codes[run_starts], minlength=num_docs))
+
+    out_dir = doc_index_dir(indices_dir)
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "centroids.npy"), centroids)
+    np.save(os.path.join(tmp_dir, "run_offsets.npy"), run_offsets)
+    np.save(os.path.join(tmp_dir, "runs.npy"), runs)
+    with open(os.path.join(tmp_dir, "doc_ids.json"), "w", encoding="utf-8") as f:
+        json.dump(list(names), f, ensure_ascii=False)
+    header = {
+        "version": DOC_INDEX_VERSION,
+        "num_docs": num_docs,
+        "ntotal": ntotal,
+        "dim": dim,
+        "num_runs": int(len(runs)),
+        "contiguous_docs": int(np.count_nonzero(np.diff(run_offsets) == 1)),
+        "build_seconds": round(time.time() - t0, 1),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(tmp_dir, "header.json"), "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False, indent=2)
+
+    old_dir = out_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(
+        "Dokument-Index geschrieben: %s (%d Dokumente, %d zusammenhängend, %.1fs)",
+        out_dir,
+        num_docs,
+        header["contiguous_docs"],
+        header["build_seconds"],
+    )
+    return header
+
+
+def build_for_generation(
+    indices_dir: str,
+    meta_name: str = "contextual_meta.jsonl",
+    config_name: str = "contextual_config.json",
+) -> Dict[str, Any]:
+    """Baut den Dokument-Index aus Embedding-Store und Meta-Store der Generation."""
+    from scripts.meta_store import MetaStore, store_dir_for  # type: ignore
+
+    with open(os.path.join(indices_dir, config_name), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    ntotal, dim = int(config["num_vectors"]), int(config["embedding_dim"])
+    vec_path = os.path.join(indices_dir, "embedding_store.f32")
+    if not os.path.isfile(vec_path) and config.get("vectors_path"):
+        vec_path = str(config["vectors_path"])
+    if not os.path.isfile(vec_path) or os.path.getsize(vec_path) != ntotal * dim * 4:
+        raise FileNotFoundError(f"Vektordatei fehlt oder passt nicht zu {config_name}: {vec_path}")
+    vectors = np.memmap(vec_path, dtype="float32", mode="r", shape=(ntotal, dim))
+    store = MetaStore(store_dir_for(os.path.join(indices_dir, meta_name)))
+    doc_ids = [store[i].get("doc_id") for i in range(len(store))]
+    return build_doc_index(indices_dir, vectors, doc_ids)
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Dokument-Index (Zentroide) für die aktuelle Generation bauen.")
+    parser.add_argument("--workspace-root", required=True, help="Workspace-Root mit indices/faiss.")
+    parser.add_argument("--meta-name", default="contextual_meta.jsonl", help="Name der Meta-JSONL.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
+    index_dir = resolve_index_dir(os.path.join(os.path.abspath(args.workspace_root), "indices", "faiss"))
+    build_for_generation(index_dir, meta_name=args.meta_name)
+    refresh_manifest(index_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
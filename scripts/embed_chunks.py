@@ -22,18 +22,111 @@ Beispiel:
       --batch-size 64 \
       --device cuda \
       --normalize
+
+Inkrementeller Modus (--incremental):
+- Neben dem Index liegt ein Embedding-Store (indices/faiss/embedding_store.*),
+  Schlüssel: (chunk_uid, SHA1 des Embedding-Texts) pro Zeile, model_name und
+  normalize für den ganzen Store.
+- Nur neue oder geänderte Chunks werden neu encodiert, gelöschte Chunks fallen
+  heraus. Bestehende Chunks behalten ihre Reihenfolge aus dem alten Index, neue
+  werden angehängt (faiss_ids bleiben stabil, solange nichts davor gelöscht wurde).
+- Der Store wird bei jedem Lauf (auch ohne --incremental) neu geschrieben, damit
+  der nächste inkrementelle Lauf darauf aufsetzen kann.
+
+Streaming-Modus (--streaming):
+- Chunks werden in Blöcken (--stream-batch-size) gelesen, encodiert und direkt
+  an Index, Embedding-Store (rohes float32, per np.memmap lesbar) und
+  Meta-JSONL angehängt; Spitzenverbrauch O(Block) plus der Index selbst.
+
+CPU-Pool (--device cpu --cpu-workers N):
+- Für Knoten ohne GPU: N Worker-Prozesse (spawn) laden je ein Modell mit fest
+  eingestellter Thread-Anzahl (--threads-per-worker, Default: CPUs / N).
+- Texte werden nach Länge sortiert und in Pakete (--cpu-chunk-size) ähnlicher
+  Länge aufgeteilt (weniger Padding), danach wieder in Originalreihenfolge gebracht.
+- Durchsatz (Sätze/s) wird geloggt und in contextual_config.json ("encode") abgelegt.
+  Beispiel für einen 64-Kern-Knoten: --device cpu --cpu-workers 16 --threads-per-worker 4
+
+Map/Reduce (--mode map|reduce, wie generate_qa_dataset.py):
+- map: jeder Array-Task (--shard-id, Default SLURM_ARRAY_TASK_ID) encodiert die
+  Chunks mit hash(chunk_uid) % num_shards == shard_id und schreibt sie nach
+  indices/faiss/_tmp_shards/shard_XXX.{f32,_meta.jsonl,json}. Das Manifest
+  (.json) wird zuletzt geschrieben; fertige Shards werden beim Neustart
+  übersprungen, fehlgeschlagene können einzeln neu laufen.
+- reduce: prüft, dass alle Shards vorhanden und konsistent sind (gleicher Korpus,
+  gleiches Modell), chunk_uids eindeutig und vollständig sind, vergibt die
+  faiss_ids in Korpus-Reihenfolge (identisch zum Einzellauf) und baut Index,
+  Meta, Embedding-Store und Config.
+  Beispiel: jobs/embed_chunks_map.slurm (Array) + jobs/embed_chunks_reduce.slurm
+
+Index-Typen (--index-type, Default aus config/embedding/embeddings.json):
+- flat:     IndexFlatIP/L2 (exakt, wie bisher)
+- ivf_flat: IVF mit nlist Listen, Training auf einer Stichprobe; nprobe zur Anfragezeit
+- ivf_pq:   IVF + Produktquantisierung (pq_m x pq_nbits)
+- hnsw:     HNSW-Graph (hnsw_m, efConstruction; efSearch zur Anfragezeit)
+Kompression der gespeicherten Vektoren (flat, ivf_flat, hnsw):
+- --storage float32 (Default) | fp16 (halber Speicher) | sq8 (ein Byte pro Dimension)
+- --reduce pca|opq --reduce-dim D: lineare Reduktion auf D Dimensionen vor dem Index
+  (OPQ ist vor allem zusammen mit ivf_pq sinnvoll); bei IP/--normalize folgt ein
+  L2norm, damit die Scores Kosinus-Ähnlichkeiten bleiben (PCA zentriert)
+Die Parameter landen unter "index_params" in contextual_config.json. Was die
+Varianten auf dem eigenen Korpus kosten, misst scripts/benchmark_retrieval.py.
+
+Index-Generationen (scripts/index_generations.py):
+- Jeder Lauf (außer --mode map) baut in indices/faiss/generations/<gen_id>/,
+  schreibt ein Manifest mit Checksummen und schaltet indices/faiss/CURRENT erst
+  danach atomar um; ein fehlgeschlagener Build wird verworfen. Alte
+  Generationen werden bis auf --keep-generations aufgeräumt.
+
+Metadaten: neben contextual_meta.jsonl wird immer der kompakte Meta-Store
+contextual_meta.store/ geschrieben (scripts/meta_store.py), den FaissRetriever
+gemappt und lazy liest.
+
+Lexikalischer Index: nach dem Build wird bm25/ (scripts/bm25_index.py) aus
+denselben Texten (title + content) gebaut; FaissRetriever.search_hybrid()
+kombiniert ihn mit der Dense-Suche. Abschalten mit --no-bm25.
+
+Dokument-Index: außerdem doc_index/ (scripts/doc_index.py) mit einem Zentroid
+je doc_id; FaissRetriever sucht damit zweistufig (top_docs). Die faiss_ids
+eines Dokuments liegen zusammenhängend. Abschalten mit --no-doc-index.
 """
 
 import argparse
+import atexit
+import hashlib
+import heapq
 import json
 import logging
 import os
+import shutil
 import sys
+import time
+from collections import deque
+import multiprocessing as mp
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, Generator, List, Tuple
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Generator, Iterator, List, Optional, Tuple
 
 import numpy as np
 
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.meta_store import build_from_jsonl, store_dir_for, write_meta_store  # type: ignore
+from scripts.bm25_index import build_for_generation as build_bm25_for_generation  # type: ignore
+from scripts.doc_index import build_for_generation as build_doc_index_for_generation  # type: ignore
+from scripts.index_generations import (  # type: ignore
+    DEFAULT_KEEP,
+    create_generation,
+    gc_generations,
+    publish_generation,
+    resolve_index_dir,
+    write_manifest,
+)
+
 try:
     import faiss  # type: ignore
 except ImportError as e:
@@ -41,6 +134,22 @@ except ImportError as e:
     print("Installiere z.B. mit: pip install faiss-cpu  oder  faiss-gpu", file=sys.stderr)
     raise e
 
+# Optional: schnellere JSON-Decoder (Fallback: json aus der Standardbibliothek)
+try:
+    import orjson  # type: ignore
+
+    _fast_loads = orjson.loads
+    JSON_CODEC = "orjson"
+except ImportError:
+    try:
+        import msgspec  # type: ignore
+
+        _fast_loads = msgspec.json.decode
+        JSON_CODEC = "msgspec"
+    except ImportError:
+        _fast_loads = None
+        JSON_CODEC = "json"
+
 try:
     from sentence_transformers import SentenceTransformer
 except ImportError as e:
@@ -84,6 +193,20 @@ def setup_logging(workspace_root: str) -> logging.Logger:
     return logger
 
 
+def _json_loads(data: str) -> Any:
+    """
+    JSON dekodieren, bevorzugt mit orjson/msgspec. Bei Eingaben, die der schnelle
+    Decoder ablehnt (z.B. NaN oder sehr große Ganzzahlen), greift json.loads –
+    das Ergebnis ist damit identisch zur Standardbibliothek.
+    """
+    if _fast_loads is not None:
+        try:
+            return _fast_loads(data)
+        except Exception:
+            pass
+    return json.loads(data)
+
+
 def iter_normalized_files(normalized_root: str, logger: logging.Logger) -> Generator[str, None, None]:
     """
     Liefert Pfade zu allen .json- und .jsonl-Dateien unter normalized_root,
@@ -168,211 +291,645 @@ def build_text_from_chunk(chunk: Dict[str, Any]) -> str:
     return content
 
 
+def chunk_to_record(
+    chunk: Dict[str, Any],
+    source_path: str,
+    exclude_unknown: bool,
+    logger: logging.Logger,
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Filtert einen Chunk (doc_id/chunk_id vorhanden, nicht strukturell, Sprache,
+    nicht leer) und liefert (Embedding-Text, Meta) oder None.
+    """
+    doc_id = chunk.get("doc_id")
+    c_id = chunk.get("chunk_id")
+    if not doc_id or not c_id:
+        logger.debug(
+            "Chunk ohne doc_id/chunk_id in %s – überspringe.",
+            source_path,
+        )
+        return None
+
+    semantic = chunk.get("semantic", {}) or {}
+
+    artifact_role = semantic.get("artifact_role") or []
+    if isinstance(artifact_role, str):
+        artifact_role = [artifact_role]
+    if "structural" in artifact_role:
+        return None
+
+    lang = semantic.get("language") or chunk.get("language")
+    if exclude_unknown and lang == "unknown":
+        return None
+
+    text = build_text_from_chunk(chunk)
+    if not text.strip():
+        return None
+
+    chunk_uid = f"{doc_id}::{c_id}"
+    orig_source_path = chunk.get("source_path")
+
+    meta: Dict[str, Any] = {
+        "doc_id": doc_id,
+        "chunk_id": c_id,
+        "chunk_uid": chunk_uid,
+        "source_path": orig_source_path or source_path,
+        "record_ref": source_path,
+        "source_type": chunk.get("source_type"),
+        "language": lang,
+        "meta": chunk.get("meta", {}),
+        "semantic": semantic,
+        "trust_level": semantic.get("trust_level"),
+        "content_type": semantic.get("content_type"),
+        "domain": semantic.get("domain"),
+    }
+    return text, meta
+
+
+def iter_file_chunks(
+    fpath: str,
+    logger: logging.Logger,
+    exclude_unknown: bool = False,
+) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+    """Liefert (Text, Meta) für alle verwertbaren Chunks einer .json/.jsonl-Datei."""
+    lower = fpath.lower()
+
+    if lower.endswith(".json"):
+        try:
+            with open(fpath, "r", encoding="utf-8") as f:
+                doc = _json_loads(f.read())
+        except Exception as exc:
+            logger.warning("Konnte JSON-Datei nicht laden (%s): %s", fpath, exc)
+            return
+
+        for chunk, source_path in extract_chunks_from_doc(doc, fpath, logger):
+            rec = chunk_to_record(chunk, source_path, exclude_unknown, logger)
+            if rec is not None:
+                yield rec
+
+    elif lower.endswith(".jsonl"):
+        try:
+            with open(fpath, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        doc = _json_loads(line)
+                    except Exception as exc:
+                        logger.warning(
+                            "Fehler beim Parsen von JSONL (%s:%d): %s",
+                            fpath,
+                            line_no,
+                            exc,
+                        )
+                        continue
+
+                    source_path = f"{fpath}:{line_no}"
+                    for chunk, _ in extract_chunks_from_doc(doc, source_path, logger):
+                        rec = chunk_to_record(chunk, source_path, exclude_unknown, logger)
+                        if rec is not None:
+                            yield rec
+        except Exception as exc:
+            logger.warning("Konnte JSONL-Datei nicht lesen (%s): %s", fpath, exc)
+
+
+def _parse_file_worker(fpath: str, exclude_unknown: bool) -> List[Tuple[str, Dict[str, Any]]]:
+    """Worker für --parse-workers: parst und filtert eine komplette Datei."""
+    return list(iter_file_chunks(fpath, logging.getLogger("embed_chunks"), exclude_unknown))
+
+
+def iter_parsed_files(
+    file_paths: List[str],
+    logger: logging.Logger,
+    exclude_unknown: bool = False,
+    parse_workers: int = 1,
+) -> Generator[List[Tuple[str, Dict[str, Any]]], None, None]:
+    """
+    Liefert pro Datei die Liste (Text, Meta) in der Reihenfolge von file_paths.
+
+    Mit parse_workers > 1 werden Dateien in einem Prozess-Pool geparst; ein
+    gleitendes Fenster (2 x Worker) begrenzt, wie viele fertige Dateien im
+    Speicher warten. Die Ausgabereihenfolge bleibt deterministisch.
+    """
+    if parse_workers <= 1:
+        for fpath in file_paths:
+            yield list(iter_file_chunks(fpath, logger, exclude_unknown))
+        return
+
+    window = 2 * parse_workers
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        pending: Deque[Future] = deque()
+        next_idx = 0
+        try:
+            while next_idx < len(file_paths) or pending:
+                while next_idx < len(file_paths) and len(pending) < window:
+                    pending.append(pool.submit(_parse_file_worker, file_paths[next_idx], exclude_unknown))
+                    next_idx += 1
+                yield pending.popleft().result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+
+def iter_chunks(
+    normalized_root: str,
+    logger: logging.Logger,
+    max_chunks: int | None = None,
+    exclude_unknown: bool = False,
+    parse_workers: int = 1,
+) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+    """
+    Streamt (Text, Meta) über alle Dateien in sortierter Reihenfolge, ohne
+    etwas zu sammeln (parse_workers > 1: Dateien parallel parsen).
+    """
+    num_files = 0
+    num_chunks = 0
+
+    file_paths = sorted(iter_normalized_files(normalized_root, logger))
+    if parse_workers > 1:
+        logger.info("Parse %d Dateien mit %d Prozessen (JSON-Codec: %s).", len(file_paths), parse_workers, JSON_CODEC)
+
+    for records in iter_parsed_files(file_paths, logger, exclude_unknown, parse_workers):
+        num_files += 1
+        for text, meta in records:
+            yield text, meta
+            num_chunks += 1
+
+            if max_chunks is not None and num_chunks >= max_chunks:
+                logger.info(
+                    "Maximale Anzahl Chunks erreicht (%d) – Abbruch der Sammlung.",
+                    max_chunks,
+                )
+                logger.info(
+                    "Geladene Dateien: %d, gesammelte Chunks: %d",
+                    num_files,
+                    num_chunks,
+                )
+                return
+
+    logger.info(
+        "Sammlung abgeschlossen. Dateien: %d, Chunks: %d",
+        num_files,
+        num_chunks,
+    )
+
+
 def collect_chunks(
     normalized_root: str,
     logger: logging.Logger,
     max_chunks: int | None = None,
     exclude_unknown: bool = False,
+    parse_workers: int = 1,
 ) -> Tuple[List[str], List[Dict[str, Any]], List[str]]:
     texts: List[str] = []
     metas: List[Dict[str, Any]] = []
     chunk_ids: List[str] = []
 
-    num_files = 0
-    num_chunks = 0
+    for text, meta in iter_chunks(normalized_root, logger, max_chunks, exclude_unknown, parse_workers):
+        texts.append(text)
+        metas.append(meta)
+        chunk_ids.append(meta["chunk_uid"])
 
-    file_paths = sorted(iter_normalized_files(normalized_root, logger))
+    return texts, metas, chunk_ids
 
-    for fpath in file_paths:
-        num_files += 1
-        lower = fpath.lower()
 
-        if lower.endswith(".json"):
-            try:
-                with open(fpath, "r", encoding="utf-8") as f:
-                    doc = json.load(f)
-            except Exception as exc:
-                logger.warning("Konnte JSON-Datei nicht laden (%s): %s", fpath, exc)
-                continue
+def uid_key(chunk_uid: str) -> int:
+    """Stabiler 64-bit-Hash einer chunk_uid (Duplikat-Check, Shard-Zuordnung)."""
+    return int.from_bytes(hashlib.sha1(chunk_uid.encode("utf-8")).digest()[:8], "little")
 
-            for chunk, source_path in extract_chunks_from_doc(doc, fpath, logger):
-                doc_id = chunk.get("doc_id")
-                c_id = chunk.get("chunk_id")
-                if not doc_id or not c_id:
-                    logger.debug(
-                        "Chunk ohne doc_id/chunk_id in %s – überspringe.",
-                        source_path,
-                    )
-                    continue
-
-                semantic = chunk.get("semantic", {}) or {}
-
-                artifact_role = semantic.get("artifact_role") or []
-                if isinstance(artifact_role, str):
-                    artifact_role = [artifact_role]
-                if "structural" in artifact_role:
-                    continue
-
-                lang = semantic.get("language") or chunk.get("language")
-                if exclude_unknown and lang == "unknown":
-                    continue
-
-                text = build_text_from_chunk(chunk)
-                if not text.strip():
-                    continue
-
-                chunk_uid = f"{doc_id}::{c_id}"
-                orig_source_path = chunk.get("source_path")
-
-                meta: Dict[str, Any] = {
-                    "doc_id": doc_id,
-                    "chunk_id": c_id,
-                    "chunk_uid": chunk_uid,
-                    "source_path": orig_source_path or source_path,
-                    "record_ref": source_path,
-                    "source_type": chunk.get("source_type"),
-                    "language": lang,
-                    "meta": chunk.get("meta", {}),
-                    "semantic": semantic,
-                    "trust_level": semantic.get("trust_level"),
-                    "content_type": semantic.get("content_type"),
-                    "domain": semantic.get("domain"),
-                }
-
-                texts.append(text)
-                metas.append(meta)
-                chunk_ids.append(chunk_uid)
-                num_chunks += 1
-
-                if max_chunks is not None and num_chunks >= max_chunks:
-                    logger.info(
-                        "Maximale Anzahl Chunks erreicht (%d) – Abbruch der Sammlung.",
-                        max_chunks,
-                    )
-                    logger.info(
-                        "Geladene Dateien: %d, gesammelte Chunks: %d",
-                        num_files,
-                        num_chunks,
-                    )
-                    return texts, metas, chunk_ids
 
-        elif lower.endswith(".jsonl"):
+def text_sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+EMBEDDING_STORE_NAME = "embedding_store"
+
+
+def _store_paths(indices_root: str) -> Tuple[str, str, str]:
+    base = os.path.join(indices_root, EMBEDDING_STORE_NAME)
+    return base + ".f32", base + "_keys.jsonl", base + ".json"
+
+
+def load_embedding_store(
+    indices_root: str,
+    model_name: str,
+    normalize: bool,
+    logger: logging.Logger,
+) -> Tuple[Optional[np.ndarray], Dict[str, Tuple[int, str]]]:
+    """
+    Lädt den Embedding-Store (Vektoren als np.memmap) und liefert
+    chunk_uid -> (Zeile, text_sha1). Passt model_name/normalize nicht, wird der
+    Store ignoriert (alles wird neu berechnet).
+    """
+    vec_path, keys_path, info_path = _store_paths(indices_root)
+    if not (os.path.isfile(vec_path) and os.path.isfile(keys_path) and os.path.isfile(info_path)):
+        logger.info("Kein Embedding-Store vorhanden – alle Chunks werden encodiert.")
+        return None, {}
+
+    with open(info_path, "r", encoding="utf-8") as f:
+        info = json.load(f)
+    if info.get("model_name") != model_name or bool(info.get("normalized")) != bool(normalize):
+        logger.warning(
+            "Embedding-Store passt nicht (model=%s, normalized=%s) – wird ignoriert.",
+            info.get("model_name"),
+            info.get("normalized"),
+        )
+        return None, {}
+
+    num_vectors = int(info.get("num_vectors", 0))
+    dim = int(info.get("embedding_dim", 0))
+    if num_vectors <= 0 or dim <= 0 or os.path.getsize(vec_path) != num_vectors * dim * 4:
+        logger.warning("Embedding-Store inkonsistent (Größe passt nicht zu %s) – wird ignoriert.", info_path)
+        return None, {}
+    vectors = np.memmap(vec_path, dtype="float32", mode="r", shape=(num_vectors, dim))
+
+    keys: Dict[str, Tuple[int, str]] = {}
+    with open(keys_path, "r", encoding="utf-8") as f:
+        for row, line in enumerate(f):
+            rec = json.loads(line)
+            keys[rec["chunk_uid"]] = (row, rec["text_sha1"])
+
+    if len(keys) != num_vectors:
+        logger.warning(
+            "Embedding-Store inkonsistent (%d Keys, %d Vektoren) – wird ignoriert.",
+            len(keys),
+            num_vectors,
+        )
+        return None, {}
+
+    logger.info("Embedding-Store geladen: %d Vektoren (%s).", len(keys), vec_path)
+    return vectors, keys
+
+
+class EmbeddingStoreWriter:
+    """
+    Schreibt den Store blockweise in temporäre Dateien (Vektoren als rohes
+    float32, Zeile i gehört zu faiss_id i) und tauscht sie in commit() atomar aus.
+    """
+
+    def __init__(self, indices_root: str, dim: int) -> None:
+        self.vec_path, self.keys_path, self.info_path = _store_paths(indices_root)
+        os.makedirs(indices_root, exist_ok=True)
+        self.dim = int(dim)
+        self.num_vectors = 0
+        self._vec_f = open(self.vec_path + ".tmp", "wb")
+        self._keys_f = open(self.keys_path + ".tmp", "w", encoding="utf-8")
+
+    def append(self, vectors: np.ndarray, chunk_ids: List[str], hashes: List[str]) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim or vectors.shape[0] != len(chunk_ids):
+            raise ValueError(f"Ungültiger Block für Embedding-Store: {vectors.shape}")
+        vectors.tofile(self._vec_f)
+        for uid, h in zip(chunk_ids, hashes):
+            self._keys_f.write(json.dumps({"chunk_uid": uid, "text_sha1": h}, ensure_ascii=False) + "\n")
+        self.num_vectors += vectors.shape[0]
+
+    def tmp_vectors(self) -> np.ndarray:
+        """Bisher geschriebene Vektoren (noch nicht committet) als read-only np.memmap."""
+        self._vec_f.flush()
+        self._keys_f.flush()
+        return np.memmap(self.vec_path + ".tmp", dtype="float32", mode="r", shape=(self.num_vectors, self.dim))
+
+    def commit(self, model_name: str, normalize: bool, logger: logging.Logger) -> None:
+        self._vec_f.close()
+        self._keys_f.close()
+        with open(self.info_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model_name": model_name,
+                    "normalized": bool(normalize),
+                    "num_vectors": int(self.num_vectors),
+                    "embedding_dim": int(self.dim),
+                    "dtype": "float32",
+                    "updated": datetime.now().isoformat(timespec="seconds"),
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(self.vec_path + ".tmp", self.vec_path)
+        os.replace(self.keys_path + ".tmp", self.keys_path)
+        os.replace(self.info_path + ".tmp", self.info_path)
+        logger.info("Embedding-Store geschrieben: %d Vektoren.", self.num_vectors)
+
+    def abort(self) -> None:
+        for f, path in ((self._vec_f, self.vec_path), (self._keys_f, self.keys_path)):
+            f.close()
             try:
-                with open(fpath, "r", encoding="utf-8") as f:
-                    for line_no, line in enumerate(f, start=1):
-                        line = line.strip()
-                        if not line:
-                            continue
-                        try:
-                            doc = json.loads(line)
-                        except Exception as exc:
-                            logger.warning(
-                                "Fehler beim Parsen von JSONL (%s:%d): %s",
-                                fpath,
-                                line_no,
-                                exc,
-                            )
-                            continue
-
-                        source_path = f"{fpath}:{line_no}"
-                        for chunk, _ in extract_chunks_from_doc(doc, source_path, logger):
-                            doc_id = chunk.get("doc_id")
-                            c_id = chunk.get("chunk_id")
-                            if not doc_id or not c_id:
-                                logger.debug(
-                                    "Chunk ohne doc_id/chunk_id in %s – überspringe.",
-                                    source_path,
-                                )
-                                continue
-
-                            semantic = chunk.get("semantic", {}) or {}
-
-                            artifact_role = semantic.get("artifact_role") or []
-                            if isinstance(artifact_role, str):
-                                artifact_role = [artifact_role]
-                            if "structural" in artifact_role:
-                                continue
-
-                            lang = semantic.get("language") or chunk.get("language")
-                            if exclude_unknown and lang == "unknown":
-                                continue
-
-                            text = build_text_from_chunk(chunk)
-                            if not text.strip():
-                                continue
-
-                            chunk_uid = f"{doc_id}::{c_id}"
-                            orig_source_path = chunk.get("source_path")
-
-                            meta = {
-                                "doc_id": doc_id,
-                                "chunk_id": c_id,
-                                "chunk_uid": chunk_uid,
-                                "source_path": orig_source_path or source_path,
-                                "record_ref": source_path,
-                                "source_type": chunk.get("source_type"),
-                                "language": lang,
-                                "meta": chunk.get("meta", {}),
-                                "semantic": semantic,
-                                "trust_level": semantic.get("trust_level"),
-                                "content_type": semantic.get("content_type"),
-                                "domain": semantic.get("domain"),
-                            }
-
-                            texts.append(text)
-                            metas.append(meta)
-                            chunk_ids.append(chunk_uid)
-                            num_chunks += 1
-
-                            if max_chunks is not None and num_chunks >= max_chunks:
-                                logger.info(
-                                    "Maximale Anzahl Chunks erreicht (%d) – Abbruch der Sammlung.",
-                                    max_chunks,
-                                )
-                                logger.info(
-                                    "Geladene Dateien: %d, gesammelte Chunks: %d",
-                                    num_files,
-                                    num_chunks,
-                                )
-                                return texts, metas, chunk_ids
-
-            except Exception as exc:
-                logger.warning("Konnte JSONL-Datei nicht lesen (%s): %s", fpath, exc)
+                os.remove(path + ".tmp")
+            except OSError:
+                pass
+
+
+def save_embedding_store(
+    indices_root: str,
+    embeddings: np.ndarray,
+    chunk_ids: List[str],
+    hashes: List[str],
+    model_name: str,
+    normalize: bool,
+    logger: logging.Logger,
+) -> None:
+    """Schreibt den Store für eine komplett im Speicher liegende Embedding-Matrix."""
+    writer = EmbeddingStoreWriter(indices_root, int(embeddings.shape[1]))
+    writer.append(embeddings, chunk_ids, hashes)
+    writer.commit(model_name, normalize, logger)
+
+
+def load_previous_order(meta_path: str) -> List[str]:
+    """chunk_uids des bestehenden Index in faiss_id-Reihenfolge (leer, wenn keiner existiert)."""
+    if not os.path.isfile(meta_path):
+        return []
+    order: List[Tuple[int, str]] = []
+    with open(meta_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
                 continue
+            rec = json.loads(line)
+            fid = rec.get("faiss_id")
+            uid = rec.get("chunk_uid")
+            if fid is not None and uid is not None:
+                order.append((int(fid), str(uid)))
+    order.sort()
+    return [uid for _, uid in order]
 
-    logger.info(
-        "Sammlung abgeschlossen. Dateien: %d, Chunks: %d",
-        num_files,
-        num_chunks,
+
+def plan_incremental_order(chunk_ids: List[str], previous_order: List[str]) -> List[int]:
+    """
+    Neue Reihenfolge (Positionen in chunk_ids): erst alle noch vorhandenen Chunks
+    in alter faiss_id-Reihenfolge, dann neue Chunks in Sammelreihenfolge.
+    """
+    pos_by_uid = {uid: i for i, uid in enumerate(chunk_ids)}
+    order: List[int] = []
+    seen = set()
+    for uid in previous_order:
+        i = pos_by_uid.get(uid)
+        if i is not None and i not in seen:
+            order.append(i)
+            seen.add(i)
+    order.extend(i for i in range(len(chunk_ids)) if i not in seen)
+    return order
+
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+STORAGE_TYPES = ("float32", "fp16", "sq8")
+REDUCE_TYPES = ("pca", "opq")
+
+# Kodierung der Vektoren im Index (faiss.index_factory)
+_STORAGE_FACTORY = {"float32": "Flat", "fp16": "SQfp16", "sq8": "SQ8"}
+
+# OPQ trainiert ein internes 8-Bit-PQ: mindestens 256 Trainingsvektoren
+_OPQ_MIN_TRAIN = 256
+
+# Defaults, falls weder CLI noch config/embedding/embeddings.json etwas vorgeben
+DEFAULT_INDEX_PARAMS: Dict[str, Any] = {
+    "nlist": None,  # None = automatisch ~4*sqrt(N)
+    "pq_m": 96,
+    "pq_nbits": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 128,
+    "nprobe": 32,
+    "train_sample": 262144,
+    "storage": "float32",
+    "reduce": None,  # None | "pca" | "opq"
+    "reduce_dim": None,
+}
+
+DEFAULT_EMBEDDING_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "embedding", "embeddings.json"
+)
+
+
+def load_embedding_config(path: str) -> Dict[str, Any]:
+    if not path or not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def normalize_index_type(value: Optional[str]) -> str:
+    """Akzeptiert auch die Schreibweise aus embeddings.json ("faiss_flat", "faiss_hnsw", ...)."""
+    v = (value or "flat").strip().lower()
+    if v.startswith("faiss_"):
+        v = v[len("faiss_"):]
+    if v not in INDEX_TYPES:
+        raise ValueError(f"Unbekannter index_type '{value}', erlaubt: {', '.join(INDEX_TYPES)}")
+    return v
+
+
+def resolve_index_params(args: argparse.Namespace, emb_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Index-Parameter: CLI > embeddings.json (index_type, index_params) > Defaults."""
+    params = dict(DEFAULT_INDEX_PARAMS)
+    params.update({k: v for k, v in (emb_cfg.get("index_params") or {}).items() if k in params})
+    for key in params:
+        cli_val = getattr(args, key, None)
+        if cli_val is not None:
+            params[key] = cli_val
+    params["index_type"] = normalize_index_type(args.index_type or emb_cfg.get("index_type"))
+    params["storage"] = str(params.get("storage") or "float32").lower()
+    if params["storage"] not in STORAGE_TYPES:
+        raise ValueError(f"Unbekannter storage '{params['storage']}', erlaubt: {', '.join(STORAGE_TYPES)}")
+    if params.get("reduce"):
+        params["reduce"] = str(params["reduce"]).lower()
+        if params["reduce"] not in REDUCE_TYPES:
+            raise ValueError(f"Unbekanntes reduce '{params['reduce']}', erlaubt: {', '.join(REDUCE_TYPES)}")
+        if not params.get("reduce_dim"):
+            raise ValueError("--reduce benötigt --reduce-dim.")
+    else:
+        params["reduce"] = None
+        params["reduce_dim"] = None
+    return params
+
+
+def is_plain_flat(params: Optional[Dict[str, Any]]) -> bool:
+    """True für den bisherigen unkomprimierten IndexFlatIP/L2."""
+    return params is None or (
+        params.get("index_type", "flat") == "flat"
+        and params.get("storage", "float32") == "float32"
+        and not params.get("reduce")
     )
-    return texts, metas, chunk_ids
+
+
+def index_factory_string(
+    params: Dict[str, Any], num_vecs: int, dim: int, logger: logging.Logger, use_inner_product: bool = True
+) -> str:
+    """
+    Baut den faiss.index_factory-String und passt nlist, pq_m, pq_nbits und OPQ
+    an kleine Korpora (Trainingsstichprobe) bzw. die Dimension an (die
+    Anpassungen landen in params).
+    Bei IP wird nach PCA/OPQ neu normalisiert (L2norm): PCA zentriert die
+    Vektoren, die Projektion kürzt sie – ohne L2norm wären die Scores keine Kosinus-Werte.
+    """
+    index_type = params["index_type"]
+    storage = params.get("storage", "float32")
+    n_train = min(num_vecs, int(params.get("train_sample") or num_vecs))
+
+    prefix = ""
+    if params.get("reduce"):
+        reduce_dim = int(params["reduce_dim"])
+        if reduce_dim >= dim:
+            raise ValueError(f"reduce_dim={reduce_dim} muss kleiner als dim={dim} sein.")
+        if params["reduce"] == "opq" and n_train < _OPQ_MIN_TRAIN:
+            # OPQ trainiert intern ein PQ mit 8 Bit (256 Zentroide pro Teilraum)
+            logger.warning(
+                "reduce=opq braucht >= %d Trainingsvektoren, vorhanden %d – verwende PCA.", _OPQ_MIN_TRAIN, n_train
+            )
+            params["reduce"] = "pca"
+        if params["reduce"] == "opq":
+            opq_m = int(params["pq_m"]) if index_type == "ivf_pq" else 0
+            if not opq_m or reduce_dim % opq_m != 0:
+                opq_m = next(m for m in (64, 48, 32, 16, 8, 4, 2, 1) if reduce_dim % m == 0)
+            prefix = f"OPQ{opq_m}_{reduce_dim},"
+        else:
+            prefix = f"PCA{reduce_dim},"
+        if use_inner_product:
+            prefix += "L2norm,"
+        dim = reduce_dim
+
+    if index_type == "ivf_pq" and storage != "float32":
+        logger.warning("storage=%s wird bei ivf_pq ignoriert (PQ-Codes).", storage)
+    encoding = _STORAGE_FACTORY[storage]
+
+    if index_type == "flat":
+        return f"{prefix}{encoding}"
+    if index_type == "hnsw":
+        return f"{prefix}HNSW{int(params['hnsw_m'])},{encoding}"
+
+    nlist = params.get("nlist")
+    if not nlist:
+        nlist = int(4 * np.sqrt(max(1, num_vecs)))
+    # FAISS braucht ~39 Trainingspunkte pro Liste
+    max_nlist = max(1, n_train // 39)
+    if nlist > max_nlist:
+        logger.warning("nlist=%d zu groß für %d Trainingsvektoren – reduziere auf %d.", nlist, n_train, max_nlist)
+        nlist = max_nlist
+    params["nlist"] = int(nlist)
+
+    if index_type == "ivf_flat":
+        return f"{prefix}IVF{nlist},{encoding}"
+
+    pq_m = int(params["pq_m"])
+    if dim % pq_m != 0:
+        divisors = [m for m in range(pq_m, 0, -1) if dim % m == 0]
+        logger.warning("pq_m=%d teilt dim=%d nicht – verwende %d.", pq_m, dim, divisors[0])
+        pq_m = divisors[0]
+    params["pq_m"] = pq_m
+    pq_nbits = int(params["pq_nbits"])
+    if n_train < 2 ** pq_nbits:
+        # k-means pro Teilraum braucht mindestens 2**pq_nbits Trainingspunkte
+        max_nbits = int(np.log2(n_train)) if n_train > 1 else 0
+        if max_nbits < 1:
+            raise ValueError(f"pq_nbits: {n_train} Trainingsvektoren reichen für kein IVF-PQ.")
+        logger.warning("pq_nbits=%d zu groß für %d Trainingsvektoren – verwende %d.", pq_nbits, n_train, max_nbits)
+        pq_nbits = max_nbits
+    params["pq_nbits"] = pq_nbits
+    return f"{prefix}IVF{nlist},PQ{pq_m}x{pq_nbits}"
+
+
+def check_reduce_metric(factory: str, reduce: Optional[str], use_inner_product: bool) -> None:
+    """Metrik und Reduktion müssen zusammenpassen: IP nach PCA/OPQ nur mit L2norm."""
+    if reduce and use_inner_product and "L2norm" not in factory.split(","):
+        raise ValueError(
+            f"reduce={reduce} mit Metrik IP braucht ein L2norm nach der Reduktion (factory='{factory}'), "
+            "sonst sind die Scores keine Kosinus-Ähnlichkeiten."
+        )
+
+
+def create_faiss_index(dim: int, use_inner_product: bool, logger: logging.Logger) -> faiss.Index:
+    if use_inner_product:
+        index = faiss.IndexFlatIP(dim)
+        logger.info("FAISS Index-Typ: IndexFlatIP (inner product / Cosine bei Normalisierung)")
+    else:
+        index = faiss.IndexFlatL2(dim)
+        logger.info("FAISS Index-Typ: IndexFlatL2 (L2-Distanz)")
+    return index
 
 
 def build_faiss_index(
     embeddings: np.ndarray,
     use_inner_product: bool,
     logger: logging.Logger,
+    params: Optional[Dict[str, Any]] = None,
 ) -> faiss.Index:
+    """
+    Baut den Index aus einer Embedding-Matrix (ndarray oder np.memmap).
+
+    params=None bzw. unkomprimiertes "flat" ergibt wie bisher IndexFlatIP/L2.
+    Alles andere wird per faiss.index_factory gebaut; trainierbare Teile (IVF,
+    SQ8, PCA/OPQ) werden auf einer Stichprobe (train_sample) trainiert. Vektoren werden blockweise hinzugefügt,
+    sodass eine gemappte Matrix nicht komplett in den Speicher kopiert wird.
+    """
     if embeddings.ndim != 2:
         raise ValueError(f"Embeddings müssen 2D sein, erhalten: %s", embeddings.shape)
 
     num_vecs, dim = embeddings.shape
     logger.info("Erzeuge FAISS-Index mit %d Vektoren, Dimension %d", num_vecs, dim)
 
-    if use_inner_product:
-        index = faiss.IndexFlatIP(dim)
-        logger.info("FAISS Index-Typ: IndexFlatIP (inner product / Cosine bei Normalisierung)")
+    if is_plain_flat(params):
+        index = create_faiss_index(dim, use_inner_product, logger)
     else:
-        index = faiss.IndexFlatL2(dim)
-        logger.info("FAISS Index-Typ: IndexFlatL2 (L2-Distanz)")
-
-    vecs32 = embeddings.astype("float32")
-    index.add(vecs32)
+        factory = index_factory_string(params, num_vecs, dim, logger, use_inner_product)
+        check_reduce_metric(factory, params.get("reduce"), use_inner_product)
+        metric = faiss.METRIC_INNER_PRODUCT if use_inner_product else faiss.METRIC_L2
+        index = faiss.index_factory(dim, factory, metric)
+        params["factory"] = factory
+        logger.info("FAISS Index-Typ: %s (factory='%s')", type(index).__name__, factory)
+
+        hnsw = _hnsw_of(index)
+        if hnsw is not None:
+            hnsw.efConstruction = int(params["ef_construction"])
+
+        if not index.is_trained:
+            n_train = min(num_vecs, int(params["train_sample"]))
+            rng = np.random.default_rng(0)
+            rows = np.sort(rng.choice(num_vecs, size=n_train, replace=False))
+            t0 = time.time()
+            try:
+                index.train(np.ascontiguousarray(embeddings[rows], dtype="float32"))
+            except RuntimeError as exc:
+                raise ValueError(
+                    f"Training von '{factory}' auf {n_train} Vektoren fehlgeschlagen "
+                    f"(train_sample/nlist/pq_nbits/reduce prüfen): {exc}"
+                ) from exc
+            logger.info("Index trainiert auf %d Vektoren (%.1fs).", n_train, time.time() - t0)
+
+    block = 65536
+    for start in range(0, num_vecs, block):
+        # keine Kopie, wenn die Embeddings schon float32 und zusammenhängend sind
+        index.add(np.ascontiguousarray(embeddings[start:start + block], dtype="float32"))
+
+    if params is not None:
+        apply_search_params(index, params)
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # reconstruct() für IVF-Indizes (FaissRetriever.reconstruct_vector)
+            ivf.make_direct_map()
 
     logger.info("FAISS-Index aufgebaut (ntotal = %d)", index.ntotal)
     return index
 
 
+def _hnsw_of(index: faiss.Index) -> Optional[Any]:
+    """HNSW-Struktur eines Index, auch hinter einer PCA/OPQ-Vortransformation."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return getattr(index, "hnsw", None)
+
+
+def apply_search_params(index: faiss.Index, params: Dict[str, Any]) -> None:
+    """Setzt nprobe (IVF) bzw. efSearch (HNSW) für Anfragen."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and params.get("nprobe"):
+        ivf.nprobe = int(params["nprobe"])
+    hnsw = _hnsw_of(index)
+    if hnsw is not None and params.get("ef_search"):
+        hnsw.efSearch = int(params["ef_search"])
+
+
 def save_meta_lines(meta_path: str, metas: List[Dict[str, Any]], logger: logging.Logger) -> None:
     os.makedirs(os.path.dirname(meta_path), exist_ok=True)
     with open(meta_path, "w", encoding="utf-8") as f:
@@ -383,6 +940,9 @@ def save_meta_lines(meta_path: str, metas: List[Dict[str, Any]], logger: logging
             }
             f.write(json.dumps(record, ensure_ascii=False) + "\n")
     logger.info("Metadaten nach %s geschrieben (%d Zeilen).", meta_path, len(metas))
+    store_dir = store_dir_for(meta_path)
+    write_meta_store(({"faiss_id": i, **m} for i, m in enumerate(metas)), store_dir)
+    logger.info("Meta-Store nach %s geschrieben.", store_dir)
 
 
 def save_index_config(
@@ -391,11 +951,19 @@ def save_index_config(
     index_path: str,
     meta_path: str,
     args: argparse.Namespace,
-    embeddings: np.ndarray,
+    num_vecs: int,
+    dim: int,
     use_inner_product: bool,
     logger: logging.Logger,
+    index: Optional[faiss.Index] = None,
+    index_params: Optional[Dict[str, Any]] = None,
 ) -> None:
-    num_vecs, dim = embeddings.shape
+    if index is not None:
+        index_type_name = type(faiss.downcast_index(index)).__name__
+    else:
+        index_type_name = "IndexFlatIP" if use_inner_product else "IndexFlatL2"
+
+    vec_path, _, _ = _store_paths(os.path.dirname(os.path.abspath(index_path)))
 
     cfg: Dict[str, Any] = {
         "workspace_root": workspace_root,
@@ -407,10 +975,26 @@ def save_index_config(
         "num_vectors": int(num_vecs),
         "metric": "IP" if use_inner_product else "L2",
         "normalized": bool(args.normalize),
-        "index_type": "IndexFlatIP" if use_inner_product else "IndexFlatL2",
+        "index_type": index_type_name,
+        "index_params": index_params or {"index_type": "flat"},
+        "vectors_path": vec_path,
         "build_timestamp": datetime.now().isoformat(timespec="seconds"),
         "script": "embed_chunks.py",
     }
+    if getattr(args, "incremental_stats", None):
+        cfg["incremental"] = args.incremental_stats
+    if getattr(args, "streaming", False):
+        cfg["streaming"] = {"stream_batch_size": int(args.stream_batch_size)}
+    if getattr(args, "mode", "single") == "reduce":
+        cfg["mapreduce"] = {"num_shards": int(args.num_shards)}
+    if getattr(args, "encode_stats", None):
+        cfg["encode"] = dict(args.encode_stats)
+        logger.info(
+            "Encoding-Durchsatz: %d Sätze in %.1fs (%.1f Sätze/s).",
+            args.encode_stats["sentences"],
+            args.encode_stats["seconds"],
+            args.encode_stats["sentences_per_s"],
+        )
 
     os.makedirs(os.path.dirname(config_path), exist_ok=True)
     with open(config_path, "w", encoding="utf-8") as f:
@@ -419,6 +1003,709 @@ def save_index_config(
     logger.info("Index-Konfiguration nach %s geschrieben.", config_path)
 
 
+def available_cpus() -> int:
+    """CPUs dieses Jobs (SLURM_CPUS_PER_TASK, sonst CPU-Affinität des Prozesses)."""
+    env = os.environ.get("SLURM_CPUS_PER_TASK")
+    if env and env.isdigit():
+        return max(1, int(env))
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+_WORKER_MODEL: Optional["SentenceTransformer"] = None
+
+
+def _cpu_worker_init(model_name: str, threads: int) -> None:
+    global _WORKER_MODEL
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch  # type: ignore
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+    _WORKER_MODEL = SentenceTransformer(model_name, device="cpu")
+
+
+def _cpu_worker_dim() -> int:
+    assert _WORKER_MODEL is not None
+    return int(_WORKER_MODEL.get_sentence_embedding_dimension())
+
+
+def _cpu_worker_encode(texts: List[str], batch_size: int, normalize: bool) -> np.ndarray:
+    assert _WORKER_MODEL is not None
+    emb = _WORKER_MODEL.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+        normalize_embeddings=normalize,
+    )
+    return np.asarray(emb, dtype="float32")
+
+
+class CpuEncodePool:
+    """
+    Pool aus Worker-Prozessen mit je einem SentenceTransformer auf der CPU.
+
+    Bietet encode()/get_sentence_embedding_dimension() wie SentenceTransformer,
+    kann also überall statt des Modells übergeben werden.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        num_workers: int,
+        threads_per_worker: Optional[int],
+        chunk_size: int,
+        logger: logging.Logger,
+    ) -> None:
+        self.num_workers = max(1, int(num_workers))
+        self.threads_per_worker = int(threads_per_worker or max(1, available_cpus() // self.num_workers))
+        self.chunk_size = max(1, int(chunk_size))
+        self.logger = logger
+        # spawn statt fork: Torch/OpenMP-Zustand des Elternprozesses nicht erben
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_cpu_worker_init,
+            initargs=(model_name, self.threads_per_worker),
+        )
+        atexit.register(self.close)
+        self._dim: Optional[int] = None
+        logger.info(
+            "CPU-Pool: %d Worker x %d Threads, Paketgröße %d.",
+            self.num_workers,
+            self.threads_per_worker,
+            self.chunk_size,
+        )
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dim is None:
+            self._dim = int(self._executor.submit(_cpu_worker_dim).result())
+        return self._dim
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        """Längen-sortierte Pakete parallel encodieren, Ergebnis in Originalreihenfolge."""
+        order = np.argsort(np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts)), kind="stable")[::-1]
+        futures: List[Tuple[np.ndarray, Future]] = []
+        for start in range(0, len(order), self.chunk_size):
+            idx = order[start:start + self.chunk_size]
+            fut = self._executor.submit(
+                _cpu_worker_encode, [texts[i] for i in idx], int(batch_size), bool(normalize_embeddings)
+            )
+            futures.append((idx, fut))
+
+        out: Optional[np.ndarray] = None
+        done = 0
+        last_log = time.time()
+        for idx, fut in futures:
+            emb = fut.result()
+            if out is None:
+                out = np.empty((len(texts), emb.shape[1]), dtype="float32")
+            out[idx] = emb
+            done += len(idx)
+            if show_progress_bar and (time.time() - last_log >= 30 or done == len(texts)):
+                self.logger.info("CPU-Pool: %d/%d Texte encodiert.", done, len(texts))
+                last_log = time.time()
+        if out is None:
+            out = np.empty((0, self.get_sentence_embedding_dimension()), dtype="float32")
+        return out
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def load_encoder(args: argparse.Namespace, logger: logging.Logger) -> Any:
+    """SentenceTransformer bzw. bei --device cpu --cpu-workers > 1 der CPU-Pool."""
+    if args.device == "cpu" and int(args.cpu_workers or 0) > 1:
+        pool = CpuEncodePool(
+            args.model_name,
+            num_workers=args.cpu_workers,
+            threads_per_worker=args.threads_per_worker,
+            chunk_size=args.cpu_chunk_size or args.batch_size * 4,
+            logger=logger,
+        )
+        args.encode_stats = {
+            "sentences": 0,
+            "seconds": 0.0,
+            "cpu_workers": pool.num_workers,
+            "threads_per_worker": pool.threads_per_worker,
+        }
+        return pool
+    return SentenceTransformer(args.model_name, device=args.device)
+
+
+def encode_texts(
+    model: "SentenceTransformer",
+    texts: List[str],
+    args: argparse.Namespace,
+    logger: logging.Logger,
+    show_progress: bool = True,
+) -> np.ndarray:
+    t0 = time.time()
+    try:
+        embeddings = model.encode(
+            texts,
+            batch_size=args.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=show_progress,
+            normalize_embeddings=args.normalize,
+        )
+    except TypeError:
+        logger.warning(
+            "SentenceTransformer.encode unterstützt 'normalize_embeddings' nicht, "
+            "normalisiere manuell."
+        )
+        embeddings = model.encode(
+            texts,
+            batch_size=args.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=show_progress,
+        )
+        if args.normalize:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+            embeddings = embeddings / norms
+
+    # Durchsatz über alle Aufrufe (Streaming: ein Aufruf pro Block)
+    stats = getattr(args, "encode_stats", None) or {"sentences": 0, "seconds": 0.0}
+    stats["sentences"] += len(texts)
+    stats["seconds"] = round(stats["seconds"] + time.time() - t0, 3)
+    stats["sentences_per_s"] = round(stats["sentences"] / max(1e-6, stats["seconds"]), 1)
+    args.encode_stats = stats
+    if show_progress:
+        logger.info("Encodiert: %d Texte (%.1f Sätze/s).", len(texts), len(texts) / max(1e-6, time.time() - t0))
+
+    return embeddings
+
+
+def encode_incremental(
+    model: "SentenceTransformer",
+    texts: List[str],
+    metas: List[Dict[str, Any]],
+    chunk_ids: List[str],
+    args: argparse.Namespace,
+    indices_root: str,
+    meta_path: str,
+    logger: logging.Logger,
+) -> Tuple[np.ndarray, List[str], List[str], List[Dict[str, Any]]]:
+    """
+    Encodiert nur neue/geänderte Chunks und übernimmt den Rest aus dem Store.
+
+    Rückgabe: (embeddings, text_sha1s, chunk_ids, metas) in der neuen,
+    möglichst stabilen faiss_id-Reihenfolge.
+    """
+    store_vecs, store_keys = load_embedding_store(indices_root, args.model_name, args.normalize, logger)
+    previous_order = load_previous_order(meta_path) if store_vecs is not None else []
+
+    order = plan_incremental_order(chunk_ids, previous_order)
+    texts = [texts[i] for i in order]
+    metas = [metas[i] for i in order]
+    chunk_ids = [chunk_ids[i] for i in order]
+    hashes = [text_sha1(t) for t in texts]
+
+    reuse_rows: List[int] = []
+    reuse_pos: List[int] = []
+    compute_pos: List[int] = []
+    for pos, (uid, h) in enumerate(zip(chunk_ids, hashes)):
+        hit = store_keys.get(uid)
+        if hit is not None and hit[1] == h:
+            reuse_pos.append(pos)
+            reuse_rows.append(hit[0])
+        else:
+            compute_pos.append(pos)
+
+    current = set(chunk_ids)
+    removed = sum(1 for uid in store_keys if uid not in current)
+    changed = sum(1 for pos in compute_pos if chunk_ids[pos] in store_keys)
+
+    dim = int(store_vecs.shape[1]) if store_vecs is not None else None
+    computed: Optional[np.ndarray] = None
+    if compute_pos:
+        computed = encode_texts(model, [texts[p] for p in compute_pos], args, logger)
+        dim = int(computed.shape[1])
+
+    embeddings = np.empty((len(chunk_ids), int(dim or 0)), dtype="float32")
+    if reuse_pos:
+        assert store_vecs is not None
+        # Zeilen sortiert lesen (mmap), dann an die Zielpositionen schreiben
+        rows = np.asarray(reuse_rows, dtype=np.int64)
+        sort_idx = np.argsort(rows)
+        embeddings[np.asarray(reuse_pos, dtype=np.int64)[sort_idx]] = store_vecs[rows[sort_idx]]
+    if computed is not None:
+        embeddings[np.asarray(compute_pos, dtype=np.int64)] = computed
+
+    logger.info(
+        "Inkrementell: %d Vektoren wiederverwendet, %d neu berechnet (davon %d geändert), %d entfernt.",
+        len(reuse_pos),
+        len(compute_pos),
+        changed,
+        removed,
+    )
+    args.incremental_stats = {
+        "reused": len(reuse_pos),
+        "computed": len(compute_pos),
+        "changed": changed,
+        "removed": removed,
+    }
+    return embeddings, hashes, chunk_ids, metas
+
+
+def embed_streaming(
+    load_model: Callable[[], "SentenceTransformer"],
+    args: argparse.Namespace,
+    index_params: Dict[str, Any],
+    normalized_root: str,
+    indices_root: str,
+    index_path: str,
+    meta_path: str,
+    config_path: str,
+    workspace_root: str,
+    logger: logging.Logger,
+) -> int:
+    """
+    Streaming-Modus: Dateien werden in Blöcken von stream_batch_size Chunks
+    gelesen, encodiert und direkt an Index, Embedding-Store und Meta-JSONL
+    angehängt. Außer dem Index selbst hält der Prozess nur einen Block im
+    Speicher; Texte und Meta-Dicts werden nach jedem Block verworfen.
+
+    Das Modell wird erst beim ersten Block geladen, damit ein Parse-Pool
+    (--parse-workers) vor der CUDA-Initialisierung forkt. Der Index wird am
+    Ende aus den gemappten Store-Vektoren gebaut (nötig für IVF-Training).
+    """
+    use_ip = bool(args.normalize)
+    os.makedirs(indices_root, exist_ok=True)
+    model: Optional["SentenceTransformer"] = None
+    store: Optional[EmbeddingStoreWriter] = None
+    dim = 0
+
+    # Duplikat-Check über 64-bit-Hashes statt vollständiger chunk_uid-Strings
+    seen_uids: set = set()
+    num_written = 0
+    t_start = time.time()
+
+    batch_texts: List[str] = []
+    batch_metas: List[Dict[str, Any]] = []
+
+    meta_tmp = meta_path + ".tmp"
+    try:
+        with open(meta_tmp, "w", encoding="utf-8") as meta_f:
+
+            def _flush() -> None:
+                nonlocal num_written, model, store, dim
+                if model is None:
+                    model = load_model()
+                    dim = int(model.get_sentence_embedding_dimension())
+                    store = EmbeddingStoreWriter(indices_root, dim)
+                assert store is not None
+                emb = np.ascontiguousarray(
+                    encode_texts(model, batch_texts, args, logger, show_progress=False), dtype="float32"
+                )
+                uids = [m["chunk_uid"] for m in batch_metas]
+                store.append(emb, uids, [text_sha1(t) for t in batch_texts])
+                for i, meta in enumerate(batch_metas):
+                    meta_f.write(json.dumps({"faiss_id": num_written + i, **meta}, ensure_ascii=False) + "\n")
+                num_written += len(batch_metas)
+                batch_texts.clear()
+                batch_metas.clear()
+                elapsed = max(1e-6, time.time() - t_start)
+                logger.info("Streaming: %d Chunks encodiert (%.1f/s).", num_written, num_written / elapsed)
+
+            for text, meta in iter_chunks(
+                normalized_root,
+                logger,
+                max_chunks=args.max_chunks,
+                exclude_unknown=bool(args.exclude_unknown),
+                parse_workers=args.parse_workers,
+            ):
+                key = uid_key(meta["chunk_uid"])
+                if key in seen_uids:
+                    logger.error("Doppelte chunk_uid: %s", meta["chunk_uid"])
+                    raise ValueError("doppelte chunk_uid")
+                seen_uids.add(key)
+
+                batch_texts.append(text)
+                batch_metas.append(meta)
+                if len(batch_texts) >= args.stream_batch_size:
+                    _flush()
+
+            if batch_texts:
+                _flush()
+    except Exception as exc:
+        logger.error("Streaming-Embedding abgebrochen: %s", exc)
+        if store is not None:
+            store.abort()
+        if os.path.exists(meta_tmp):
+            os.remove(meta_tmp)
+        return 1
+
+    if num_written == 0 or store is None:
+        logger.error("Keine Chunks gefunden – Abbruch.")
+        os.remove(meta_tmp)
+        return 1
+
+    index = build_faiss_index(store.tmp_vectors(), use_inner_product=use_ip, logger=logger, params=index_params)
+
+    if index.ntotal != num_written:
+        logger.error(
+            "Inkonsistenz: Index-Vektoren (%d) != Anzahl Metadatensätze (%d).",
+            index.ntotal,
+            num_written,
+        )
+        store.abort()
+        os.remove(meta_tmp)
+        return 1
+
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    logger.info("FAISS-Index in %s gespeichert.", index_path)
+    os.replace(meta_tmp, meta_path)
+    logger.info("Metadaten nach %s geschrieben (%d Zeilen).", meta_path, num_written)
+    logger.info("Meta-Store nach %s geschrieben.", build_from_jsonl(meta_path))
+    store.commit(args.model_name, bool(args.normalize), logger)
+
+    save_index_config(
+        config_path=config_path,
+        workspace_root=workspace_root,
+        index_path=index_path,
+        meta_path=meta_path,
+        args=args,
+        num_vecs=num_written,
+        dim=dim,
+        use_inner_product=use_ip,
+        logger=logger,
+        index=index,
+        index_params=index_params,
+    )
+    logger.info(
+        "Fertig (Streaming). Vektoren: %d, Index: %s, Meta: %s, Config: %s",
+        num_written,
+        index_path,
+        meta_path,
+        config_path,
+    )
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Map/Reduce
+# ---------------------------------------------------------------------------
+
+SHARD_SUBDIR = "_tmp_shards"
+_U64 = (1 << 64) - 1
+
+
+def _shard_paths(shard_dir: str, shard_id: int) -> Tuple[str, str, str]:
+    base = os.path.join(shard_dir, f"shard_{shard_id:03d}")
+    return base + ".f32", base + "_meta.jsonl", base + ".json"
+
+
+def _load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_map(
+    args: argparse.Namespace,
+    normalized_root: str,
+    shard_dir: str,
+    logger: logging.Logger,
+) -> int:
+    """
+    Encodiert den Anteil dieses Shards. Jeder Shard liest den ganzen Korpus
+    (nur Parsen), zählt alle Chunks und bildet einen Fingerprint über alle
+    chunk_uids, damit reduce prüfen kann, dass alle Shards denselben Stand sahen.
+    """
+    num_shards, shard_id = int(args.num_shards), int(args.shard_id)
+    vec_path, meta_path, manifest_path = _shard_paths(shard_dir, shard_id)
+    if _load_manifest(manifest_path) is not None and not args.overwrite_shard:
+        logger.info("Shard %d ist bereits fertig (%s) – übersprungen.", shard_id, manifest_path)
+        return 0
+
+    texts: List[str] = []
+    records: List[Dict[str, Any]] = []
+    seen_uids: set = set()
+    corpus_chunks = 0
+    corpus_fingerprint = 0
+    for seq, (text, meta) in enumerate(
+        iter_chunks(
+            normalized_root,
+            logger,
+            max_chunks=args.max_chunks,
+            exclude_unknown=bool(args.exclude_unknown),
+            parse_workers=args.parse_workers,
+        )
+    ):
+        key = uid_key(meta["chunk_uid"])
+        corpus_chunks += 1
+        corpus_fingerprint = (corpus_fingerprint + key) & _U64
+        if key % num_shards != shard_id:
+            continue
+        # gleiche chunk_uid -> gleicher Shard, der Duplikat-Check hier ist also global
+        if key in seen_uids:
+            logger.error("Doppelte chunk_uid: %s", meta["chunk_uid"])
+            return 1
+        seen_uids.add(key)
+        texts.append(text)
+        records.append({"seq": seq, "text_sha1": text_sha1(text), **meta})
+
+    logger.info("Shard %d/%d: %d von %d Chunks.", shard_id, num_shards, len(texts), corpus_chunks)
+
+    dim = 0
+    os.makedirs(shard_dir, exist_ok=True)
+    if texts:
+        try:
+            model = load_encoder(args, logger)
+        except Exception as exc:
+            logger.error("Konnte SentenceTransformer-Modell nicht laden: %s", exc)
+            return 1
+        embeddings = np.ascontiguousarray(encode_texts(model, texts, args, logger), dtype="float32")
+        dim = int(embeddings.shape[1])
+        embeddings.tofile(vec_path + ".tmp")
+    else:
+        open(vec_path + ".tmp", "wb").close()
+    os.replace(vec_path + ".tmp", vec_path)
+
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    os.replace(meta_path + ".tmp", meta_path)
+
+    manifest = {
+        "shard_id": shard_id,
+        "num_shards": num_shards,
+        "num_vectors": len(records),
+        "embedding_dim": dim,
+        "model_name": args.model_name,
+        "normalized": bool(args.normalize),
+        "corpus_chunks": corpus_chunks,
+        "corpus_fingerprint": f"{corpus_fingerprint:016x}",
+        "encode": getattr(args, "encode_stats", None),
+        "finished": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    logger.info("Shard %d geschrieben: %s", shard_id, manifest_path)
+    return 0
+
+
+def _iter_shard_records(meta_path: str, shard_id: int) -> Iterator[Tuple[int, int, int, Dict[str, Any]]]:
+    """(seq, shard_id, Zeile im Shard, Meta) in Shard-Reihenfolge (seq aufsteigend)."""
+    with open(meta_path, "r", encoding="utf-8") as f:
+        for row, line in enumerate(f):
+            rec = json.loads(line)
+            yield int(rec.pop("seq")), shard_id, row, rec
+
+
+def check_shards(
+    num_shards: int, shard_dir: str, logger: logging.Logger
+) -> Optional[List[Dict[str, Any]]]:
+    """Lädt und prüft alle Manifeste; None, wenn etwas fehlt oder nicht zusammenpasst."""
+    manifests: List[Dict[str, Any]] = []
+    missing: List[int] = []
+    for shard_id in range(num_shards):
+        vec_path, meta_path, manifest_path = _shard_paths(shard_dir, shard_id)
+        manifest = _load_manifest(manifest_path)
+        if manifest is None or not os.path.isfile(meta_path):
+            missing.append(shard_id)
+            continue
+        expected_size = int(manifest["num_vectors"]) * int(manifest["embedding_dim"]) * 4
+        if not os.path.isfile(vec_path) or os.path.getsize(vec_path) != expected_size:
+            logger.error("Shard %d: Vektordatei fehlt oder hat falsche Größe.", shard_id)
+            missing.append(shard_id)
+            continue
+        manifests.append(manifest)
+
+    if missing:
+        ids = ",".join(str(i) for i in missing)
+        logger.error(
+            "Fehlende/unvollständige Shards: %s – neu starten z.B. mit: sbatch --array=%s jobs/embed_chunks_map.slurm",
+            ids,
+            ids,
+        )
+        return None
+
+    ref = manifests[0]
+    for key in ("num_shards", "model_name", "normalized", "corpus_chunks", "corpus_fingerprint"):
+        values = {str(m.get(key)) for m in manifests}
+        if len(values) > 1:
+            logger.error("Shards inkonsistent bei '%s': %s (Korpus zwischen den Map-Tasks geändert?)", key, sorted(values))
+            return None
+    if int(ref["num_shards"]) != num_shards:
+        logger.error("Shards wurden mit num_shards=%s erzeugt, reduce läuft mit %d.", ref["num_shards"], num_shards)
+        return None
+    dims = {int(m["embedding_dim"]) for m in manifests if int(m["num_vectors"]) > 0}
+    if len(dims) != 1:
+        logger.error("Shards haben unterschiedliche bzw. keine Dimensionen: %s", sorted(dims))
+        return None
+    total = sum(int(m["num_vectors"]) for m in manifests)
+    if total != int(ref["corpus_chunks"]):
+        logger.error("Shards enthalten %d Vektoren, der Korpus hat %d Chunks.", total, ref["corpus_chunks"])
+        return None
+    return manifests
+
+
+def run_reduce(
+    args: argparse.Namespace,
+    index_params: Dict[str, Any],
+    indices_root: str,
+    index_path: str,
+    meta_path: str,
+    config_path: str,
+    workspace_root: str,
+    shard_dir: str,
+    logger: logging.Logger,
+) -> int:
+    """
+    Führt alle Shards zusammen. Die Meta-Dateien werden per k-Wege-Merge über
+    die Korpus-Position (seq) gelesen, dadurch entsprechen die faiss_ids genau
+    einem Einzellauf; Vektoren werden blockweise aus den Shard-Dateien
+    (np.memmap) in den Embedding-Store kopiert.
+    """
+    num_shards = int(args.num_shards)
+    manifests = check_shards(num_shards, shard_dir, logger)
+    if manifests is None:
+        return 1
+
+    ref = manifests[0]
+    dim = next(int(m["embedding_dim"]) for m in manifests if int(m["num_vectors"]) > 0)
+    if args.model_name != ref["model_name"] or bool(args.normalize) != bool(ref["normalized"]):
+        logger.warning(
+            "CLI (model=%s, normalize=%s) weicht von den Shards ab – verwende die Shard-Werte.",
+            args.model_name,
+            args.normalize,
+        )
+    args.model_name = ref["model_name"]
+    args.normalize = bool(ref["normalized"])
+    use_ip = bool(args.normalize)
+
+    shard_vecs: Dict[int, np.ndarray] = {}
+    iterators = []
+    for m in manifests:
+        sid = int(m["shard_id"])
+        vec_path, shard_meta_path, _ = _shard_paths(shard_dir, sid)
+        if int(m["num_vectors"]) > 0:
+            shard_vecs[sid] = np.memmap(vec_path, dtype="float32", mode="r", shape=(int(m["num_vectors"]), dim))
+        iterators.append(_iter_shard_records(shard_meta_path, sid))
+
+    os.makedirs(indices_root, exist_ok=True)
+    store = EmbeddingStoreWriter(indices_root, dim)
+    meta_tmp = meta_path + ".tmp"
+    seen_uids: set = set()
+    block: List[Tuple[int, int, Dict[str, Any]]] = []
+    expected_seq = 0
+
+    def _flush(meta_f: Any) -> None:
+        vecs = np.empty((len(block), dim), dtype="float32")
+        by_shard: Dict[int, List[int]] = {}
+        for pos, (sid, row, _) in enumerate(block):
+            by_shard.setdefault(sid, []).append(pos)
+        for sid, positions in by_shard.items():
+            rows = np.asarray([block[p][1] for p in positions], dtype=np.int64)
+            vecs[np.asarray(positions, dtype=np.int64)] = shard_vecs[sid][rows]
+        uids = [rec["chunk_uid"] for _, _, rec in block]
+        store.append(vecs, uids, [rec.pop("text_sha1") for _, _, rec in block])
+        base = store.num_vectors - len(block)
+        for i, (_, _, rec) in enumerate(block):
+            meta_f.write(json.dumps({"faiss_id": base + i, **rec}, ensure_ascii=False) + "\n")
+        block.clear()
+
+    try:
+        with open(meta_tmp, "w", encoding="utf-8") as meta_f:
+            for seq, sid, row, rec in heapq.merge(*iterators):
+                if seq != expected_seq:
+                    raise ValueError(f"Korpus-Position {expected_seq} fehlt bzw. doppelt (Shard {sid}, seq {seq}).")
+                expected_seq += 1
+                key = uid_key(rec["chunk_uid"])
+                if key in seen_uids:
+                    raise ValueError(f"doppelte chunk_uid: {rec['chunk_uid']}")
+                seen_uids.add(key)
+                block.append((sid, row, rec))
+                if len(block) >= args.stream_batch_size:
+                    _flush(meta_f)
+            if block:
+                _flush(meta_f)
+    except Exception as exc:
+        logger.error("Reduce abgebrochen: %s", exc)
+        store.abort()
+        if os.path.exists(meta_tmp):
+            os.remove(meta_tmp)
+        return 1
+
+    if expected_seq != int(ref["corpus_chunks"]):
+        logger.error("Reduce: %d von %d Chunks gefunden.", expected_seq, ref["corpus_chunks"])
+        store.abort()
+        os.remove(meta_tmp)
+        return 1
+
+    index = build_faiss_index(store.tmp_vectors(), use_inner_product=use_ip, logger=logger, params=index_params)
+    faiss.write_index(index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    logger.info("FAISS-Index in %s gespeichert.", index_path)
+    os.replace(meta_tmp, meta_path)
+    logger.info("Metadaten nach %s geschrieben (%d Zeilen).", meta_path, expected_seq)
+    logger.info("Meta-Store nach %s geschrieben.", build_from_jsonl(meta_path))
+    store.commit(args.model_name, bool(args.normalize), logger)
+
+    stats = [m.get("encode") for m in manifests if m.get("encode")]
+    if stats:
+        # Summe der Shard-Laufzeiten (CPU-/GPU-Zeit, nicht Wall-Clock des Arrays)
+        sentences = sum(int(st["sentences"]) for st in stats)
+        seconds = sum(float(st["seconds"]) for st in stats)
+        args.encode_stats = {
+            "sentences": sentences,
+            "seconds": round(seconds, 3),
+            "sentences_per_s": round(sentences / max(1e-6, seconds), 1),
+        }
+
+    save_index_config(
+        config_path=config_path,
+        workspace_root=workspace_root,
+        index_path=index_path,
+        meta_path=meta_path,
+        args=args,
+        num_vecs=expected_seq,
+        dim=dim,
+        use_inner_product=use_ip,
+        logger=logger,
+        index=index,
+        index_params=index_params,
+    )
+
+    if args.cleanup_shards:
+        for sid in range(num_shards):
+            for path in _shard_paths(shard_dir, sid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        logger.info("Shard-Dateien entfernt: %s", shard_dir)
+
+    logger.info(
+        "Fertig (Reduce, %d Shards). Vektoren: %d, Index: %s, Meta: %s, Config: %s",
+        num_shards,
+        expected_seq,
+        index_path,
+        meta_path,
+        config_path,
+    )
+    return 0
+
+
 def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Erzeuge FAISS-Index aus semantisch annotierten Chunks (Embeddings)."
@@ -475,6 +1762,133 @@ def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
         default="contextual_config.json",
         help="Dateiname für die Index-Konfiguration unter indices/faiss/.",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Nur neue/geänderte Chunks encodieren, Rest aus dem Embedding-Store übernehmen.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Chunks blockweise lesen/encodieren und direkt an Index/Store/Meta anhängen (Speicher O(Block)).",
+    )
+    parser.add_argument(
+        "--stream-batch-size",
+        type=int,
+        default=4096,
+        help="Anzahl Chunks pro Block im Streaming-Modus.",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=1,
+        help="Anzahl Prozesse zum Parsen/Filtern der semantic/json-Dateien (1 = seriell).",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=("single", "map", "reduce"),
+        default="single",
+        help="single (Default), map (ein Shard pro Array-Task) oder reduce (Shards zusammenführen).",
+    )
+    parser.add_argument("--num-shards", type=int, default=None, help="Anzahl Shards für map/reduce.")
+    parser.add_argument(
+        "--shard-id",
+        type=int,
+        default=None,
+        help="Shard für --mode map (Default: SLURM_ARRAY_TASK_ID).",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        default=None,
+        help=f"Verzeichnis der Shard-Dateien (Default: indices/faiss/{SHARD_SUBDIR}).",
+    )
+    parser.add_argument(
+        "--overwrite-shard",
+        action="store_true",
+        help="map: fertigen Shard trotzdem neu berechnen.",
+    )
+    parser.add_argument(
+        "--cleanup-shards",
+        action="store_true",
+        help="reduce: Shard-Dateien nach erfolgreichem Zusammenführen löschen.",
+    )
+    parser.add_argument(
+        "--no-bm25",
+        action="store_true",
+        help="Keinen lexikalischen BM25-Index (bm25/) neben dem FAISS-Index bauen.",
+    )
+    parser.add_argument(
+        "--no-doc-index",
+        action="store_true",
+        help="Keinen Dokument-Index (doc_index/, Zentroide je doc_id) für die zweistufige Suche bauen.",
+    )
+    parser.add_argument(
+        "--keep-generations",
+        type=int,
+        default=DEFAULT_KEEP,
+        help="Anzahl Index-Generationen, die nach dem Veröffentlichen erhalten bleiben.",
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        default=0,
+        help="Nur mit --device cpu: Anzahl Worker-Prozesse für das Encoding (0/1 = ein Prozess).",
+    )
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=None,
+        help="Torch-Threads pro CPU-Worker (Default: verfügbare CPUs / --cpu-workers).",
+    )
+    parser.add_argument(
+        "--cpu-chunk-size",
+        type=int,
+        default=None,
+        help="Texte pro Paket an einen CPU-Worker (Default: 4 x --batch-size).",
+    )
+    parser.add_argument(
+        "--embedding-config",
+        default=DEFAULT_EMBEDDING_CONFIG,
+        help="Embedding-Config (index_type, index_params) als Default für die Index-Optionen.",
+    )
+    parser.add_argument(
+        "--index-type",
+        default=None,
+        help=f"Index-Typ: {', '.join(INDEX_TYPES)} (Default: index_type aus --embedding-config, sonst flat).",
+    )
+    parser.add_argument("--nlist", type=int, default=None, help="IVF: Anzahl Listen (Default: ~4*sqrt(N)).")
+    parser.add_argument("--pq-m", dest="pq_m", type=int, default=None, help="IVF-PQ: Anzahl Subquantisierer.")
+    parser.add_argument("--pq-nbits", dest="pq_nbits", type=int, default=None, help="IVF-PQ: Bits pro Code.")
+    parser.add_argument("--hnsw-m", dest="hnsw_m", type=int, default=None, help="HNSW: Nachbarn pro Knoten (M).")
+    parser.add_argument(
+        "--ef-construction", dest="ef_construction", type=int, default=None, help="HNSW: efConstruction."
+    )
+    parser.add_argument(
+        "--ef-search", dest="ef_search", type=int, default=None, help="HNSW: efSearch (Anfragezeit)."
+    )
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF: nprobe (Anfragezeit).")
+    parser.add_argument(
+        "--storage",
+        choices=STORAGE_TYPES,
+        default=None,
+        help="Kodierung der Vektoren im Index: float32, fp16 oder sq8 (Default: float32).",
+    )
+    parser.add_argument(
+        "--reduce",
+        choices=REDUCE_TYPES,
+        default=None,
+        help="Dimensionsreduktion vor dem Index (pca oder opq, benötigt --reduce-dim).",
+    )
+    parser.add_argument(
+        "--reduce-dim", dest="reduce_dim", type=int, default=None, help="Zieldimension für --reduce."
+    )
+    parser.add_argument(
+        "--train-sample",
+        dest="train_sample",
+        type=int,
+        default=None,
+        help="IVF: Anzahl Vektoren für das Training (Stichprobe).",
+    )
     return parser.parse_args(argv)
 
 
@@ -483,23 +1897,158 @@ def main(argv: List[str] | None = None) -> int:
 
     workspace_root = os.path.abspath(args.workspace_root)
     normalized_root = os.path.join(workspace_root, "semantic", "json")
-    indices_root = os.path.join(workspace_root, "indices", "faiss")
-    index_path = os.path.join(indices_root, args.index_name)
-    meta_path = os.path.join(indices_root, args.meta_name)
-    config_path = os.path.join(indices_root, args.config_name)
+    base_root = os.path.join(workspace_root, "indices", "faiss")
 
     logger = setup_logging(workspace_root)
     logger.info("Workspace-Root: %s", workspace_root)
     logger.info("Semantic Root: %s", normalized_root)
+
+    try:
+        index_params = resolve_index_params(args, load_embedding_config(args.embedding_config))
+    except ValueError as exc:
+        logger.error("%s", exc)
+        return 1
+    logger.info("Index-Parameter: %s", index_params)
+
+    if args.mode in ("map", "reduce"):
+        if args.incremental or args.streaming:
+            logger.error("--mode %s kann nicht mit --incremental/--streaming kombiniert werden.", args.mode)
+            return 1
+        if not args.num_shards or args.num_shards <= 0:
+            logger.error("--mode %s benötigt --num-shards > 0.", args.mode)
+            return 1
+        args.shard_dir = os.path.abspath(args.shard_dir or os.path.join(base_root, SHARD_SUBDIR))
+        if args.mode == "map":
+            if args.shard_id is None:
+                env_id = os.environ.get("SLURM_ARRAY_TASK_ID")
+                args.shard_id = int(env_id) if env_id is not None else None
+            if args.shard_id is None or not 0 <= args.shard_id < args.num_shards:
+                logger.error("--shard-id muss in [0, %d] liegen (oder SLURM_ARRAY_TASK_ID).", args.num_shards - 1)
+                return 1
+            logger.info("Mode=map shard=%d/%d -> %s", args.shard_id, args.num_shards, args.shard_dir)
+            return run_map(args, normalized_root, args.shard_dir, logger)
+
+    # Neue Generation bauen; der bisherige Stand bleibt bis zum Umschalten lesbar
+    try:
+        previous_root = resolve_index_dir(base_root)
+    except FileNotFoundError as exc:
+        logger.warning("%s – inkrementelle Wiederverwendung nicht möglich.", exc)
+        previous_root = base_root
+    indices_root = create_generation(base_root)
+    logger.info("Neue Index-Generation: %s", indices_root)
+
+    rc = build_generation(args, index_params, normalized_root, workspace_root, indices_root, previous_root, logger)
+    if rc != 0:
+        logger.error("Build fehlgeschlagen – Generation %s wird verworfen.", os.path.basename(indices_root))
+        shutil.rmtree(indices_root, ignore_errors=True)
+        return rc
+
+    if not args.no_bm25:
+        try:
+            bm25_header = build_bm25_for_generation(
+                indices_root,
+                normalized_root,
+                meta_name=args.meta_name,
+                exclude_unknown=bool(args.exclude_unknown),
+                parse_workers=args.parse_workers,
+            )
+            logger.info(
+                "BM25-Index gebaut: %d/%d Chunks, %d Terme, %.1fs.",
+                bm25_header["indexed_docs"],
+                bm25_header["num_docs"],
+                bm25_header["num_terms"],
+                bm25_header["build_seconds"],
+            )
+        except Exception as exc:
+            # Dense-Index bleibt nutzbar; BM25 lässt sich mit scripts/bm25_index.py nachbauen
+            logger.error("BM25-Index konnte nicht gebaut werden: %s", exc)
+
+    if not args.no_doc_index:
+        try:
+            doc_header = build_doc_index_for_generation(
+                indices_root, meta_name=args.meta_name, config_name=args.config_name
+            )
+            logger.info(
+                "Dokument-Index gebaut: %d Dokumente (%d zusammenhängend), %.1fs.",
+                doc_header["num_docs"],
+                doc_header["contiguous_docs"],
+                doc_header["build_seconds"],
+            )
+        except Exception as exc:
+            logger.error("Dokument-Index konnte nicht gebaut werden: %s", exc)
+
+    with open(os.path.join(indices_root, args.config_name), "r", encoding="utf-8") as f:
+        num_vectors = int(json.load(f).get("num_vectors", 0))
+    write_manifest(indices_root, extra={"num_vectors": num_vectors})
+    publish_generation(base_root, os.path.basename(indices_root))
+    logger.info("CURRENT zeigt jetzt auf %s", indices_root)
+    removed = gc_generations(base_root, keep=args.keep_generations)
+    if removed:
+        logger.info("Alte Index-Generationen gelöscht: %s", ", ".join(removed))
+    return 0
+
+
+def build_generation(
+    args: argparse.Namespace,
+    index_params: Dict[str, Any],
+    normalized_root: str,
+    workspace_root: str,
+    indices_root: str,
+    previous_root: str,
+    logger: logging.Logger,
+) -> int:
+    """Baut Index, Meta, Embedding-Store und Config in das Generationsverzeichnis indices_root."""
+    index_path = os.path.join(indices_root, args.index_name)
+    meta_path = os.path.join(indices_root, args.meta_name)
+    config_path = os.path.join(indices_root, args.config_name)
     logger.info("Index wird geschrieben nach: %s", index_path)
     logger.info("Metadaten werden geschrieben nach: %s", meta_path)
     logger.info("Config wird geschrieben nach: %s", config_path)
 
+    if args.mode == "reduce":
+        shard_dir = args.shard_dir
+        logger.info("Mode=reduce num_shards=%d aus %s", args.num_shards, shard_dir)
+        return run_reduce(
+            args,
+            index_params,
+            indices_root,
+            index_path,
+            meta_path,
+            config_path,
+            workspace_root,
+            shard_dir,
+            logger,
+        )
+
+    if args.streaming:
+        if args.incremental:
+            logger.error("--streaming und --incremental können nicht kombiniert werden.")
+            return 1
+        logger.info(
+            "Starte Streaming-Embedding mit Modell '%s' auf Gerät '%s' (Blockgröße %d).",
+            args.model_name,
+            args.device,
+            args.stream_batch_size,
+        )
+        return embed_streaming(
+            lambda: load_encoder(args, logger),
+            args,
+            index_params,
+            normalized_root,
+            indices_root,
+            index_path,
+            meta_path,
+            config_path,
+            workspace_root,
+            logger,
+        )
+
     texts, metas, chunk_ids = collect_chunks(
         normalized_root=normalized_root,
         logger=logger,
         max_chunks=args.max_chunks,
         exclude_unknown=bool(args.exclude_unknown),
+        parse_workers=args.parse_workers,
     )
 
     if not texts:
@@ -521,38 +2070,31 @@ def main(argv: List[str] | None = None) -> int:
         args.device,
     )
     try:
-        model = SentenceTransformer(args.model_name, device=args.device)
+        model = load_encoder(args, logger)
     except Exception as exc:
         logger.error("Konnte SentenceTransformer-Modell nicht laden: %s", exc)
         return 1
 
-    try:
-        embeddings = model.encode(
-            texts,
-            batch_size=args.batch_size,
-            convert_to_numpy=True,
-            show_progress_bar=True,
-            normalize_embeddings=args.normalize,
-        )
-    except TypeError:
-        logger.warning(
-            "SentenceTransformer.encode unterstützt 'normalize_embeddings' nicht, "
-            "normalisiere manuell."
-        )
-        embeddings = model.encode(
+    if args.incremental:
+        # Wiederverwendung aus der aktuell veröffentlichten Generation
+        embeddings, hashes, chunk_ids, metas = encode_incremental(
+            model,
             texts,
-            batch_size=args.batch_size,
-            convert_to_numpy=True,
-            show_progress_bar=True,
+            metas,
+            chunk_ids,
+            args,
+            previous_root,
+            os.path.join(previous_root, args.meta_name),
+            logger,
         )
-        if args.normalize:
-            norms = np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
-            embeddings = embeddings / norms
+    else:
+        embeddings = encode_texts(model, texts, args, logger)
+        hashes = [text_sha1(t) for t in texts]
 
     logger.info("Embeddings erstellt: Shape = %s", embeddings.shape)
 
     use_ip = bool(args.normalize)
-    index = build_faiss_index(embeddings, use_inner_product=use_ip, logger=logger)
+    index = build_faiss_index(embeddings, use_inner_product=use_ip, logger=logger, params=index_params)
 
     if index.ntotal != len(metas):
         logger.error(
@@ -567,15 +2109,21 @@ def main(argv: List[str] | None = None) -> int:
     logger.info("FAISS-Index in %s gespeichert.", index_path)
 
     save_meta_lines(meta_path, metas, logger)
+    save_embedding_store(
+        indices_root, embeddings, chunk_ids, hashes, args.model_name, bool(args.normalize), logger
+    )
     save_index_config(
         config_path=config_path,
         workspace_root=workspace_root,
         index_path=index_path,
         meta_path=meta_path,
         args=args,
-        embeddings=embeddings,
+        num_vecs=int(embeddings.shape[0]),
+        dim=int(embeddings.shape[1]),
         use_inner_product=use_ip,
         logger=logger,
+        index=index,
+        index_params=index_params,
     )
 
     logger.info(
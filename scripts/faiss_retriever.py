@@ -8,19 +8,39 @@ Retrieval von Nachbar-Chunks auf Basis von chunk_id (oder chunk_uid).
 Wird später aus annotate_semantics.py / generate_qa_candidates.py verwendet,
 um ähnliche Chunks für Kontext hinzuziehen.
 
+Freitext-Anfragen (search_text) werden mit dem Modell aus contextual_config.json
+kodiert (sentence-transformers, beim ersten Aufruf auf CPU geladen); Embeddings
+und Ergebnisse werden pro normalisiertem Text in LRU-Caches gehalten.
+search_hybrid() kombiniert das mit dem BM25-Index der Generation (bm25/, siehe
+scripts/bm25_index.py) per Reciprocal-Rank-Fusion – für exakte Bezeichner.
+Mit top_docs=D wird zweistufig gesucht: erst die D ähnlichsten Dokumente über
+deren Zentroide (doc_index/, siehe scripts/doc_index.py), dann exakt nur über
+deren Chunks (ein vorhandener kNN-Graph wird dabei nicht benutzt).
+Mit threshold=s liefert die Nachbarsuche alle Treffer mit Score mindestens s
+(IP) bzw. Distanz höchstens s (L2), höchstens top_k (index.range_search).
+
 Beispiel (CLI-Test):
 
   python scripts/faiss_retriever.py \
       --workspace-root /beegfs/scratch/workspace/es_phdoeble-rag_pipeline \
       --chunk-id SOME_CHUNK_ID_OR_UID \
       --top-k 5
+
+  python scripts/faiss_retriever.py --workspace-root <ws> --query "Wie wird X konfiguriert?" [--hybrid]
 """
 
 import argparse
 import json
+import logging
 import os
 import sys
-from typing import Any, Dict, List
+import threading
+import time
+import unicodedata
+from collections.abc import Mapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 import numpy as np
 
@@ -30,12 +50,229 @@ except ImportError as e:
     print("Fehler: 'faiss' ist nicht installiert. (pip install faiss-cpu oder faiss-gpu)", file=sys.stderr)
     raise e
 
+try:
+    from sentence_transformers import SentenceTransformer  # type: ignore
+except ImportError:  # pragma: no cover
+    SentenceTransformer = None  # type: ignore
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.bm25_index import DEFAULT_BUDGET_MS, BM25Index, load_bm25_index  # type: ignore
+from scripts.doc_index import DocIndex, load_doc_index  # type: ignore
+from scripts.knn_graph import KnnGraph, index_fingerprint, load_knn_graph  # type: ignore
+from scripts.index_generations import (  # type: ignore
+    acquire_reader_lease,
+    load_manifest,
+    resolve_index_dir,
+    verify_generation,
+)
+from scripts.meta_filter import MetaFilter  # type: ignore
+from scripts.meta_store import MetaStore, store_dir_for  # type: ignore
+
+logger = logging.getLogger("faiss_retriever")
+
+# Zeilen pro index.search()-Aufruf bei Batch-Anfragen (begrenzt Distanz-/Ergebnismatrizen)
+SEARCH_BATCH_SIZE = 1024
+# Metadaten-Filter: kompilierte Bitmaps im Cache; bei Flat-Indizes mit bis zu
+# EXACT_SEARCH_MAX zulässigen Vektoren wird nur über diese gesucht (faiss.knn)
+FILTER_CACHE_SIZE = 32
+EXACT_SEARCH_MAX = 4096
+# Freitext-Anfragen: LRU-Caches (Einträge) und Batchgröße beim Kodieren
+QUERY_CACHE_SIZE = 4096
+RESULT_CACHE_SIZE = 1024
+QUERY_BATCH_SIZE = 64
+# Hybrid-Suche: Kandidaten je Liste (Vielfaches von top_k) und RRF-Konstante k
+HYBRID_CANDIDATES_FACTOR = 4
+RRF_K = 60
+
+
+def memory_usage_mb() -> Dict[str, float]:
+    """
+    RSS des Prozesses in MB, aufgeteilt in privat (RssAnon) und dateigestützt
+    (RssFile, z.B. gemappter Index – teilbar mit anderen Prozessen).
+    """
+    usage: Dict[str, float] = {}
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile"):
+                    usage[key] = int(value.split()[0]) / 1024.0
+    except OSError:
+        import resource
+
+        usage["VmRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return usage
+
+
+def read_index(index_path: str, mmap: bool, ivf: bool) -> Tuple["faiss.Index", bool]:
+    """
+    Liest den Index, mit mmap=True gemappt statt kopiert:
+    - IVF: IO_FLAG_MMAP (invertierte Listen als OnDiskInvertedLists direkt aus der Datei)
+    - Flat/SQ/HNSW: IO_FLAG_MMAP_IFC (Codes von IndexFlatCodes aus der Datei)
+    Klappt das nicht (ältere FAISS-Version, Index-Typ), wird normal gelesen.
+    Rückgabe: (Index, tatsächlich gemappt)
+    """
+    if mmap:
+        flag_name = "IO_FLAG_MMAP" if ivf else "IO_FLAG_MMAP_IFC"
+        flag = getattr(faiss, flag_name, None)
+        if flag is not None:
+            try:
+                return faiss.read_index(index_path, flag | faiss.IO_FLAG_READ_ONLY), True
+            except RuntimeError as exc:
+                logger.warning("mmap-Laden (%s) nicht möglich, lese Index komplett: %s", flag_name, exc)
+    return faiss.read_index(index_path), False
+
+
+def normalize_query_text(text: str) -> str:
+    """Cache-Schlüssel einer Anfrage: Unicode NFC, Whitespace zusammengefasst (Groß-/Kleinschreibung bleibt)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def _cache_get(cache: Dict[Any, Any], key: Any) -> Any:
+    """LRU-Zugriff auf einen Dict-Cache (Treffer wandert ans Ende); None bei Fehlschlag."""
+    value = cache.pop(key, None)
+    if value is not None:
+        cache[key] = value
+    return value
+
+
+def _cache_put(cache: Dict[Any, Any], key: Any, value: Any, size: int) -> None:
+    cache.pop(key, None)
+    cache[key] = value
+    while len(cache) > size:
+        cache.pop(next(iter(cache)))
+
+
+@contextmanager
+def omp_threads(num_threads: Optional[int]) -> Iterator[None]:
+    """Setzt die OpenMP-Threads von FAISS für die Dauer des Blocks (None/0 = unverändert)."""
+    if not num_threads or num_threads <= 0:
+        yield
+        return
+    previous = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(int(num_threads))
+    try:
+        yield
+    finally:
+        faiss.omp_set_num_threads(previous)
+
+
+class NeighborHit(Mapping):
+    """
+    Ein Treffer der Nachbarsuche: faiss_id, score, chunk_id und doc_id direkt
+    (aus ids.bin des Meta-Stores, ohne JSON), alle übrigen Metadaten erst beim
+    Zugriff – Kategorie-/Listenfelder aus den Spalten, der Rest aus dem einmal
+    geparsten Blob bzw. dem JSONL-Record (ohne Kopie). Verhält sich lesend wie
+    das frühere Metadaten-Dict (hit["language"], hit.get(...), dict(hit));
+    gesetzte Felder (z.B. dense_score) landen in einem eigenen Dict.
+    """
+
+    __slots__ = ("faiss_id", "score", "chunk_id", "doc_id", "_meta", "_rec", "_extra")
+
+    def __init__(self, faiss_id: int, score: float, meta: Any) -> None:
+        self.faiss_id = faiss_id
+        self.score = score
+        self._meta = meta
+        self._rec: Optional[Dict[str, Any]] = None
+        self._extra: Optional[Dict[str, Any]] = None
+        ids = meta.ids(faiss_id) if isinstance(meta, MetaStore) else None
+        if ids is not None:
+            self.chunk_id, self.doc_id = ids
+        else:
+            rec = self._record()
+            self.chunk_id, self.doc_id = rec.get("chunk_id"), rec.get("doc_id")
+
+    def _record(self) -> Dict[str, Any]:
+        """Blob-Felder (Meta-Store) bzw. der JSONL-Record; einmal gelesen, geteilt."""
+        if self._rec is None:
+            if isinstance(self._meta, MetaStore):
+                self._rec = self._meta.blob_record(self.faiss_id)
+            else:
+                self._rec = self._meta[self.faiss_id]
+        return self._rec
+
+    def __getitem__(self, key: str) -> Any:
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        if key == "score":
+            return self.score
+        if key == "faiss_id":
+            return self.faiss_id
+        if key == "chunk_id" and self.chunk_id is not None:
+            return self.chunk_id
+        if key == "doc_id" and self.doc_id is not None:
+            return self.doc_id
+        if isinstance(self._meta, MetaStore):
+            # Spaltenfelder stehen nicht im Blob
+            found, value = self._meta.column_value(self.faiss_id, key)
+            if found:
+                return value
+        rec = self._record()
+        if key in rec:
+            return rec[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.to_dict())
+
+    def __len__(self) -> int:
+        return len(self.to_dict())
+
+    def __repr__(self) -> str:
+        return f"NeighborHit(faiss_id={self.faiss_id}, score={self.score:.4f}, chunk_id={self.chunk_id!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Vollständiges Dict wie früher: alle Metadaten plus score und faiss_id."""
+        if isinstance(self._meta, MetaStore):
+            rec = self._meta.add_columns(self.faiss_id, {"faiss_id": self.faiss_id, **self._record()})
+        else:
+            rec = dict(self._record())
+        rec["score"] = self.score
+        rec["faiss_id"] = self.faiss_id
+        if self._extra:
+            rec.update(self._extra)
+        return rec
+
+    def copy(self) -> "NeighborHit":
+        """Flache Kopie; Metadaten werden geteilt, gesetzte Felder nicht."""
+        hit = NeighborHit.__new__(NeighborHit)
+        for slot in NeighborHit.__slots__:
+            setattr(hit, slot, getattr(self, slot))
+        hit._extra = dict(self._extra) if self._extra else None
+        return hit
+
+
+class _CompiledFilter:
+    """Kompilierter Metadaten-Filter: Bitmap (Bit i = faiss_id i zulässig) für IDSelectorBitmap."""
+
+    def __init__(self, mask: np.ndarray) -> None:
+        self.bitmap = np.packbits(mask, bitorder="little")
+        self.count = int(mask.sum())
+        self.ids: Optional[np.ndarray] = np.flatnonzero(mask) if self.count <= EXACT_SEARCH_MAX else None
+
+    def admits(self, faiss_ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(faiss_ids, dtype="int64")
+        valid = ids >= 0
+        safe = np.where(valid, ids, 0)
+        return valid & ((self.bitmap[safe >> 3] >> (safe & 7)) & 1).astype(bool)
+
 
 class FaissRetriever:
     """
     Kapselt:
     - Laden des FAISS-Index
-    - Laden der JSONL-Metadaten
+    - Metadaten: bevorzugt der gemappte Meta-Store (contextual_meta.store/,
+      siehe scripts/meta_store.py), sonst wie früher die JSONL-Metadaten
     - Mapping chunk_id/chunk_uid -> faiss_id (Indexposition)
     - Nachbarschaftssuche pro Chunk
     """
@@ -45,23 +282,152 @@ class FaissRetriever:
         workspace_root: str,
         index_name: str = "contextual.index",
         meta_name: str = "contextual_meta.jsonl",
+        indices_root: Optional[str] = None,
+        config_name: str = "contextual_config.json",
+        mmap: bool = True,
+        use_knn_graph: bool = True,
+        query_model: Optional[str] = None,
+        query_device: str = "cpu",
     ) -> None:
+        """
+        indices_root: optional abweichendes Index-Verzeichnis (z.B. node-lokale
+        Kopie aus scripts/node_staging.py); Default: aktuelle Generation unter
+        <workspace_root>/indices/faiss (siehe scripts/index_generations.py).
+        config_name: Index-Konfiguration aus embed_chunks.py (nprobe/efSearch,
+        Pfad zur Vektordatei); fehlt sie, gelten die Werte aus der Indexdatei.
+        mmap: Index per mmap laden, sodass Prozesse auf demselben Knoten sich den
+        Page-Cache teilen (siehe read_index()); Ladezeit und RSS werden geloggt.
+        use_knn_graph: Nachbarn aus dem vorberechneten kNN-Graphen beantworten,
+        falls vorhanden und passend (siehe scripts/knn_graph.py).
+        query_model/query_device: Modell für search_text() (Default: model_name
+        aus der Config, also dasselbe wie beim Index-Build) und Gerät.
+        """
+        t0 = time.time()
+        mem0 = memory_usage_mb()
         self.workspace_root = os.path.abspath(workspace_root)
-        self.indices_root = os.path.join(self.workspace_root, "indices", "faiss")
+        self.indices_root = (
+            os.path.abspath(indices_root)
+            if indices_root
+            else resolve_index_dir(os.path.join(self.workspace_root, "indices", "faiss"))
+        )
+        # Generation vor gc_generations schützen: BM25, embedding_store usw. werden erst bei Bedarf geöffnet
+        self.reader_lease = acquire_reader_lease(self.indices_root)
         self.index_path = os.path.join(self.indices_root, index_name)
         self.meta_path = os.path.join(self.indices_root, meta_name)
+        self.config_path = os.path.join(self.indices_root, config_name)
 
         if not os.path.isfile(self.index_path):
             raise FileNotFoundError(f"FAISS-Index nicht gefunden: {self.index_path}")
-        if not os.path.isfile(self.meta_path):
+        self.store_dir = store_dir_for(self.meta_path)
+        has_store = os.path.isfile(os.path.join(self.store_dir, "header.json"))
+        if not has_store and not os.path.isfile(self.meta_path):
             raise FileNotFoundError(f"Metadaten-Datei nicht gefunden: {self.meta_path}")
 
+        # Generation mit Manifest: Dateien müssen vollständig sein (Größenprüfung)
+        self.manifest = load_manifest(self.indices_root)
+        if self.manifest is not None:
+            problems = verify_generation(self.indices_root)
+            if problems:
+                raise RuntimeError(f"Index-Generation {self.indices_root} inkonsistent: {'; '.join(problems)}")
+
+        self.config: Dict[str, Any] = {}
+        if os.path.isfile(self.config_path):
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                self.config = json.load(f)
+
         # Index laden
-        self.index = faiss.read_index(self.index_path)
+        params = self.config.get("index_params") or {}
+        is_ivf = str(params.get("index_type", "")).startswith("ivf") or "IVF" in str(self.config.get("index_type", ""))
+        self.index, self.mmapped = read_index(self.index_path, mmap, is_ivf)
+        self._apply_search_params()
+        if (
+            params.get("reduce")
+            and self.config.get("metric") == "IP"
+            and "L2norm" not in str(params.get("factory", "")).split(",")
+        ):
+            logger.warning(
+                "Index %s: reduce=%s ohne L2norm bei Metrik IP – Scores sind keine Kosinus-Werte "
+                "(similarity_threshold/Range-Suche unzuverlässig); Index neu bauen.",
+                self.index_path,
+                params.get("reduce"),
+            )
+        expected = self.config.get("num_vectors")
+        if expected is not None and int(expected) != self.index.ntotal:
+            raise RuntimeError(
+                f"Index ({self.index.ntotal} Vektoren) passt nicht zur Config ({expected}): {self.indices_root}"
+            )
 
-        # Metadaten laden: positionsstabil per faiss_id
-        self.meta: List[Dict[str, Any]] = [{} for _ in range(self.index.ntotal)]
+        # Exakte Vektoren für Index-Typen, die nicht (verlustfrei) rekonstruieren können
+        self._vectors: Optional[np.ndarray] = None
+        self._is_flat = isinstance(faiss.downcast_index(self.index), faiss.IndexFlat)
+
+        self.meta_store: Optional[MetaStore] = None
+        self.meta: Sequence[Dict[str, Any]]
         self.chunkid_to_faissid: Dict[str, int] = {}
+        if has_store:
+            store = MetaStore(self.store_dir)
+            if len(store) == self.index.ntotal:
+                self.meta_store = store
+                self.meta = store
+            else:
+                logger.warning(
+                    "Meta-Store %s hat %d Zeilen, Index %d – lade JSONL.", self.store_dir, len(store), self.index.ntotal
+                )
+        if self.meta_store is None:
+            self._load_meta_jsonl()
+
+        self._filter_cache: Dict[str, _CompiledFilter] = {}
+
+        # Freitext-Anfragen (search_text): Modell lazy, Caches pro normalisiertem Text
+        self.query_model_name = query_model or self.config.get("model_name")
+        self.query_device = query_device
+        self._query_model: Any = None
+        self._query_lock = threading.Lock()
+        self._embedding_cache: Dict[str, np.ndarray] = {}
+        self._result_cache: Dict[Tuple[str, int, str, str], List[NeighborHit]] = {}
+        self.query_stats = {"queries": 0, "encoded": 0, "embedding_hits": 0, "result_hits": 0}
+
+        self.bm25: Optional[BM25Index] = load_bm25_index(self.indices_root, self.index.ntotal)
+        self.doc_index: Optional[DocIndex] = load_doc_index(
+            self.indices_root, self.index.ntotal, int(self.config.get("embedding_dim") or self.index.d)
+        )
+        self.knn_graph: Optional[KnnGraph] = None
+        if use_knn_graph:
+            self.knn_graph = load_knn_graph(
+                self.indices_root,
+                index_fingerprint(self.indices_root, self.config, self.index.ntotal, index_name),
+            )
+
+        mem1 = memory_usage_mb()
+        self.load_stats: Dict[str, Any] = {
+            "seconds": round(time.time() - t0, 3),
+            "generation": (self.manifest or {}).get("generation"),
+            "mmap": self.mmapped,
+            "meta_store": self.meta_store is not None,
+            "knn_graph_k": self.knn_graph.k if self.knn_graph is not None else None,
+            "bm25": self.bm25 is not None,
+            "doc_index": self.doc_index.num_docs if self.doc_index is not None else None,
+            "rss_mb": round(mem1.get("VmRSS", 0.0), 1),
+            "rss_delta_mb": round(mem1.get("VmRSS", 0.0) - mem0.get("VmRSS", 0.0), 1),
+            "rss_anon_delta_mb": round(mem1.get("RssAnon", 0.0) - mem0.get("RssAnon", 0.0), 1),
+        }
+        logger.info(
+            "FAISS-Retriever geladen in %.1fs (ntotal=%d, mmap=%s, Meta-Store=%s, kNN-Graph k=%s): "
+            "RSS +%.0f MB (privat +%.0f MB), gesamt %.0f MB",
+            self.load_stats["seconds"],
+            self.index.ntotal,
+            self.mmapped,
+            self.load_stats["meta_store"],
+            self.load_stats["knn_graph_k"],
+            self.load_stats["rss_delta_mb"],
+            self.load_stats["rss_anon_delta_mb"],
+            self.load_stats["rss_mb"],
+        )
+
+    def _load_meta_jsonl(self) -> None:
+        """Alter Weg: alle Records als Dicts laden (Indizes ohne Meta-Store)."""
+        # Metadaten laden: positionsstabil per faiss_id
+        self.meta = [{} for _ in range(self.index.ntotal)]
 
         filled = 0
         with open(self.meta_path, "r", encoding="utf-8") as f:
@@ -90,7 +456,7 @@ class FaissRetriever:
                 if chunk_id is None and chunk_uid is None:
                     continue
 
-                self.meta[fid] = rec
+                self.meta[fid] = rec  # type: ignore[index]
                 filled += 1
 
                 # beide Keys unterstützen
@@ -108,6 +474,11 @@ class FaissRetriever:
         """
         Gibt die faiss_id (Indexposition im FAISS-Index) für eine gegebene chunk_id oder chunk_uid zurück.
         """
+        if self.meta_store is not None:
+            fid = self.meta_store.lookup(chunk_id_or_uid)
+            if fid is None:
+                raise KeyError(f"chunk_id/chunk_uid nicht im Index gefunden: {chunk_id_or_uid}")
+            return fid
         try:
             return self.chunkid_to_faissid[chunk_id_or_uid]
         except KeyError as exc:
@@ -119,74 +490,612 @@ class FaissRetriever:
         """
         return self.get_faiss_id_for_chunk(chunk_id_or_uid)
 
+    def _apply_search_params(self) -> None:
+        """nprobe (IVF) und efSearch (HNSW) aus der Index-Konfiguration setzen."""
+        params = self.config.get("index_params") or {}
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None and params.get("nprobe"):
+            ivf.nprobe = int(params["nprobe"])
+        base = faiss.downcast_index(self.index)
+        if isinstance(base, faiss.IndexPreTransform):
+            # PCA/OPQ vor dem eigentlichen Index
+            base = faiss.downcast_index(base.index)
+        hnsw = getattr(base, "hnsw", None)
+        if hnsw is not None and params.get("ef_search"):
+            hnsw.efSearch = int(params["ef_search"])
+
+    def _stored_vectors(self) -> Optional[np.ndarray]:
+        """
+        Vektordatei aus embed_chunks.py (embedding_store.f32, Zeile = faiss_id) als
+        np.memmap; bevorzugt die Kopie neben dem Index (Staging), sonst vectors_path.
+        """
+        if self._vectors is not None:
+            return self._vectors
+        dim = int(self.config.get("embedding_dim") or self.index.d)
+        candidates = [os.path.join(self.indices_root, "embedding_store.f32")]
+        if self.config.get("vectors_path"):
+            candidates.append(str(self.config["vectors_path"]))
+        for path in candidates:
+            if os.path.isfile(path) and os.path.getsize(path) == self.index.ntotal * dim * 4:
+                self._vectors = np.memmap(path, dtype="float32", mode="r", shape=(self.index.ntotal, dim))
+                return self._vectors
+        return None
+
     def reconstruct_vector(self, faiss_id: int) -> np.ndarray:
         """
-        Rekonstruiert den Vektor zu einer gegebenen faiss_id aus dem Index.
+        Liefert den Vektor zu einer gegebenen faiss_id.
 
-        Funktioniert für FLAT-Indizes (IndexFlatIP / IndexFlatL2), wie in embed_chunks.py verwendet.
+        - FLAT-Indizes: direkt aus dem Index (exakt).
+        - IVF/HNSW/PQ: aus der Vektordatei von embed_chunks.py (exakt, auch bei PQ);
+          ohne Vektordatei per index.reconstruct, für IVF nach make_direct_map().
         """
         if faiss_id < 0 or faiss_id >= self.index.ntotal:
             raise IndexError(f"Ungültige faiss_id: {faiss_id}")
 
-        vec = self.index.reconstruct(faiss_id)
+        if not self._is_flat:
+            vectors = self._stored_vectors()
+            if vectors is not None:
+                return np.array(vectors[faiss_id], dtype="float32").reshape(1, -1)
+
+        try:
+            vec = self.index.reconstruct(faiss_id)
+        except RuntimeError:
+            ivf = faiss.try_extract_index_ivf(self.index)
+            if ivf is None:
+                raise
+            ivf.make_direct_map()
+            vec = self.index.reconstruct(faiss_id)
         return np.asarray(vec, dtype="float32").reshape(1, -1)
 
+    def reconstruct_vectors(self, faiss_ids: Sequence[int]) -> np.ndarray:
+        """
+        Wie reconstruct_vector(), aber für viele faiss_ids auf einmal (Matrix n x d):
+        aus der Vektordatei per Fancy-Indexing bzw. per reconstruct_batch aus dem Index.
+        """
+        ids = np.asarray(faiss_ids, dtype="int64")
+        if ids.size and (ids.min() < 0 or ids.max() >= self.index.ntotal):
+            raise IndexError(f"Ungültige faiss_id in {faiss_ids!r}")
+
+        if not self._is_flat:
+            vectors = self._stored_vectors()
+            if vectors is not None:
+                return np.ascontiguousarray(vectors[ids], dtype="float32")
+
+        try:
+            return np.ascontiguousarray(self.index.reconstruct_batch(ids), dtype="float32")
+        except RuntimeError:
+            return np.vstack([self.reconstruct_vector(int(fid)) for fid in ids])
+
+    def _hits(
+        self,
+        faiss_id: int,
+        distances: np.ndarray,
+        indices: np.ndarray,
+        top_k: int,
+        include_self: bool,
+    ) -> List[NeighborHit]:
+        """Treffer einer Ergebniszeile als NeighborHit (ohne den Anfrage-Chunk selbst)."""
+        result: List[NeighborHit] = []
+
+        for dist, idx in zip(distances, indices):
+            if idx < 0:
+                continue
+            if not include_self and idx == faiss_id:
+                continue
+
+            if idx >= len(self.meta):
+                continue
+
+            result.append(NeighborHit(int(idx), float(dist), self.meta))
+
+            if len(result) >= top_k:
+                break
+
+        return result
+
+    def _compile_filter(self, meta_filter: MetaFilter) -> "_CompiledFilter":
+        """Filter -> Bitmap über alle faiss_ids (gecacht pro Filter)."""
+        compiled = self._filter_cache.pop(meta_filter.key, None)
+        if compiled is None:
+            t0 = time.time()
+            compiled = _CompiledFilter(meta_filter.mask(self.meta))
+            logger.debug(
+                "Filter kompiliert in %.2fs: %d/%d zulässig (%s)",
+                time.time() - t0,
+                compiled.count,
+                self.index.ntotal,
+                meta_filter,
+            )
+        self._filter_cache[meta_filter.key] = compiled
+        while len(self._filter_cache) > FILTER_CACHE_SIZE:
+            self._filter_cache.pop(next(iter(self._filter_cache)))
+        return compiled
+
+    def _filtered_search_params(self, sel: "faiss.IDSelector") -> "faiss.SearchParameters":
+        """SearchParameters mit Selektor; nprobe/efSearch des Index bleiben erhalten."""
+        base = faiss.downcast_index(self.index)
+        pretransform = isinstance(base, faiss.IndexPreTransform)
+        if pretransform:
+            base = faiss.downcast_index(base.index)
+        ivf = faiss.try_extract_index_ivf(base)
+        hnsw = getattr(base, "hnsw", None)
+        if ivf is not None:
+            params = faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe)
+        elif hnsw is not None:
+            params = faiss.SearchParametersHNSW(sel=sel, efSearch=hnsw.efSearch)
+        else:
+            params = faiss.SearchParameters(sel=sel)
+        if pretransform:
+            return faiss.SearchParametersPreTransform(index_params=params)
+        return params
+
+    def _search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        compiled: Optional["_CompiledFilter"],
+        top_docs: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        index.search() mit optionalem Filter (IDSelectorBitmap bzw. exakt über
+        wenige zulässige Vektoren); top_docs: zweistufig über den Dokument-Index.
+        """
+        if top_docs and self.doc_index is not None:
+            return self.search_hierarchical(queries, k, top_docs, compiled)
+        if compiled is None:
+            return self.index.search(queries, k)
+        if compiled.ids is not None and self._is_flat:
+            # Flat-Index mit wenigen zulässigen Vektoren: exakte Suche nur über diese
+            # (gleiche Scores wie index.search; andere Index-Typen nutzen den Selektor)
+            distances = np.full((len(queries), k), np.nan, dtype="float32")
+            indices = np.full((len(queries), k), -1, dtype="int64")
+            kk = min(k, len(compiled.ids))
+            if kk:
+                d, i = faiss.knn(queries, self.reconstruct_vectors(compiled.ids), kk, self.index.metric_type)
+                distances[:, :kk] = d
+                indices[:, :kk] = np.where(i >= 0, compiled.ids[np.maximum(i, 0)], -1)
+            return distances, indices
+        sel = faiss.IDSelectorBitmap(len(compiled.bitmap), faiss.swig_ptr(compiled.bitmap))
+        params = self._filtered_search_params(sel)
+        return self.index.search(queries, k, params=params)
+
+    def passes_threshold(self, scores: np.ndarray, threshold: float) -> np.ndarray:
+        """bool-Maske: Score erreicht die Schwelle (IP: >=, L2: <=; wie filter_faiss_neighbors)."""
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return scores >= threshold
+        return scores <= threshold
+
+    def search_range(
+        self,
+        queries: np.ndarray,
+        threshold: float,
+        max_k: int,
+        compiled: Optional["_CompiledFilter"] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Range-Suche, Rückgabe wie index.search(queries, max_k): pro Anfrage alle
+        Treffer, deren Score die Schwelle erreicht (siehe passes_threshold), die
+        besten max_k davon; Rest mit -1 aufgefüllt. Bei L2 ist threshold eine
+        (quadrierte) Distanz wie in den Scores. Index-Typen ohne range_search
+        werden mit search(max_k) gesucht und danach abgeschnitten.
+        """
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        n = len(queries)
+        distances = np.full((n, max_k), np.nan, dtype="float32")
+        indices = np.full((n, max_k), -1, dtype="int64")
+        if not n or max_k <= 0:
+            return distances, indices
+        higher_is_better = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        # range_search vergleicht strikt (> bzw. <), die Schwelle gilt inklusive
+        radius = float(np.nextafter(np.float32(threshold), np.float32(-np.inf if higher_is_better else np.inf)))
+        try:
+            if compiled is None:
+                lims, dist, ids = self.index.range_search(queries, radius)
+            else:
+                sel = faiss.IDSelectorBitmap(len(compiled.bitmap), faiss.swig_ptr(compiled.bitmap))
+                lims, dist, ids = self.index.range_search(queries, radius, params=self._filtered_search_params(sel))
+        except RuntimeError as exc:
+            logger.debug("range_search nicht verfügbar (%s) – search(%d) mit Schwelle.", exc, max_k)
+            distances, indices = self._search(queries, max_k, compiled)
+            keep = self.passes_threshold(distances, threshold) & (indices >= 0)
+            return np.where(keep, distances, np.nan).astype("float32"), np.where(keep, indices, -1)
+        for row in range(n):
+            d, i = dist[lims[row] : lims[row + 1]], ids[lims[row] : lims[row + 1]]
+            order = np.argsort(-d if higher_is_better else d, kind="stable")[:max_k]
+            distances[row, : len(order)] = d[order]
+            indices[row, : len(order)] = i[order]
+        return distances, indices
+
+    def search_hierarchical(
+        self,
+        queries: np.ndarray,
+        k: int,
+        top_docs: int,
+        compiled: Optional["_CompiledFilter"] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Zweistufige Suche, Rückgabe wie index.search(): pro Anfrage die top_docs
+        Dokumente mit dem ähnlichsten Zentroid (Kosinus), dann exakte Suche
+        (Metrik des Index, Vektoren wie reconstruct_vectors) nur über deren
+        Chunk-Bereiche. Findet eine Zeile so keine k (zulässigen) Treffer, wird
+        sie normal über den ganzen Index gesucht.
+        """
+        assert self.doc_index is not None
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        n = len(queries)
+        distances = np.full((n, k), np.nan, dtype="float32")
+        indices = np.full((n, k), -1, dtype="int64")
+        if not n:
+            return distances, indices
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        _, docs = faiss.knn(
+            queries / np.maximum(norms, 1e-12),
+            np.ascontiguousarray(self.doc_index.centroids),
+            min(int(top_docs), self.doc_index.num_docs),
+            faiss.METRIC_INNER_PRODUCT,
+        )
+        fallback: List[int] = []
+        for row in range(n):
+            ids = self.doc_index.chunk_ids(docs[row][docs[row] >= 0])
+            if compiled is not None:
+                ids = ids[compiled.admits(ids)]
+            if len(ids) < k:
+                fallback.append(row)
+                continue
+            d, i = faiss.knn(queries[row : row + 1], self.reconstruct_vectors(ids), k, self.index.metric_type)
+            distances[row] = d[0]
+            indices[row] = np.where(i[0] >= 0, ids[np.maximum(i[0], 0)], -1)
+        if fallback:
+            d, i = self._search(queries[fallback], k, compiled)
+            distances[fallback] = d
+            indices[fallback] = i
+        return distances, indices
+
+    def _search_faiss_ids(
+        self,
+        faiss_ids: Sequence[int],
+        top_k: int,
+        include_self: bool,
+        num_threads: Optional[int] = None,
+        meta_filter: Optional[MetaFilter] = None,
+        top_docs: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> List[List[NeighborHit]]:
+        """
+        Eine Ergebnisliste pro faiss_id: aus dem kNN-Graphen (O(1) pro Chunk), sonst
+        blockweise mit mehreren Anfragen pro index.search(). Mit meta_filter sind
+        es die top_k zulässigen Nachbarn, mit threshold nur die über der Schwelle
+        (search_range, top_k ist dann die Obergrenze).
+        """
+        compiled = self._compile_filter(meta_filter) if meta_filter else None
+        results: Dict[int, List[NeighborHit]] = {}
+        pending = list(range(len(faiss_ids)))
+
+        graph = self.knn_graph
+        if top_docs and self.doc_index is not None:
+            # zweistufige Suche soll auch hier gelten; der Graph kennt nur die globalen Nachbarn
+            graph = None
+        if graph is not None and not include_self and top_k <= graph.k:
+            pending = []
+            tol = graph.score_tolerance(threshold) if threshold is not None else 0.0
+            for pos, fid in enumerate(faiss_ids):
+                scores, ids = graph.row(fid)
+                if threshold is not None and (np.abs(scores - threshold) <= tol).any():
+                    # gerundeter Graph-Score (float16) zu nah an der Schwelle: live entscheiden
+                    pending.append(pos)
+                    continue
+                # Zeile vollständig, wenn schon ein Graph-Nachbar unter der Schwelle liegt
+                complete = threshold is not None and not self.passes_threshold(scores, threshold).all()
+                keep = np.ones(len(ids), dtype=bool)
+                if compiled is not None:
+                    keep &= compiled.admits(ids)
+                if threshold is not None:
+                    keep &= self.passes_threshold(scores, threshold)
+                scores, ids = scores[keep], ids[keep]
+                if len(ids) < top_k and (compiled is not None or threshold is not None) and not complete:
+                    # zu wenige zulässige Nachbarn im Graphen: live suchen
+                    pending.append(pos)
+                    continue
+                results[pos] = self._hits(fid, scores, ids, top_k, include_self)
+
+        # Wir holen bewusst etwas mehr und filtern ggf. uns selbst raus
+        k_search = top_k + (0 if include_self else 1)
+        with omp_threads(num_threads):
+            for start in range(0, len(pending), SEARCH_BATCH_SIZE):
+                block = pending[start : start + SEARCH_BATCH_SIZE]
+                block_ids = [faiss_ids[pos] for pos in block]
+                queries = self.reconstruct_vectors(block_ids)
+                if threshold is not None and not (top_docs and self.doc_index is not None):
+                    distances, indices = self.search_range(queries, threshold, k_search, compiled)
+                else:
+                    distances, indices = self._search(queries, k_search, compiled, top_docs)
+                    if threshold is not None:
+                        indices = np.where(self.passes_threshold(distances, threshold), indices, -1)
+                for row, pos in enumerate(block):
+                    results[pos] = self._hits(faiss_ids[pos], distances[row], indices[row], top_k, include_self)
+        return [results[pos] for pos in range(len(faiss_ids))]
+
     def get_neighbors_for_chunk(
         self,
         chunk_id_or_uid: str,
         top_k: int = 5,
         include_self: bool = False,
-    ) -> List[Dict[str, Any]]:
+        meta_filter: Optional[MetaFilter] = None,
+        top_docs: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> List[NeighborHit]:
         """
         Liefert die Top-k Nachbar-Chunks für eine gegebene chunk_id oder chunk_uid.
 
-        Rückgabe: Liste von Dicts mit:
+        Rückgabe: Liste von NeighborHit (lesend wie ein Dict) mit:
           - 'score'    (Ähnlichkeit oder Distanz, je nach Index)
           - 'faiss_id' (Indexposition im FAISS-Index)
-          - alle Metadaten aus contextual_meta.jsonl
+          - alle Metadaten aus dem Meta-Store bzw. contextual_meta.jsonl (lazy)
 
         Wenn include_self=False, wird der Chunk selbst aus den Ergebnissen entfernt.
+        meta_filter: nur Nachbarn, deren Metadaten den Filter erfüllen (siehe
+        scripts/meta_filter.py); der Filter wird in die FAISS-Suche gegeben.
+        top_docs: zweistufige Suche über die top_docs ähnlichsten Dokumente
+        (search_hierarchical; ohne Dokument-Index normale Suche).
+        threshold: alle Nachbarn mit Score >= threshold (IP) bzw. Distanz
+        <= threshold (L2), höchstens top_k (search_range).
+        Für viele Chunks get_neighbors_for_chunks() verwenden.
         """
         faiss_id = self.get_faiss_id_for_chunk(chunk_id_or_uid)
-        query_vec = self.reconstruct_vector(faiss_id)
+        return self._search_faiss_ids(
+            [faiss_id], top_k, include_self, meta_filter=meta_filter, top_docs=top_docs, threshold=threshold
+        )[0]
 
-        # Wir holen bewusst etwas mehr und filtern ggf. uns selbst raus
-        k_search = top_k + (0 if include_self else 1)
-        distances, indices = self.index.search(query_vec, k_search)
+    def get_neighbors_for_chunks(
+        self,
+        chunk_ids_or_uids: Sequence[str],
+        top_k: int = 5,
+        include_self: bool = False,
+        num_threads: Optional[int] = None,
+        meta_filter: Optional[MetaFilter] = None,
+        top_docs: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> Dict[str, List[NeighborHit]]:
+        """
+        Batch-Variante von get_neighbors_for_chunk(): alle Anfragevektoren werden
+        zu einer Matrix zusammengefasst und mit wenigen index.search()-Aufrufen
+        gesucht (FAISS nutzt dann den BLAS-/Multi-Query-Pfad).
 
-        result: List[Dict[str, Any]] = []
+        num_threads: OpenMP-Threads für die Suche (None = FAISS-Default); wird
+        danach zurückgesetzt.
+        meta_filter/top_docs/threshold: gelten für alle Anfragen dieses Aufrufs
+        (wie bei get_neighbors_for_chunk).
 
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx < 0:
-                continue
-            if not include_self and idx == faiss_id:
+        Rückgabe: chunk_id/chunk_uid -> Nachbarliste (wie get_neighbors_for_chunk).
+        Unbekannte IDs fehlen im Ergebnis; doppelte IDs werden einmal gesucht.
+        """
+        keys: List[str] = []
+        faiss_ids: List[int] = []
+        for key in dict.fromkeys(chunk_ids_or_uids):
+            try:
+                fid = self.get_faiss_id_for_chunk(key)
+            except KeyError:
+                logger.debug("chunk_id/chunk_uid nicht im Index gefunden: %s", key)
                 continue
+            keys.append(key)
+            faiss_ids.append(fid)
+        if not faiss_ids:
+            return {}
+        return dict(
+            zip(
+                keys,
+                self._search_faiss_ids(faiss_ids, top_k, include_self, num_threads, meta_filter, top_docs, threshold),
+            )
+        )
 
-            if idx >= len(self.meta):
-                continue
+    def get_neighbors_for_vectors(
+        self,
+        vectors: np.ndarray,
+        top_k: int = 5,
+        num_threads: Optional[int] = None,
+        meta_filter: Optional[MetaFilter] = None,
+        top_docs: Optional[int] = None,
+    ) -> List[List[NeighborHit]]:
+        """
+        Nachbarn für beliebige Anfragevektoren (z.B. kodierte Freitext-Anfragen),
+        eine Ergebnisliste pro Zeile. Die Vektoren müssen wie beim Index-Build
+        kodiert sein (gleiches Modell, ggf. normalisiert).
+        """
+        queries = np.ascontiguousarray(np.asarray(vectors, dtype="float32").reshape(-1, self.index.d))
+        compiled = self._compile_filter(meta_filter) if meta_filter else None
+        results: List[List[NeighborHit]] = []
+        with omp_threads(num_threads):
+            for start in range(0, len(queries), SEARCH_BATCH_SIZE):
+                distances, indices = self._search(
+                    queries[start : start + SEARCH_BATCH_SIZE], top_k, compiled, top_docs
+                )
+                for row in range(len(distances)):
+                    results.append(self._hits(-1, distances[row], indices[row], top_k, include_self=True))
+        return results
 
-            rec = dict(self.meta[idx])  # Kopie
-            rec["score"] = float(dist)
-            rec["faiss_id"] = int(idx)
-            result.append(rec)
 
-            if len(result) >= top_k:
-                break
+    def _load_query_model(self) -> Any:
+        with self._query_lock:
+            if self._query_model is None:
+                if SentenceTransformer is None:
+                    raise RuntimeError("sentence-transformers ist nicht installiert – Freitext-Suche nicht möglich.")
+                if not self.query_model_name:
+                    raise RuntimeError(f"Kein model_name in {self.config_path} – Modell für Anfragen unbekannt.")
+                t0 = time.time()
+                model = SentenceTransformer(self.query_model_name, device=self.query_device)
+                dim = int(model.get_sentence_embedding_dimension())
+                expected = int(self.config.get("embedding_dim") or dim)
+                if dim != expected:
+                    raise RuntimeError(
+                        f"Anfrage-Modell {self.query_model_name} liefert dim={dim}, Index erwartet {expected}."
+                    )
+                self._query_model = model
+                logger.info(
+                    "Anfrage-Modell %s geladen in %.1fs (%s).",
+                    self.query_model_name,
+                    time.time() - t0,
+                    self.query_device,
+                )
+        return self._query_model
 
-        return result
+    def encode_queries(self, texts: Sequence[str], batch_size: int = QUERY_BATCH_SIZE) -> np.ndarray:
+        """
+        Kodiert Anfragen wie beim Index-Build (gleiches Modell, normalized aus der
+        Config); bereits gesehene Texte kommen aus dem Embedding-Cache, die übrigen
+        werden gemeinsam in einem encode()-Aufruf kodiert. Rückgabe: (n, dim) float32.
+        """
+        keys = [normalize_query_text(t) for t in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        for key in keys:
+            vec = _cache_get(self._embedding_cache, key)
+            if vec is not None:
+                vectors[key] = vec
+                self.query_stats["embedding_hits"] += 1
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing:
+            encoded = self._load_query_model().encode(
+                missing,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+                normalize_embeddings=bool(self.config.get("normalized", False)),
+            )
+            self.query_stats["encoded"] += len(missing)
+            for key, vec in zip(missing, np.asarray(encoded, dtype="float32")):
+                vectors[key] = vec
+                _cache_put(self._embedding_cache, key, vec, QUERY_CACHE_SIZE)
+        if not keys:
+            return np.zeros((0, self.index.d), dtype="float32")
+        return np.vstack([vectors[key] for key in keys])
+
+    def search_text(
+        self,
+        texts: Sequence[str],
+        top_k: int = 5,
+        num_threads: Optional[int] = None,
+        meta_filter: Optional[MetaFilter] = None,
+        hybrid: bool = False,
+        budget_ms: float = DEFAULT_BUDGET_MS,
+    ) -> List[List[NeighborHit]]:
+        """
+        Freitext-Suche: eine Trefferliste pro Text (Format wie get_neighbors_for_chunk).
+        Ergebnisse werden pro (normalisierter Text, top_k, Filter, Modus) gecacht;
+        nicht gecachte Anfragen werden gemeinsam kodiert und per Batch-Search gesucht.
+        hybrid=True: siehe search_hybrid() (ohne BM25-Index: nur Dense).
+        """
+        mode = "hybrid" if hybrid and self.bm25 is not None else "dense"
+        if hybrid and self.bm25 is None:
+            logger.debug("Kein BM25-Index in %s – Hybrid-Suche nur dense.", self.indices_root)
+        filter_key = meta_filter.key if meta_filter else ""
+        keys = [(normalize_query_text(t), int(top_k), filter_key, mode) for t in texts]
+        self.query_stats["queries"] += len(keys)
+        found: Dict[Tuple[str, int, str, str], List[NeighborHit]] = {}
+        for key in keys:
+            hits = _cache_get(self._result_cache, key)
+            if hits is not None:
+                found[key] = hits
+                self.query_stats["result_hits"] += 1
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            queries = [key[0] for key in missing]
+            vectors = self.encode_queries(queries)
+            if mode == "hybrid":
+                results = self._hybrid_search(queries, vectors, top_k, num_threads, meta_filter, budget_ms)
+            else:
+                results = self.get_neighbors_for_vectors(vectors, top_k, num_threads, meta_filter)
+            for key, hits in zip(missing, results):
+                found[key] = hits
+                _cache_put(self._result_cache, key, hits, RESULT_CACHE_SIZE)
+        # Kopien: Aufrufer dürfen die Treffer verändern, ohne den Cache zu berühren
+        return [[hit.copy() for hit in found[key]] for key in keys]
+
+    def search_hybrid(
+        self,
+        texts: Sequence[str],
+        top_k: int = 5,
+        num_threads: Optional[int] = None,
+        meta_filter: Optional[MetaFilter] = None,
+        budget_ms: float = DEFAULT_BUDGET_MS,
+    ) -> List[List[NeighborHit]]:
+        """
+        Lexikalisch + dense: je Text die besten top_k * HYBRID_CANDIDATES_FACTOR
+        Kandidaten aus FAISS und BM25, fusioniert per Reciprocal-Rank-Fusion
+        (score = Summe 1 / (RRF_K + Rang)). Treffer tragen zusätzlich dense_score
+        und bm25_score (None, wenn nur in einer Liste). budget_ms begrenzt die
+        BM25-Bewertung pro Anfrage (siehe BM25Index.search).
+        """
+        return self.search_text(texts, top_k, num_threads, meta_filter, hybrid=True, budget_ms=budget_ms)
+
+    def _hybrid_search(
+        self,
+        texts: Sequence[str],
+        vectors: np.ndarray,
+        top_k: int,
+        num_threads: Optional[int],
+        meta_filter: Optional[MetaFilter],
+        budget_ms: float,
+    ) -> List[List[NeighborHit]]:
+        assert self.bm25 is not None
+        compiled = self._compile_filter(meta_filter) if meta_filter else None
+        num_candidates = max(1, int(top_k)) * HYBRID_CANDIDATES_FACTOR
+        results: List[List[NeighborHit]] = []
+        with omp_threads(num_threads):
+            for start in range(0, len(texts), SEARCH_BATCH_SIZE):
+                distances, indices = self._search(
+                    vectors[start : start + SEARCH_BATCH_SIZE], num_candidates, compiled
+                )
+                for row, text in enumerate(texts[start : start + SEARCH_BATCH_SIZE]):
+                    valid = indices[row] >= 0
+                    dense_ids, dense_scores = indices[row][valid], distances[row][valid]
+                    lex_ids, lex_scores = self.bm25.search(
+                        text, num_candidates, budget_ms, compiled.admits if compiled is not None else None
+                    )
+                    results.append(self._fuse(dense_ids, dense_scores, lex_ids, lex_scores, top_k))
+        return results
+
+    def _fuse(
+        self,
+        dense_ids: np.ndarray,
+        dense_scores: np.ndarray,
+        lex_ids: np.ndarray,
+        lex_scores: np.ndarray,
+        top_k: int,
+    ) -> List[NeighborHit]:
+        """Reciprocal-Rank-Fusion zweier Ranglisten (faiss_ids, beste zuerst)."""
+        ids = np.concatenate([dense_ids, lex_ids]).astype(np.int64)
+        if not len(ids):
+            return []
+        ranks = np.concatenate([np.arange(len(dense_ids)), np.arange(len(lex_ids))])
+        uniq, inverse = np.unique(ids, return_inverse=True)
+        fused = np.bincount(inverse, weights=1.0 / (RRF_K + ranks + 1.0))
+        order = np.lexsort((uniq, -fused))[: int(top_k)]
+
+        dense = dict(zip(dense_ids.tolist(), dense_scores.tolist()))
+        lexical = dict(zip(lex_ids.tolist(), lex_scores.tolist()))
+        hits: List[NeighborHit] = []
+        for pos in order:
+            fid = int(uniq[pos])
+            hit = NeighborHit(fid, float(fused[pos]), self.meta)
+            hit["dense_score"] = dense.get(fid)
+            hit["bm25_score"] = lexical.get(fid)
+            hits.append(hit)
+        return hits
 
 
 def _cli_print_neighbors(
     workspace_root: str,
     chunk_id_or_uid: str,
     top_k: int,
+    mmap: bool = True,
+    threshold: Optional[float] = None,
 ) -> None:
-    retriever = FaissRetriever(workspace_root=workspace_root)
+    retriever = FaissRetriever(workspace_root=workspace_root, mmap=mmap)
 
     neighbors = retriever.get_neighbors_for_chunk(
         chunk_id_or_uid=chunk_id_or_uid,
         top_k=top_k,
         include_self=False,
+        threshold=threshold,
     )
 
     print(f"Top-{top_k} Nachbarn für chunk_id/chunk_uid={chunk_id_or_uid}:")
@@ -201,6 +1110,19 @@ def _cli_print_neighbors(
         print(f"    source_path={source_path}")
 
 
+def _cli_print_query(workspace_root: str, query: str, top_k: int, mmap: bool = True, hybrid: bool = False) -> None:
+    retriever = FaissRetriever(workspace_root=workspace_root, mmap=mmap)
+    hits = retriever.search_text([query], top_k=top_k, hybrid=hybrid)[0]
+
+    print(f"Top-{top_k} Treffer für Anfrage {query!r}:")
+    for i, rec in enumerate(hits, start=1):
+        print(
+            f"{i:2d}. score={rec.get('score'):.4f}  faiss_id={rec.get('faiss_id')}  "
+            f"doc_id={rec.get('doc_id')}  chunk_id={rec.get('chunk_id')}"
+        )
+        print(f"    source_path={rec.get('source_path')}")
+
+
 def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="FAISS-Retriever für Nachbar-Chunks (auf Basis von chunk_id/chunk_uid)."
@@ -214,27 +1136,52 @@ def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
         "--chunk-id",
         help="chunk_id oder chunk_uid, für die Nachbarn gesucht werden sollen (CLI-Test).",
     )
+    parser.add_argument(
+        "--query",
+        help="Freitext-Anfrage (kodiert mit dem Modell aus der Index-Config, CLI-Test).",
+    )
+    parser.add_argument(
+        "--hybrid",
+        action="store_true",
+        help="Mit --query: BM25 + Dense (Reciprocal-Rank-Fusion) statt nur Dense.",
+    )
     parser.add_argument(
         "--top-k",
         type=int,
         default=5,
         help="Anzahl der zurückzugebenden Nachbarn.",
     )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help="Mit --chunk-id: nur Nachbarn über der Schwelle (Range-Suche, höchstens --top-k).",
+    )
+    parser.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="Index komplett in den Speicher lesen statt zu mappen.",
+    )
     return parser.parse_args(argv)
 
 
 def main(argv: List[str] | None = None) -> int:
     args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
 
     if args.chunk_id:
         _cli_print_neighbors(
             workspace_root=args.workspace_root,
             chunk_id_or_uid=args.chunk_id,
             top_k=args.top_k,
+            mmap=not args.no_mmap,
+            threshold=args.threshold,
         )
+    elif args.query:
+        _cli_print_query(args.workspace_root, args.query, args.top_k, mmap=not args.no_mmap, hybrid=args.hybrid)
     else:
         print(
-            "Hinweis: Für einen schnellen Test bitte --chunk-id <ID oder UID> angeben.",
+            "Hinweis: Für einen schnellen Test bitte --chunk-id <ID oder UID> oder --query <Text> angeben.",
             file=sys.stderr,
         )
     return 0
@@ -26,7 +26,7 @@ import sys
 import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Set, Iterator
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Set, Iterator, Union
 
 import requests
 
@@ -41,11 +41,12 @@ if str(DEFAULT_REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(DEFAULT_REPO_ROOT))
 
 try:
-    from config.paths.paths_utils import get_path, REPO_ROOT as CONFIG_REPO_ROOT  # type: ignore
+    from config.paths.paths_utils import get_path, get_staging_config, REPO_ROOT as CONFIG_REPO_ROOT  # type: ignore
 
     REPO_ROOT = Path(CONFIG_REPO_ROOT)
 except Exception:  # pragma: no cover
     get_path = None  # type: ignore
+    get_staging_config = None  # type: ignore
     REPO_ROOT = DEFAULT_REPO_ROOT
 
 try:
@@ -56,6 +57,18 @@ except Exception as e:  # pragma: no cover
         "Bitte sicherstellen, dass das Skript im selben Repository liegt."
     ) from e
 
+from scripts.ollama_warmup import ensure_models_ready, normalize_base_url, parse_keep_alive  # type: ignore
+from scripts.shard_plan import files_for_shard, load_shard_plan  # type: ignore
+from scripts.work_queue import DEFAULT_LEASE_TTL_S, WorkQueue, drain_queue  # type: ignore
+from scripts.node_staging import NodeStaging  # type: ignore
+from scripts.qa_budget import DEFAULT_BLOCK_SIZE, BudgetLedger  # type: ignore
+from scripts.index_generations import resolve_index_dir  # type: ignore
+from scripts.knn_graph import graph_files  # type: ignore
+from scripts.doc_index import DOC_INDEX_SUBDIR  # type: ignore
+from scripts.bm25_index import BM25_SUBDIR  # type: ignore
+from scripts.meta_filter import MetaFilter  # type: ignore
+from scripts.retrieval_service import RetrievalClient  # type: ignore
+
 logger = logging.getLogger("generate_qa_candidates")
 
 
@@ -351,8 +364,14 @@ def open_output_file(out_path: Path, resume_mode: str) -> Tuple[Any, List[str]]:
     return f, []
 
 
-def load_faiss_metric_info(workspace_root: Path) -> FaissMetricInfo:
-    cfg_path = workspace_root / "indices" / "faiss" / "contextual_config.json"
+def current_indices_dir(workspace_root: Path) -> Path:
+    """Verzeichnis der aktuell veröffentlichten Index-Generation (bzw. indices/faiss im alten Layout)."""
+    return Path(resolve_index_dir(str(workspace_root / "indices" / "faiss")))
+
+
+def load_faiss_metric_info(indices_dir: Path) -> FaissMetricInfo:
+    """Metrik der Index-Generation indices_dir (aus deren contextual_config.json)."""
+    cfg_path = indices_dir / "contextual_config.json"
     if not cfg_path.exists():
         return FaissMetricInfo(metric="IP", index_type="IndexFlatIP", normalized=True)
     raw = load_json(cfg_path)
@@ -526,6 +545,56 @@ def filter_faiss_neighbors(
 
     return filtered
 
+def build_neighbor_filter(candidate: Dict[str, Any], cfg: QAConfig) -> Optional[MetaFilter]:
+    """
+    Die Metadaten-Kriterien aus filter_faiss_neighbors() als MetaFilter, damit
+    FAISS direkt die top_k zulässigen Nachbarn liefert (Score-Schwelle und
+    max_neighbors bleiben in filter_faiss_neighbors()).
+    """
+    filters = cfg.filters
+    clauses: List[Tuple[str, str, Sequence[str]]] = []
+    if filters.get("languages_allowed"):
+        clauses.append(("language", "in", filters["languages_allowed"]))
+    if filters.get("trust_levels_allowed"):
+        clauses.append(("trust_level", "in", filters["trust_levels_allowed"]))
+    if filters.get("content_types_allowed"):
+        clauses.append(("content_type", "any", filters["content_types_allowed"]))
+    if filters.get("artifact_roles_excluded"):
+        clauses.append(("artifact_role", "none", filters["artifact_roles_excluded"]))
+    domains_candidate = get_flat_list_field(candidate, "domain")
+    if domains_candidate:
+        clauses.append(("domain", "any_or_empty", domains_candidate))
+    return MetaFilter(clauses) if clauses else None
+
+
+def prefetch_faiss_neighbors(
+    retriever: Union[FaissRetriever, RetrievalClient],
+    chunk_ids: Sequence[str],
+    filters: Dict[str, Optional[MetaFilter]],
+    top_k: int,
+    num_threads: Optional[int] = None,
+    top_docs: Optional[int] = None,
+    threshold: Optional[float] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Batch-Retrieval für mehrere Anker; Anker mit gleichem Filter (meist gleiche
+    Domains) teilen sich einen Aufruf. top_docs: zweistufige Suche (Dokument-Index);
+    threshold: Range-Suche, nur Nachbarn über der Schwelle (höchstens top_k).
+    """
+    groups: Dict[str, Tuple[Optional[MetaFilter], List[str]]] = {}
+    for cid in chunk_ids:
+        flt = filters.get(cid)
+        groups.setdefault(flt.key if flt else "", (flt, []))[1].append(cid)
+    result: Dict[str, List[Dict[str, Any]]] = {}
+    for flt, ids in groups.values():
+        result.update(
+            retriever.get_neighbors_for_chunks(
+                ids, top_k=top_k, num_threads=num_threads, meta_filter=flt, top_docs=top_docs, threshold=threshold
+            )
+        )
+    return result
+
+
 def extract_json_from_text(text: str) -> Any:
     text = text.strip()
     if text.startswith("["):
@@ -555,6 +624,7 @@ def call_llm_ollama_once(
     max_tokens: int,
     timeout_s: int,
     num_ctx: int = 0,          # <-- NEU
+    keep_alive: Any = None,
 ) -> List[Dict[str, Any]]:
 
     url = os.environ.get("OLLAMA_API_URL", "http://127.0.0.1:11434/api/chat")
@@ -576,6 +646,8 @@ def call_llm_ollama_once(
         "stream": False,
         "options": options,
     }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
 
     resp = requests.post(url, json=payload, timeout=timeout_s)
 
@@ -614,6 +686,7 @@ def call_llm_ollama_once_text(
     max_tokens: int,
     timeout_s: int,
     num_ctx: int = 0,
+    keep_alive: Any = None,
 ) -> str:
     url = os.environ.get("OLLAMA_API_URL", "http://127.0.0.1:11434/api/chat")
 
@@ -634,6 +707,8 @@ def call_llm_ollama_once_text(
         "stream": False,
         "options": options,
     }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
 
     resp = requests.post(url, json=payload, timeout=timeout_s)
     resp.raise_for_status()
@@ -659,6 +734,7 @@ def call_llm_ollama_with_retries(
     max_retries: int,
     retry_backoff_s: float,
     num_ctx: int = 0,
+    keep_alive: Any = None,
 ) -> List[Dict[str, Any]]:
     """
     Unchanged. You reuse this for BOTH passes:
@@ -677,6 +753,7 @@ def call_llm_ollama_with_retries(
                 max_tokens=max_tokens,
                 timeout_s=timeout_s,
                 num_ctx=num_ctx,
+                keep_alive=keep_alive,
             )
         except Exception as e:
             last_err = e
@@ -763,11 +840,32 @@ def load_prompt_bundle(cfg: "QAConfig") -> PromptBundle:
         gen_system=gen_system,
         gen_user=gen_user,
     )
+
+
+def global_budget_exhausted(global_state: Dict[str, Any]) -> bool:
+    """
+    True, wenn das globale Q/A-Budget aufgebraucht ist.
+
+    remaining_global ist die lokal verfügbare Menge. Mit Budget-Ledger wird sie
+    bei Bedarf blockweise aus dem gemeinsamen Ledger nachgefüllt; erschöpft ist
+    das Budget erst, wenn auch das Ledger nichts mehr hergibt.
+    """
+    remaining_global = global_state.get("remaining_global")
+    if not isinstance(remaining_global, int) or remaining_global > 0:
+        return False
+    ledger = global_state.get("budget_ledger")
+    if ledger is None:
+        return True
+    granted = ledger.draw()
+    global_state["remaining_global"] = remaining_global + granted
+    return granted <= 0
+
+
 def process_semantic_file(
     in_path: Path,
     out_path: Path,
     cfg: QAConfig,
-    retriever: FaissRetriever,
+    retriever: Union[FaissRetriever, RetrievalClient],
     metric_info: FaissMetricInfo,
     global_state: Dict[str, Any],
 ) -> int:
@@ -796,6 +894,7 @@ def process_semantic_file(
     timeout_s = int(llm_cfg.get("request_timeout_s", 600))
     max_retries = int(llm_cfg.get("max_retries", 3))
     retry_backoff_s = float(llm_cfg.get("retry_backoff_s", 5.0))
+    keep_alive = parse_keep_alive(llm_cfg.get("keep_alive"))
 
     # NEW: prompts.json bundle + hashes (double-pass)
     prompts = load_prompt_bundle(cfg)
@@ -831,6 +930,32 @@ def process_semantic_file(
     out_f, processed_anchor_ids = open_output_file(out_path, resume_mode)
     processed_set = set(processed_anchor_ids)
 
+    # FAISS-Nachbarn blockweise vorab holen (ein Batch-Search statt einer Suche pro Anker)
+    top_k_faiss = int(neighbors_cfg.get("top_k_faiss", 16))
+    prefetch_block = max(1, int(neighbors_cfg.get("faiss_prefetch_block", 64)))
+    faiss_threads = neighbors_cfg.get("faiss_threads")
+    filter_pushdown = bool(neighbors_cfg.get("faiss_filter_pushdown", True))
+    faiss_top_docs = neighbors_cfg.get("faiss_top_docs")
+    # Range-Suche: genau die Nachbarn über similarity_threshold (bis faiss_range_max) statt fester top_k_faiss
+    similarity_threshold = float(neighbors_cfg.get("similarity_threshold", 0.0))
+    faiss_threshold: Optional[float] = None
+    if neighbors_cfg.get("faiss_range_search") and similarity_threshold > 0.0:
+        faiss_threshold = similarity_threshold
+        top_k_faiss = int(neighbors_cfg.get("faiss_range_max", 256))
+    anchor_ids: List[str] = []
+    anchor_filters: Dict[str, Optional[MetaFilter]] = {}
+    for idx, chunk in enumerate(chunks):
+        if max_chunks_debug and idx >= max_chunks_debug:
+            break
+        cid = str(chunk.get("chunk_id"))
+        if cid and cid not in processed_set and is_candidate_chunk(chunk, cfg):
+            anchor_ids.append(cid)
+            anchor_filters[cid] = build_neighbor_filter(chunk, cfg) if filter_pushdown else None
+    anchor_pos = {cid: pos for pos, cid in enumerate(anchor_ids)}
+    prefetched: Dict[str, List[Dict[str, Any]]] = {}
+    prefetched_until = 0  # anchor_ids[:prefetched_until] wurden bereits gesucht
+    retrieval_failed: Set[str] = set()  # Anker ohne Nachbarn wegen Retrieval-Fehler
+
     total_written = 0
     total_groups = 0
 
@@ -864,25 +989,51 @@ def process_semantic_file(
             logging.info("max_qa_per_document für %s erreicht, breche ab.", in_path.name)
             break
 
-        remaining_global = global_state.get("remaining_global")
-        if isinstance(remaining_global, int) and remaining_global <= 0:
+        if global_budget_exhausted(global_state):
             break
 
         local_neighbors = get_local_neighbors(chunks, idx, cfg)
         local_neighbor_ids = [str(ch.get("chunk_id")) for ch in local_neighbors if ch.get("chunk_id")]
 
-        top_k_faiss = int(neighbors_cfg.get("top_k_faiss", 16))
-        try:
-            faiss_neighbors = retriever.get_neighbors_for_chunk(
-                chunk_id_or_uid=chunk_id,
-                top_k=top_k_faiss,
-            )
-        except Exception as e:
+        pos = anchor_pos.get(chunk_id)
+        if chunk_id not in prefetched and (pos is None or pos >= prefetched_until):
+            if pos is None:
+                block_ids = [chunk_id]
+                anchor_filters[chunk_id] = build_neighbor_filter(chunk, cfg) if filter_pushdown else None
+            else:
+                block_ids = anchor_ids[pos : pos + prefetch_block]
+                prefetched_until = pos + len(block_ids)
+            try:
+                prefetched.update(
+                    prefetch_faiss_neighbors(
+                        retriever,
+                        block_ids,
+                        anchor_filters,
+                        top_k=top_k_faiss,
+                        num_threads=int(faiss_threads) if faiss_threads else None,
+                        top_docs=int(faiss_top_docs) if faiss_top_docs else None,
+                        threshold=faiss_threshold,
+                    )
+                )
+            except Exception as e:
+                retrieval_failed.update(block_ids)
+                logging.warning(
+                    "Fehler beim FAISS-Batch-Retrieval (%d Anker ab chunk_id=%s) in %s: %s",
+                    len(block_ids),
+                    chunk_id,
+                    in_path.name,
+                    e,
+                )
+        if chunk_id in retrieval_failed:
+            # nicht ohne Nachbarn schreiben – sonst gilt der Anker beim Resume als erledigt
+            logging.warning("Überspringe chunk_id=%s in %s (Retrieval-Fehler).", chunk_id, in_path.name)
+            continue
+        faiss_neighbors = prefetched.pop(chunk_id, None)
+        if faiss_neighbors is None:
             logging.warning(
-                "Fehler beim FAISS-Retrieval für chunk_id=%s in %s: %s",
+                "Keine FAISS-Nachbarn für chunk_id=%s in %s (nicht im Index).",
                 chunk_id,
                 in_path.name,
-                e,
             )
             faiss_neighbors = []
 
@@ -913,8 +1064,7 @@ def process_semantic_file(
             if remaining_qa_for_document is not None and remaining_qa_for_document <= 0:
                 break
 
-            remaining_global = global_state.get("remaining_global")
-            if isinstance(remaining_global, int) and remaining_global <= 0:
+            if global_budget_exhausted(global_state):
                 break
 
             num_groups_for_chunk += 1
@@ -952,6 +1102,7 @@ def process_semantic_file(
                     max_tokens=plan_max_tokens,
                     timeout_s=timeout_s,
                     num_ctx=num_ctx,
+                    keep_alive=keep_alive,
                 )
             except Exception as e:
                 logging.warning(
@@ -1019,6 +1170,7 @@ def process_semantic_file(
                     max_tokens=max_tokens,
                     timeout_s=timeout_s,
                     num_ctx=num_ctx,
+                    keep_alive=keep_alive,
                 )
             except Exception as e:
                 logging.warning(
@@ -1060,8 +1212,7 @@ def process_semantic_file(
 
             written_for_group = 0
             for qa_idx, qa_obj in enumerate(qa_list):
-                remaining_global = global_state.get("remaining_global")
-                if isinstance(remaining_global, int) and remaining_global <= 0:
+                if global_budget_exhausted(global_state):
                     break
 
                 if not isinstance(qa_obj, dict):
@@ -1178,7 +1329,7 @@ def process_semantic_file(
 
                 if isinstance(global_state.get("remaining_global"), int):
                     global_state["remaining_global"] -= 1
-                    if global_state["remaining_global"] <= 0:
+                    if global_budget_exhausted(global_state):
                         break
 
             if written_for_group > 0:
@@ -1195,7 +1346,7 @@ def process_semantic_file(
         if written_any_for_chunk > 0:
             processed_set.add(chunk_id)
 
-        if isinstance(global_state.get("remaining_global"), int) and global_state["remaining_global"] <= 0:
+        if global_budget_exhausted(global_state):
             break
 
     out_f.close()
@@ -1353,9 +1504,128 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
         default=0,
         help="Shard-Index dieses Jobs (0-basiert).",
     )
+    parser.add_argument(
+        "--shard-plan",
+        type=str,
+        default=None,
+        help="Optional: Shard-Plan aus scripts/shard_plan.py (--stage qa) statt Modulo-Verteilung.",
+    )
+    parser.add_argument(
+        "--work-queue",
+        type=str,
+        default=None,
+        help=(
+            "Optional: Queue-Verzeichnis auf dem Workspace (scripts/work_queue.py). "
+            "Dateien werden per Lease dynamisch gezogen, --shard-id/--shard-plan entfallen."
+        ),
+    )
+    parser.add_argument(
+        "--lease-ttl",
+        type=float,
+        default=DEFAULT_LEASE_TTL_S,
+        help="Lease-Timeout (s) für --work-queue; abgelaufene Leases werden neu vergeben.",
+    )
+    parser.add_argument(
+        "--budget-ledger",
+        type=str,
+        default=None,
+        help=(
+            "Optional: Ledger-Datei für das gemeinsame global_qa_limit aller Shards "
+            "(Default bei SLURM-Arrays: <workspace>/logs/qa_budget/qa_budget_<SLURM_ARRAY_JOB_ID>.json)."
+        ),
+    )
+    parser.add_argument(
+        "--no-staging",
+        action="store_true",
+        help="Node-lokales Staging aus paths.json ignorieren und direkt im Workspace lesen/schreiben.",
+    )
+    parser.add_argument(
+        "--retrieval-service",
+        type=str,
+        default=os.environ.get("RETRIEVAL_SERVICE"),
+        help=(
+            "Optional: Adresse eines laufenden scripts/retrieval_service.py "
+            "(unix:<socket> oder http://host:port; Default: $RETRIEVAL_SERVICE). "
+            "Dann wird der Index nicht im Prozess geladen."
+        ),
+    )
+    parser.add_argument(
+        "--no-index-mmap",
+        action="store_true",
+        help="FAISS-Index komplett in den Speicher lesen statt zu mappen (mmap teilt den Page-Cache).",
+    )
     return parser.parse_args(argv)
 
 
+def connect_retrieval_service(
+    address: str,
+    top_docs: Optional[int] = None,
+    fallback: Optional[Callable[[], FaissRetriever]] = None,
+) -> Optional[RetrievalClient]:
+    """
+    Client für einen laufenden Retrieval-Dienst; None (mit Warnung), wenn nicht
+    erreichbar. fallback lädt den Index im Prozess, falls der Dienst später wegfällt.
+    """
+    client = RetrievalClient(address, fallback=fallback)
+    try:
+        health = client.health()
+    except (OSError, RuntimeError, ValueError) as e:
+        logging.warning("Retrieval-Dienst %s nicht erreichbar (%s) – lade Index im Prozess.", address, e)
+        return None
+    logging.info(
+        "Retrieval-Dienst: %s (ntotal=%s, Index=%s)", address, health.get("ntotal"), health.get("indices_root")
+    )
+    if top_docs and not (health.get("load_stats") or {}).get("doc_index"):
+        logging.warning(
+            "neighbors.faiss_top_docs=%s gesetzt, aber der Dienst hat keinen Dokument-Index – flache Suche.", top_docs
+        )
+    return client
+
+
+def load_local_retriever(
+    workspace_root: Path,
+    indices_dir: Path,
+    staging: NodeStaging,
+    metric_info: FaissMetricInfo,
+    no_mmap: bool,
+    top_docs: Optional[int] = None,
+) -> FaissRetriever:
+    """Index, Meta, kNN-Graph, Dokument- und BM25-Index (ggf. node-lokal gestaged) im Prozess laden."""
+    staging.stage_in(indices_dir / "contextual.index")
+    meta_store_dir = indices_dir / "contextual_meta.store"
+    if (meta_store_dir / "header.json").is_file():
+        # kompakter Meta-Store statt der großen JSONL
+        for path in sorted(meta_store_dir.iterdir()):
+            staging.stage_in(path)
+    else:
+        staging.stage_in(indices_dir / "contextual_meta.jsonl")
+    staging.stage_in(indices_dir / "contextual_config.json")
+    if not metric_info.index_type.startswith("IndexFlat"):
+        # IVF/HNSW/PQ: exakte Vektoren für reconstruct_vector mitnehmen
+        staging.stage_in(indices_dir / "embedding_store.f32")
+    for path in graph_files(str(indices_dir)):
+        # vorberechneter kNN-Graph (Header zuletzt)
+        staging.stage_in(Path(path))
+    for subdir in (indices_dir / DOC_INDEX_SUBDIR, indices_dir / BM25_SUBDIR):
+        # Dokument-Index (top_docs) und BM25-Index mitnehmen, Header zuletzt
+        if (subdir / "header.json").is_file():
+            for path in sorted(subdir.iterdir(), key=lambda p: (p.name == "header.json", p.name)):
+                staging.stage_in(path)
+
+    retriever = FaissRetriever(
+        workspace_root=str(workspace_root),
+        indices_root=str(staging.input_path(indices_dir)) if staging.enabled else str(indices_dir),
+        mmap=not no_mmap,
+    )
+    if top_docs and retriever.doc_index is None:
+        logging.warning(
+            "neighbors.faiss_top_docs=%s gesetzt, aber kein Dokument-Index in %s – flache Suche.",
+            top_docs,
+            indices_dir,
+        )
+    return retriever
+
+
 def setup_logging(level_name: str) -> None:
     level = getattr(logging, level_name.upper(), logging.INFO)
     logging.basicConfig(
@@ -1377,6 +1647,36 @@ def load_qa_config(config_path: Optional[str]) -> QAConfig:
     raw = load_json(path)
     return QAConfig(raw=raw, config_path=path)
 
+def resolve_workspace_root(cli_value: Optional[str], cfg: QAConfig) -> Path:
+    """
+    Workspace-Root: CLI > QA-Config (paths.workspace_root) > paths_utils > REPO_ROOT.
+    """
+    if cli_value:
+        return Path(cli_value).expanduser().resolve()
+    ws_cfg = cfg.paths.get("workspace_root")
+    if ws_cfg:
+        return Path(ws_cfg).expanduser().resolve()
+    if get_path is not None:
+        try:
+            return Path(get_path("workspace_root"))
+        except Exception:
+            return REPO_ROOT
+    return REPO_ROOT
+
+
+def resolve_budget_ledger_path(cli_value: Optional[str], workspace_root: Path) -> Optional[Path]:
+    """
+    Ledger-Pfad für das globale Q/A-Budget: CLI > <workspace>/logs/qa_budget/<SLURM_ARRAY_JOB_ID>.json.
+    Ohne beides None (-> statische Aufteilung).
+    """
+    if cli_value:
+        return Path(cli_value).expanduser().resolve()
+    array_job_id = os.environ.get("SLURM_ARRAY_JOB_ID")
+    if array_job_id:
+        return workspace_root / "logs" / "qa_budget" / f"qa_budget_{array_job_id}.json"
+    return None
+
+
 def iter_semantic_files(semantic_dir: Path, limit_num_files: int = 0) -> Iterator[Path]:
     """
     Yields *.jsonl files from semantic_dir (sorted for determinism).
@@ -1406,20 +1706,7 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
     logging.info("Starte generate_qa_candidates.py")
     logging.info("Verwendete Config: %s", cfg.config_path)
 
-    workspace_root: Path
-    if args.workspace_root:
-        workspace_root = Path(args.workspace_root).expanduser().resolve()
-    else:
-        ws_cfg = cfg.paths.get("workspace_root")
-        if ws_cfg:
-            workspace_root = Path(ws_cfg).expanduser().resolve()
-        elif get_path is not None:
-            try:
-                workspace_root = Path(get_path("workspace_root"))
-            except Exception:
-                workspace_root = REPO_ROOT
-        else:
-            workspace_root = REPO_ROOT
+    workspace_root = resolve_workspace_root(args.workspace_root, cfg)
 
     logging.info("Workspace-Root: %s", workspace_root)
 
@@ -1433,9 +1720,43 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
     else:
         limit_num_files = limit_num_files_cfg
 
-    metric_info = load_faiss_metric_info(workspace_root)
+    # Generation einmal auflösen, damit Metrik, Index, Meta und Config zusammenpassen,
+    # auch wenn währenddessen (z.B. im LLM-Warm-up) eine neue Generation veröffentlicht wird
+    indices_dir = current_indices_dir(workspace_root)
+    metric_info = load_faiss_metric_info(indices_dir)
 
-    retriever = FaissRetriever(workspace_root=str(workspace_root))
+    # LLM erst vorladen (fail-fast vor dem teuren Index-Load); ab hier ist das Modell resident
+    llm_cfg = cfg.llm
+    if bool(llm_cfg.get("warmup", True)) and not bool(cfg.runtime.get("dry_run", False)):
+        try:
+            warmup_results = ensure_models_ready(
+                base_url=normalize_base_url(os.environ.get("OLLAMA_API_URL")),
+                models=[llm_cfg.get("model", "qwen2.5:32b-instruct-q4_K_M")],
+                keep_alive=parse_keep_alive(llm_cfg.get("keep_alive")),
+                ready_timeout_s=float(llm_cfg.get("ready_timeout_s", 600)),
+                request_timeout_s=float(llm_cfg.get("request_timeout_s", 600)) * 3,
+                telemetry_path=workspace_root / "logs" / "telemetry" / "llm_warmup.jsonl",
+                context={"script": "generate_qa_candidates.py", "shard_id": args.shard_id},
+            )
+        except Exception as e:
+            raise SystemExit(f"LLM-Warm-up fehlgeschlagen: {e}")
+        global_warmup = [r.as_dict() for r in warmup_results]
+    else:
+        global_warmup = []
+
+    # Node-lokales Staging: Index + Meta einmal nach $TMPDIR, Ausgaben lokal schreiben
+    staging_cfg = None if (args.no_staging or get_staging_config is None) else get_staging_config()
+    staging = NodeStaging.from_config(workspace_root, staging_cfg).start()
+    top_docs = cfg.neighbors.get("faiss_top_docs")
+
+    def _load_local() -> FaissRetriever:
+        return load_local_retriever(workspace_root, indices_dir, staging, metric_info, args.no_index_mmap, top_docs)
+
+    retriever: Optional[Union[FaissRetriever, RetrievalClient]] = None
+    if args.retrieval_service:
+        retriever = connect_retrieval_service(args.retrieval_service, top_docs, fallback=_load_local)
+    if retriever is None:
+        retriever = _load_local()
 
     logging.info("Semantic-Verzeichnis: %s", semantic_dir)
     logging.info("QA-Candidates-Verzeichnis: %s", qa_candidates_dir)
@@ -1449,13 +1770,26 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
 
     semantic_files = list(iter_semantic_files(semantic_dir, limit_num_files))
 
-    # Sharding anwenden: einfacher Modulo-Split über den Index (analog zu annotate_semantics.py)
+    # Sharding anwenden: Shard-Plan (LPT nach Arbeitseinheiten) oder einfacher Modulo-Split
     if args.num_shards < 1:
         raise SystemExit("--num-shards muss >= 1 sein")
     if args.shard_id < 0 or args.shard_id >= args.num_shards:
         raise SystemExit("--shard-id muss in [0, num-shards) liegen")
 
-    if args.num_shards == 1:
+    queue: Optional[WorkQueue] = None
+    if args.work_queue:
+        queue = WorkQueue(Path(args.work_queue).expanduser().resolve(), lease_ttl_s=args.lease_ttl)
+        # Gewicht = Dateigröße: große Dateien zuerst vergeben
+        queue.ensure_seeded([(p.name, p.stat().st_size) for p in semantic_files], stage="qa")
+        logging.info("Work-Queue: %s", queue.status())
+        semantic_files_sharded = semantic_files
+    elif args.shard_plan:
+        plan = load_shard_plan(Path(args.shard_plan).expanduser().resolve())
+        semantic_files_sharded = files_for_shard(
+            plan, args.shard_id, args.num_shards, semantic_files, stage="qa"
+        )
+        logging.info("Shard-Plan: %s", args.shard_plan)
+    elif args.num_shards == 1:
         semantic_files_sharded = semantic_files
     else:
         semantic_files_sharded = [
@@ -1464,12 +1798,13 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
 
     semantic_files = semantic_files_sharded
 
-    logging.info(
-        "Sharding: shard_id=%d / num_shards=%d -> %d semantic-Dateien",
-        args.shard_id,
-        args.num_shards,
-        len(semantic_files),
-    )
+    if queue is None:
+        logging.info(
+            "Sharding: shard_id=%d / num_shards=%d -> %d semantic-Dateien",
+            args.shard_id,
+            args.num_shards,
+            len(semantic_files),
+        )
 
     if not semantic_files:
         logging.warning("Keine semantic/json-Dateien in %s gefunden.", semantic_dir)
@@ -1477,41 +1812,104 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
 
     global_qa_limit = int(cfg.sampling.get("global_qa_limit", 0))
 
-    # Hinweis: Wenn wir per Sharding auf mehrere Jobs skalieren, ist ein "globales" Limit über alle Shards
-    # ohne Koordination nicht sauber durchsetzbar. Daher teilen wir ein gesetztes global_qa_limit auf die Shards auf.
-    if global_qa_limit > 0 and args.num_shards > 1:
-        global_qa_limit = int(math.ceil(global_qa_limit / float(args.num_shards)))
-        logging.info(
-            "global_qa_limit wird auf Shards aufgeteilt -> pro Shard: %d",
-            global_qa_limit,
-        )
+    # Mehrere Shards/Tasks: global_qa_limit über ein gemeinsames Ledger auf dem Workspace
+    # koordinieren (blockweise Reservierung). Ohne Ledger-Pfad bleibt nur die alte
+    # Aufteilung ceil(limit / num_shards), die das Ziel meist verfehlt.
+    budget_ledger: Optional[BudgetLedger] = None
+    if global_qa_limit > 0 and (args.num_shards > 1 or queue is not None):
+        ledger_path = resolve_budget_ledger_path(args.budget_ledger, workspace_root)
+        if ledger_path is not None:
+            array_task = os.environ.get("SLURM_ARRAY_TASK_ID")
+            budget_ledger = BudgetLedger(
+                ledger_path,
+                limit=global_qa_limit,
+                owner=f"task_{array_task}" if queue is not None and array_task else f"shard_{args.shard_id}",
+                block_size=int(cfg.sampling.get("budget_block_size", DEFAULT_BLOCK_SIZE)),
+            )
+            global_qa_limit = 0  # lokal startet leer, wird aus dem Ledger gezogen
+            logging.info(
+                "Globales Q/A-Budget über Ledger %s (block_size=%d)",
+                ledger_path,
+                budget_ledger.block_size,
+            )
+        elif args.num_shards > 1:
+            global_qa_limit = int(math.ceil(global_qa_limit / float(args.num_shards)))
+            logging.warning(
+                "Kein Budget-Ledger (--budget-ledger / SLURM_ARRAY_JOB_ID) – global_qa_limit wird "
+                "statisch auf Shards aufgeteilt -> pro Shard: %d",
+                global_qa_limit,
+            )
 
     global_state: Dict[str, Any] = {
-        "remaining_global": global_qa_limit if global_qa_limit > 0 else None
+        "remaining_global": global_qa_limit if (global_qa_limit > 0 or budget_ledger is not None) else None,
+        "budget_ledger": budget_ledger,
+        "llm_warmup": global_warmup,
     }
 
     total_written_global = 0
     t_start = time.time()
 
-    for in_path in semantic_files:
-        remaining_global = global_state.get("remaining_global")
-        if isinstance(remaining_global, int) and remaining_global <= 0:
-            break
+    def _budget_exhausted() -> bool:
+        return global_budget_exhausted(global_state)
 
+    def _process(in_path: Path) -> int:
         in_basename = in_path.stem
         pattern = cfg.output.get("output_file_pattern", "{input_basename}.qa_candidates.jsonl")
         out_name = pattern.format(input_basename=in_basename)
         out_path = qa_candidates_dir / out_name
 
         written = process_semantic_file(
-            in_path=in_path,
-            out_path=out_path,
+            in_path=staging.stage_in(in_path),
+            out_path=staging.track_output(out_path),
             cfg=cfg,
             retriever=retriever,
             metric_info=metric_info,
             global_state=global_state,
         )
-        total_written_global += written
+        # Mit Queue gilt das Item nach der Rückkehr als erledigt -> Ausgabe sofort sichern;
+        # ein fehlgeschlagener Sync gibt die Lease frei (drain_queue)
+        staging.checkpoint(force=queue is not None, raise_errors=queue is not None)
+        return written
+
+    try:
+        if queue is not None:
+            files_by_name = {p.name: p for p in semantic_files}
+
+            def _handle(name: str) -> None:
+                nonlocal total_written_global
+                in_path = files_by_name.get(name)
+                if in_path is None:
+                    raise FileNotFoundError(f"Queue-Item nicht im semantic-Verzeichnis: {name}")
+                total_written_global += _process(in_path)
+
+            # Budget mitten in einer Datei erschöpft -> Item bleibt offen (Resume überspringt fertige Anker)
+            drain_queue(queue, _handle, should_stop=_budget_exhausted)
+        else:
+            for in_path in semantic_files:
+                if _budget_exhausted():
+                    break
+                total_written_global += _process(in_path)
+    finally:
+        if budget_ledger is not None:
+            # Nicht verbrauchte Reservierung zurückgeben, damit andere Shards sie nutzen können
+            # (auch bei Fehlern, sonst bleibt der Block reserviert)
+            budget_ledger.give_back(int(global_state.get("remaining_global") or 0))
+            global_state["remaining_global"] = 0
+
+    staging.finalize()
+
+    if budget_ledger is not None:
+        snap = budget_ledger.snapshot()
+        logging.info(
+            "Q/A-Budget: dieser Shard (%s) hat %d verbraucht; global %d/%d, Rest %d",
+            budget_ledger.owner,
+            budget_ledger.drawn_total - budget_ledger.returned_total,
+            snap["consumed"],
+            snap["limit"],
+            snap["remaining"],
+        )
+        for owner, consumed in snap["shards"].items():
+            logging.info("Q/A-Budget pro Shard: %s=%d", owner, consumed)
 
     elapsed = time.time() - t_start
     logging.info(
@@ -1519,6 +1917,13 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
         total_written_global,
         elapsed,
     )
+    for w in global_state.get("llm_warmup") or []:
+        logging.info(
+            "LLM-Warm-up: model=%s first_request=%.1fs load_duration=%s",
+            w.get("model"),
+            float(w.get("first_request_s") or 0.0),
+            w.get("load_duration_s"),
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+index_generations.py
+
+Versionierte Index-Generationen unter indices/faiss/ mit atomarem Umschalten.
+
+Problem:
+- embed_chunks.py hat contextual.index, contextual_meta.jsonl und
+  contextual_config.json nacheinander in place überschrieben. Ein QA-Job, der
+  mitten im Rebuild startet, lädt neuen Index mit alten Metadaten.
+
+Layout:
+  indices/faiss/
+    CURRENT                         # Name der aktuellen Generation (eine Zeile)
+    generations/<gen_id>/           # gen_id = <YYYYmmdd-HHMMSS>_<pid>, sortiert = zeitlich
+      contextual.index, contextual_meta.jsonl, contextual_meta.store/,
+      contextual_config.json, embedding_store.*
+      manifest.json                 # Dateien mit Größe + SHA1, zuletzt geschrieben
+      .readers/<host>-<pid>         # Lease je lesendem Prozess (nicht im Manifest)
+
+Ablauf:
+- embed_chunks.py baut in eine neue Generation, schreibt manifest.json und
+  veröffentlicht sie per publish_generation(): CURRENT wird über eine temporäre
+  Datei und os.replace() atomar ersetzt. Leser sehen also immer entweder die
+  alte oder die neue Generation vollständig.
+- resolve_index_dir() liefert das Verzeichnis der aktuellen Generation; ohne
+  CURRENT (Indizes von vor der Umstellung) das Basisverzeichnis selbst.
+- verify_generation() prüft Größen (schnell) bzw. zusätzlich SHA1.
+- gc_generations() löscht alte Generationen (die aktuelle und die keep neuesten
+  bleiben) sowie abgebrochene Builds ohne Manifest, die älter als einen Tag sind.
+  Generationen mit aktiven Leser-Leases bleiben stehen: FaissRetriever öffnet
+  einige Dateien erst bei Bedarf (BM25, embedding_store, Dokument-Index), ein
+  bloßes Mapping beim Laden reicht also nicht. acquire_reader_lease() legt
+  .readers/<host>-<pid> an und entfernt es bei Prozessende; Leases toter
+  Prozesse auf demselben Host bzw. älter als READER_LEASE_MAX_AGE_S gelten als
+  verwaist.
+
+CLI:
+
+  python scripts/index_generations.py --workspace-root <ws> status
+  python scripts/index_generations.py --workspace-root <ws> verify [--checksums]
+  python scripts/index_generations.py --workspace-root <ws> gc [--keep 2]
+  python scripts/index_generations.py --workspace-root <ws> publish <gen_id>   # Rollback
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger("index_generations")
+
+GENERATIONS_SUBDIR = "generations"
+CURRENT_NAME = "CURRENT"
+MANIFEST_NAME = "manifest.json"
+DEFAULT_KEEP = 2
+INCOMPLETE_MAX_AGE_S = 86400.0
+READERS_SUBDIR = ".readers"
+READER_LEASE_MAX_AGE_S = 3 * 86400.0
+
+# Leases dieses Prozesses (eine pro Generation, auch bei mehreren Retrievern)
+_LEASES: Set[str] = set()
+
+_BUFSIZE = 8 * 1024 * 1024
+
+
+def _sha1_file(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(_BUFSIZE)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+def generations_root(indices_root: str) -> str:
+    return os.path.join(indices_root, GENERATIONS_SUBDIR)
+
+
+def current_generation(indices_root: str) -> Optional[str]:
+    """Name der aktuellen Generation oder None (kein CURRENT)."""
+    path = os.path.join(indices_root, CURRENT_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            gen_id = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return gen_id or None
+
+
+def resolve_index_dir(indices_root: str) -> str:
+    """Verzeichnis der aktuellen Generation bzw. indices_root selbst (altes Layout)."""
+    gen_id = current_generation(indices_root)
+    if gen_id is None:
+        return indices_root
+    gen_dir = os.path.join(generations_root(indices_root), gen_id)
+    if not os.path.isdir(gen_dir):
+        raise FileNotFoundError(f"CURRENT zeigt auf fehlende Generation: {gen_dir}")
+    return gen_dir
+
+
+def create_generation(indices_root: str) -> str:
+    """Legt ein neues, leeres Generationsverzeichnis an und gibt den Pfad zurück."""
+    gen_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{os.getpid()}"
+    gen_dir = os.path.join(generations_root(indices_root), gen_id)
+    os.makedirs(gen_dir)
+    return gen_dir
+
+
+def _iter_files(gen_dir: str) -> List[str]:
+    rel_paths: List[str] = []
+    for root, _, files in os.walk(gen_dir):
+        for name in files:
+            rel = os.path.relpath(os.path.join(root, name), gen_dir)
+            if rel != MANIFEST_NAME and not name.endswith(".tmp") and not rel.startswith(READERS_SUBDIR + os.sep):
+                rel_paths.append(rel)
+    return sorted(rel_paths)
+
+
+def write_manifest(gen_dir: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Schreibt manifest.json mit Größe und SHA1 aller Dateien der Generation."""
+    files = {}
+    for rel in _iter_files(gen_dir):
+        path = os.path.join(gen_dir, rel)
+        files[rel] = {"size": os.path.getsize(path), "sha1": _sha1_file(path)}
+    manifest = {
+        "generation": os.path.basename(gen_dir),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "files": files,
+        **(extra or {}),
+    }
+    tmp = os.path.join(gen_dir, MANIFEST_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(gen_dir, MANIFEST_NAME))
+    return manifest
+
+
+def load_manifest(gen_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(gen_dir, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def refresh_manifest(gen_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Schreibt das Manifest einer Generation neu, nachdem nachträglich Dateien
+    (Meta-Store, BM25, Dokument-Index, kNN-Graph) hinzugekommen sind; die
+    Zusatzfelder bleiben erhalten. Ohne Manifest (altes Layout) None.
+    """
+    manifest = load_manifest(gen_dir)
+    if manifest is None:
+        return None
+    extra = {k: v for k, v in manifest.items() if k not in ("generation", "created", "files")}
+    return write_manifest(gen_dir, extra=extra)
+
+
+def verify_generation(gen_dir: str, checksums: bool = False) -> List[str]:
+    """
+    Prüft eine Generation gegen ihr Manifest. Rückgabe: Liste von Problemen
+    (leer = in Ordnung). checksums=True liest alle Dateien (SHA1).
+    """
+    manifest = load_manifest(gen_dir)
+    if manifest is None:
+        return [f"kein {MANIFEST_NAME} in {gen_dir}"]
+    problems: List[str] = []
+    for rel, info in manifest.get("files", {}).items():
+        path = os.path.join(gen_dir, rel)
+        if not os.path.isfile(path):
+            problems.append(f"fehlt: {rel}")
+            continue
+        if os.path.getsize(path) != int(info["size"]):
+            problems.append(f"Größe stimmt nicht: {rel}")
+            continue
+        if checksums and _sha1_file(path) != info["sha1"]:
+            problems.append(f"SHA1 stimmt nicht: {rel}")
+    return problems
+
+
+def publish_generation(indices_root: str, gen_id: str) -> None:
+    """Setzt CURRENT atomar auf gen_id (die Generation muss ein Manifest haben)."""
+    gen_dir = os.path.join(generations_root(indices_root), gen_id)
+    problems = verify_generation(gen_dir)
+    if problems:
+        raise RuntimeError(f"Generation {gen_id} nicht veröffentlichbar: {'; '.join(problems)}")
+    tmp = os.path.join(indices_root, f".{CURRENT_NAME}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(gen_id + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(indices_root, CURRENT_NAME))
+    logger.info("Index-Generation veröffentlicht: %s", gen_id)
+
+
+def list_generations(indices_root: str) -> List[str]:
+    root = generations_root(indices_root)
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+
+
+def acquire_reader_lease(gen_dir: str) -> Optional[str]:
+    """
+    Meldet den Prozess als Leser der Generation gen_dir an (schützt sie vor
+    gc_generations); wird bei Prozessende entfernt. Ohne Generations-Layout None.
+    """
+    if os.path.basename(os.path.dirname(os.path.abspath(gen_dir))) != GENERATIONS_SUBDIR:
+        return None
+    readers_dir = os.path.join(gen_dir, READERS_SUBDIR)
+    path = os.path.join(readers_dir, f"{socket.gethostname()}-{os.getpid()}")
+    if path in _LEASES:
+        return path
+    try:
+        os.makedirs(readers_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"host": socket.gethostname(), "pid": os.getpid(), "started": time.time()}, f)
+    except OSError as exc:
+        logger.warning("Leser-Lease für %s nicht anlegbar: %s", gen_dir, exc)
+        return None
+    _LEASES.add(path)
+    atexit.register(release_reader_lease, path)
+    return path
+
+
+def release_reader_lease(path: Optional[str]) -> None:
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def active_readers(gen_dir: str) -> List[str]:
+    """Aktive Leser-Leases der Generation (<host>-<pid>); verwaiste werden entfernt."""
+    readers_dir = os.path.join(gen_dir, READERS_SUBDIR)
+    try:
+        names = sorted(os.listdir(readers_dir))
+    except FileNotFoundError:
+        return []
+    host = socket.gethostname()
+    active: List[str] = []
+    now = time.time()
+    for name in names:
+        path = os.path.join(readers_dir, name)
+        lease_host, _, pid = name.rpartition("-")
+        try:
+            stale = now - os.path.getmtime(path) > READER_LEASE_MAX_AGE_S
+        except FileNotFoundError:
+            continue
+        if lease_host == host and pid.isdigit():
+            stale = stale or not _pid_alive(int(pid))
+        if stale:
+            release_reader_lease(path)
+        else:
+            active.append(name)
+    return active
+
+
+def gc_generations(indices_root: str, keep: int = DEFAULT_KEEP) -> List[str]:
+    """
+    Löscht alte bzw. abgebrochene Generationen; Rückgabe: gelöschte gen_ids.
+    Generationen mit aktiven Leser-Leases (active_readers) bleiben erhalten.
+    """
+    current = current_generation(indices_root)
+    root = generations_root(indices_root)
+    complete = [g for g in list_generations(indices_root) if load_manifest(os.path.join(root, g)) is not None]
+    keep_set = set(complete[-max(1, int(keep)):])
+    if current:
+        keep_set.add(current)
+
+    removed: List[str] = []
+    now = time.time()
+    for gen_id in list_generations(indices_root):
+        if gen_id in keep_set:
+            continue
+        gen_dir = os.path.join(root, gen_id)
+        if gen_id not in complete and now - os.path.getmtime(gen_dir) < INCOMPLETE_MAX_AGE_S:
+            continue  # evtl. laufender Build
+        readers = active_readers(gen_dir)
+        if readers:
+            logger.info("Generation %s wird noch gelesen (%s) – nicht gelöscht.", gen_id, ", ".join(readers))
+            continue
+        shutil.rmtree(gen_dir, ignore_errors=True)
+        removed.append(gen_id)
+    if removed:
+        logger.info("Alte Index-Generationen gelöscht: %s", ", ".join(removed))
+    return removed
+
+
+def status(indices_root: str) -> Dict[str, Any]:
+    root = generations_root(indices_root)
+    gens = []
+    for gen_id in list_generations(indices_root):
+        manifest = load_manifest(os.path.join(root, gen_id))
+        gens.append(
+            {
+                "generation": gen_id,
+                "complete": manifest is not None,
+                "num_vectors": (manifest or {}).get("num_vectors"),
+                "size_mb": round(sum(int(f["size"]) for f in (manifest or {}).get("files", {}).values()) / 1e6, 1),
+            }
+        )
+    return {"indices_root": indices_root, "current": current_generation(indices_root), "generations": gens}
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Index-Generationen anzeigen, prüfen, aufräumen, umschalten.")
+    parser.add_argument("--workspace-root", required=True, help="Workspace-Root mit indices/faiss.")
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help="gc: Anzahl neuester Generationen behalten.")
+    parser.add_argument("--checksums", action="store_true", help="verify: zusätzlich SHA1 aller Dateien prüfen.")
+    parser.add_argument("command", choices=["status", "verify", "gc", "publish"], help="Aktion.")
+    parser.add_argument("generation", nargs="?", default=None, help="publish: gen_id (z.B. für Rollback).")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    indices_root = os.path.join(os.path.abspath(args.workspace_root), "indices", "faiss")
+    if args.command == "verify":
+        gen_dir = resolve_index_dir(indices_root)
+        problems = verify_generation(gen_dir, checksums=args.checksums)
+        for p in problems:
+            logger.error("%s", p)
+        if problems:
+            return 1
+        logger.info("Generation in Ordnung: %s", gen_dir)
+    elif args.command == "gc":
+        gc_generations(indices_root, keep=args.keep)
+    elif args.command == "publish":
+        if not args.generation:
+            logger.error("publish benötigt eine gen_id.")
+            return 1
+        publish_generation(indices_root, args.generation)
+    print(json.dumps(status(indices_root), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
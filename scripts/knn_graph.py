@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+knn_graph.py
+
+Vorberechneter kNN-Graph über den gesamten FAISS-Index.
+
+Problem:
+- generate_qa_candidates.py fragt bei jedem Lauf (und jeder Config-Änderung)
+  dieselben top_k_faiss Nachbarn derselben Chunks neu ab.
+
+Lösung:
+- Ein Offline-Self-Join: alle Vektoren werden blockweise als Anfragen gegen den
+  Index gesucht (Batch-Search wie FaissRetriever.get_neighbors_for_chunks).
+- Ergebnis neben dem Index (in der Generation, siehe index_generations.py):
+    knn_graph_ids.i32      int32   (ntotal, k), Zeile = faiss_id, -1 = leer
+    knn_graph_scores.f16   float16 (ntotal, k) (float32 als .f32, falls die
+                           Scores nicht in float16 passen, z.B. große L2-Distanzen)
+    knn_graph.json         Header mit k, Metrik und Fingerprint des Index;
+                           wird zuletzt geschrieben (Header vorhanden = vollständig)
+- Der Chunk selbst ist nicht enthalten (include_self=False).
+- FaissRetriever nutzt den Graphen, wenn er zum geladenen Index passt
+  (Fingerprint: index_path + build_timestamp aus der Config, ntotal,
+  Dateigröße des Index) und top_k <= k ist; sonst Live-Suche.
+
+CLI:
+
+  python scripts/knn_graph.py --workspace-root <ws> --k 40 [--threads 16]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+logger = logging.getLogger("knn_graph")
+
+GRAPH_HEADER = "knn_graph.json"
+GRAPH_IDS = "knn_graph_ids.i32"
+GRAPH_SCORES = "knn_graph_scores"
+GRAPH_VERSION = 1
+DEFAULT_K = 40
+DEFAULT_BATCH_SIZE = 4096
+
+_FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+
+def graph_files(indices_dir: str) -> List[str]:
+    """Vorhandene Graph-Dateien (z.B. für Staging), Header zuletzt."""
+    header = load_header(indices_dir)
+    if header is None:
+        return []
+    return [
+        os.path.join(indices_dir, GRAPH_IDS),
+        os.path.join(indices_dir, header["scores_file"]),
+        os.path.join(indices_dir, GRAPH_HEADER),
+    ]
+
+
+def index_fingerprint(
+    indices_dir: str,
+    config: Dict[str, Any],
+    ntotal: int,
+    index_name: str = "contextual.index",
+) -> Dict[str, Any]:
+    """Merkmale, an denen ein Graph seinem Index zugeordnet wird (auch in node-lokalen Kopien gültig)."""
+    index_path = os.path.join(indices_dir, index_name)
+    return {
+        "index_path": config.get("index_path"),
+        "build_timestamp": config.get("build_timestamp"),
+        "ntotal": int(ntotal),
+        "index_size": os.path.getsize(index_path) if os.path.isfile(index_path) else None,
+    }
+
+
+def load_header(indices_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(indices_dir, GRAPH_HEADER)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class KnnGraph:
+    """
+    Gemappter kNN-Graph: ids[faiss_id] / scores[faiss_id] sind die k nächsten
+    Nachbarn (absteigend nach Ähnlichkeit bzw. aufsteigend nach Distanz).
+    """
+
+    def __init__(self, indices_dir: str, header: Dict[str, Any]) -> None:
+        self.indices_dir = indices_dir
+        self.header = header
+        self.k = int(header["k"])
+        self.ntotal = int(header["fingerprint"]["ntotal"])
+        shape = (self.ntotal, self.k)
+        self.ids = np.memmap(os.path.join(indices_dir, GRAPH_IDS), dtype="int32", mode="r", shape=shape)
+        self.scores = np.memmap(
+            os.path.join(indices_dir, header["scores_file"]), dtype=header["score_dtype"], mode="r", shape=shape
+        )
+
+    def row(self, faiss_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(Scores als float32, faiss_ids) der Nachbarn von faiss_id."""
+        return np.asarray(self.scores[faiss_id], dtype="float32"), np.asarray(self.ids[faiss_id])
+
+    def score_tolerance(self, value: float) -> float:
+        """Rundungsfehler gespeicherter Scores nahe value (eine Stelle im Score-Format, z.B. float16)."""
+        return float(np.spacing(np.abs(np.asarray(value, dtype=self.scores.dtype))))
+
+
+def load_knn_graph(indices_dir: str, fingerprint: Dict[str, Any]) -> Optional[KnnGraph]:
+    """Lädt den Graphen, wenn vorhanden und passend zum Index; sonst None."""
+    header = load_header(indices_dir)
+    if header is None:
+        return None
+    if int(header.get("version", 0)) != GRAPH_VERSION or header.get("fingerprint") != fingerprint:
+        logger.warning(
+            "kNN-Graph in %s passt nicht zum Index (veraltet) – Live-Suche. Neu bauen mit scripts/knn_graph.py.",
+            indices_dir,
+        )
+        return None
+    return KnnGraph(indices_dir, header)
+
+
+def _drop_self(
+    faiss_ids: np.ndarray, distances: np.ndarray, indices: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Entfernt pro Zeile den Anfrage-Chunk selbst (Reihenfolge bleibt) und kürzt auf k Spalten."""
+    is_self = indices == faiss_ids[:, None]
+    order = np.argsort(is_self, axis=1, kind="stable")
+    return (
+        np.take_along_axis(distances, order, axis=1)[:, :k],
+        np.take_along_axis(indices, order, axis=1)[:, :k],
+    )
+
+
+def build_knn_graph(
+    retriever: Any,
+    k: int = DEFAULT_K,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    num_threads: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Self-Join über alle Vektoren des Retrievers (FaissRetriever) und Schreiben
+    des Graphen nach retriever.indices_root. Rückgabe: Header.
+    """
+    # faiss_retriever importiert dieses Modul – daher hier lokal
+    from scripts.faiss_retriever import omp_threads  # type: ignore
+
+    indices_dir = retriever.indices_root
+    ntotal = int(retriever.index.ntotal)
+    k = max(1, min(int(k), ntotal - 1))
+    ids_out = np.full((ntotal, k), -1, dtype="int32")
+    scores_out = np.zeros((ntotal, k), dtype="float32")
+
+    t0 = time.time()
+    last_log = t0
+    with omp_threads(num_threads):
+        for start in range(0, ntotal, batch_size):
+            block = np.arange(start, min(start + batch_size, ntotal), dtype="int64")
+            distances, indices = retriever.index.search(retriever.reconstruct_vectors(block), k + 1)
+            d, i = _drop_self(block, distances, indices, k)
+            ids_out[start : start + len(block)] = i
+            scores_out[start : start + len(block)] = d
+            if time.time() - last_log > 30.0:
+                last_log = time.time()
+                logger.info("kNN-Graph: %d/%d Zeilen (%.0fs)", start + len(block), ntotal, last_log - t0)
+
+    valid = scores_out[ids_out >= 0]
+    score_dtype = "float16"
+    if valid.size and float(np.abs(valid).max()) > _FLOAT16_MAX:
+        logger.warning("Scores passen nicht in float16 – speichere float32.")
+        score_dtype = "float32"
+    scores_file = f"{GRAPH_SCORES}.{'f16' if score_dtype == 'float16' else 'f32'}"
+
+    header = {
+        "version": GRAPH_VERSION,
+        "k": k,
+        "metric": retriever.config.get("metric"),
+        "score_dtype": score_dtype,
+        "scores_file": scores_file,
+        "include_self": False,
+        "fingerprint": index_fingerprint(indices_dir, retriever.config, ntotal),
+        "build_seconds": round(time.time() - t0, 1),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+
+    # Alten Header zuerst entfernen: Leser sehen nie neue Arrays mit altem Header
+    header_path = os.path.join(indices_dir, GRAPH_HEADER)
+    if os.path.exists(header_path):
+        os.remove(header_path)
+    for name, arr in ((GRAPH_IDS, ids_out), (scores_file, scores_out.astype(score_dtype))):
+        tmp = os.path.join(indices_dir, f".{name}.{os.getpid()}.tmp")
+        arr.tofile(tmp)
+        os.replace(tmp, os.path.join(indices_dir, name))
+    tmp = header_path + f".{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, header_path)
+
+    logger.info(
+        "kNN-Graph geschrieben: %s (ntotal=%d, k=%d, %s, %.1f MB, %.1fs)",
+        indices_dir,
+        ntotal,
+        k,
+        score_dtype,
+        (ids_out.nbytes + ntotal * k * np.dtype(score_dtype).itemsize) / 1e6,
+        header["build_seconds"],
+    )
+    return header
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="kNN-Graph (Self-Join) über den FAISS-Index vorberechnen.")
+    parser.add_argument("--workspace-root", required=True, help="Workspace-Root mit indices/faiss.")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="Nachbarn pro Chunk (>= top_k_faiss der QA-Config).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Anfragen pro index.search().")
+    parser.add_argument("--threads", type=int, default=None, help="OpenMP-Threads für FAISS (Default: alle).")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
+    from scripts.faiss_retriever import FaissRetriever  # type: ignore
+    from scripts.index_generations import refresh_manifest  # type: ignore
+
+    retriever = FaissRetriever(workspace_root=args.workspace_root, use_knn_graph=False)
+    build_knn_graph(retriever, k=args.k, batch_size=args.batch_size, num_threads=args.threads)
+    refresh_manifest(retriever.indices_root)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
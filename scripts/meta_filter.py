@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+meta_filter.py
+
+Metadaten-Filter für die FAISS-Suche (Pushdown statt Nachfiltern in Python).
+
+Ein Filter ist eine UND-Verknüpfung von Klauseln (feld, op, werte):
+
+  in            Wert (bzw. ein Listenelement) in werte          z.B. language
+  not_in        kein Wert in werte
+  any           mindestens ein Listenelement in werte           z.B. content_type
+  none          kein Listenelement in werte                     z.B. artifact_role
+  any_or_empty  Liste leer oder mindestens ein Element in werte z.B. domain
+
+Feldwerte werden wie get_semantic_field() in generate_qa_candidates.py gelesen:
+Top-Level-Feld des Meta-Records, sonst aus dem semantic-Block.
+
+MetaFilter.mask(meta) wertet den Filter vektorisiert über die Spalten des
+Meta-Stores aus (scripts/meta_store.py) und liefert eine bool-Maske über alle
+faiss_ids; Zeilen, deren Wert nicht in einer Spalte steht, werden einzeln über
+den materialisierten Record geprüft. FaissRetriever macht daraus einen
+IDSelectorBitmap (bzw. durchsucht sehr kleine Treffermengen exakt mit numpy).
+
+Beispiel:
+
+  MetaFilter.from_dict({
+      "language": {"in": ["de", "en"]},
+      "artifact_role": {"none": ["reference"]},
+  })
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.meta_store import LIST_IN_BLOB, LIST_IN_COLUMN, NOT_IN_COLUMN  # type: ignore
+
+OPS: Tuple[str, ...] = ("in", "not_in", "any", "none", "any_or_empty")
+
+
+def field_values(rec: Dict[str, Any], field: str) -> List[str]:
+    """Feldwert als Liste (Top-Level vor semantic; Skalar -> [wert], None -> [])."""
+    if field in rec:
+        value = rec[field]
+    else:
+        semantic = rec.get("semantic") or {}
+        value = semantic.get(field) if isinstance(semantic, dict) else None
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def _clause_matches(values: List[str], op: str, allowed: frozenset) -> bool:
+    hit = any(v in allowed for v in values)
+    if op in ("in", "any"):
+        return hit
+    if op in ("not_in", "none"):
+        return not hit
+    return hit or not values  # any_or_empty
+
+
+class MetaFilter:
+    """Unveränderlicher Filter; key ist stabil und eignet sich als Cache-Schlüssel."""
+
+    def __init__(self, clauses: Sequence[Tuple[str, str, Sequence[str]]]) -> None:
+        normalized: List[Tuple[str, str, frozenset]] = []
+        for field, op, values in clauses:
+            if op not in OPS:
+                raise ValueError(f"Unbekannter Filter-Operator {op!r} für Feld {field!r} (erlaubt: {OPS}).")
+            normalized.append((str(field), op, frozenset(str(v) for v in values)))
+        self.clauses: Tuple[Tuple[str, str, frozenset], ...] = tuple(sorted(normalized, key=lambda c: (c[0], c[1])))
+        self.key = json.dumps(self.to_spec(), ensure_ascii=False)
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Dict[str, Sequence[str]]]) -> "MetaFilter":
+        """{"feld": {"op": [werte]}} -> MetaFilter"""
+        return cls([(field, op, values) for field, ops in spec.items() for op, values in ops.items()])
+
+    @classmethod
+    def from_spec(cls, spec: Sequence[Sequence[Any]]) -> "MetaFilter":
+        """[[feld, op, [werte]], ...] (z.B. aus JSON, siehe to_spec) -> MetaFilter"""
+        return cls([(str(field), str(op), list(values)) for field, op, values in spec])
+
+    def to_spec(self) -> List[List[Any]]:
+        """JSON-taugliche Darstellung, Umkehrung von from_spec()."""
+        return [[f, op, sorted(vals)] for f, op, vals in self.clauses]
+
+    def __bool__(self) -> bool:
+        return bool(self.clauses)
+
+    def __repr__(self) -> str:
+        return f"MetaFilter({self.key})"
+
+    def matches(self, rec: Dict[str, Any]) -> bool:
+        """Prüft einen einzelnen Meta-Record."""
+        return all(_clause_matches(field_values(rec, f), op, vals) for f, op, vals in self.clauses)
+
+    def mask(self, meta: Any) -> np.ndarray:
+        """
+        bool-Maske über alle Zeilen von meta (MetaStore oder Liste von Dicts).
+        """
+        n = len(meta)
+        if not hasattr(meta, "has_column"):
+            return np.fromiter((self.matches(meta[i]) for i in range(n)), dtype=bool, count=n)
+
+        result = np.ones(n, dtype=bool)
+        unknown = np.zeros(n, dtype=bool)
+        for field, op, allowed in self.clauses:
+            clause = self._column_mask(meta, field, op, allowed)
+            if clause is None:
+                # keine Spalte (z.B. älterer Store): alle verbleibenden Zeilen einzeln prüfen
+                unknown[:] = True
+                continue
+            ok, unk = clause
+            result &= ok
+            unknown |= unk
+        # Werte außerhalb der Spalten (Blob): Record prüfen
+        for row in np.flatnonzero(unknown & result):
+            result[row] = self.matches(meta[int(row)])
+        return result
+
+    @staticmethod
+    def _column_mask(
+        meta: Any, field: str, op: str, allowed: frozenset
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(Treffer, unbekannt) aus einer Store-Spalte; None, wenn es keine Spalte gibt."""
+        if not meta.has_column(field):
+            return None
+        vocab = meta.vocab[field]
+        allowed_codes = np.array(
+            [code for code, v in enumerate(vocab) if v is not None and v in allowed], dtype=np.uint16
+        )
+
+        if field in meta.header["scalar_fields"]:
+            codes = np.asarray(meta.scalar_codes(field))
+            hit = np.isin(codes, allowed_codes)
+            empty = codes == 0
+            unknown = codes == NOT_IN_COLUMN
+        else:
+            codes, offsets, present = (np.asarray(a) for a in meta.list_columns(field))
+            n = len(present)
+            lengths = np.diff(offsets)
+            rows = np.repeat(np.arange(n), lengths)
+            hit = np.zeros(n, dtype=bool)
+            hit[rows[np.isin(codes, allowed_codes)]] = True
+            empty = (present != LIST_IN_COLUMN) | (lengths == 0)
+            unknown = present == LIST_IN_BLOB
+
+        if op in ("in", "any"):
+            ok = hit
+        elif op in ("not_in", "none"):
+            ok = ~hit
+        else:
+            ok = hit | empty
+        # unbekannte Zeilen vorerst zulassen, mask() prüft sie einzeln
+        return ok | unknown, unknown
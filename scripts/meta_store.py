@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+meta_store.py
+
+Kompakter, spaltenorientierter Metadaten-Store zum FAISS-Index
+(indices/faiss/contextual_meta.store/), erzeugt von embed_chunks.py neben
+contextual_meta.jsonl.
+
+Problem:
+- FaissRetriever hat bisher jede Zeile von contextual_meta.jsonl per json.loads
+  in ein Dict geladen (inkl. semantic-Block, meta, Pfade) und ein Dict mit zwei
+  Keys pro Chunk aufgebaut: Minuten Startzeit und mehrere GB RSS pro Prozess.
+
+Aufbau (alle Arrays als .npy, per np.load(mmap_mode="r") gemappt):
+- header.json:           Version, Anzahl Zeilen, Vokabulare der Kategorie-Felder
+- <feld>.npy:            uint16-Codes für language / trust_level / source_type
+                         (0 = None, 0xFFFF = Wert steht im Blob bzw. fehlt)
+- <feld>_codes.npy,
+  <feld>_offsets.npy,
+  <feld>_present.npy:    Listenfelder content_type / domain (CSR-Layout;
+                         present: 0 = im Blob bzw. fehlt, 1 = Liste, 2 = None)
+- artifact_role_*.npy:   Filterspalte für semantic.artifact_role (nur für
+                         Filter, siehe meta_filter.py; der Wert bleibt im Blob)
+- uid_hash/uid_row,
+  cid_hash/cid_row:      sortierte 64-bit-Hashes von chunk_uid / chunk_id ->
+                         faiss_id (Lookup per Binärsuche, Treffer wird geprüft)
+- ids.bin, ids_offsets.npy: chunk_id und doc_id je Zeile als UTF-8 (zusätzlich
+                         zum Blob), damit Treffer sie ohne JSON-Parsen tragen
+                         (NeighborHit in faiss_retriever.py); ältere Stores: fehlt
+- blob.bin, blob_offsets.npy: restliche Felder je Zeile als JSON
+
+Nur tatsächlich zurückgegebene Zeilen werden zu Dicts materialisiert; der
+Rest bleibt im Page-Cache und wird von mehreren Prozessen geteilt.
+
+CLI (bestehenden Index nachrüsten):
+
+  python scripts/meta_store.py \
+      --workspace-root /beegfs/scratch/workspace/es_phdoeble-rag_pipeline
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import orjson  # type: ignore
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.index_generations import refresh_manifest, resolve_index_dir  # type: ignore
+
+logger = logging.getLogger("meta_store")
+
+STORE_VERSION = 1
+STORE_SUFFIX = ".store"
+
+SCALAR_FIELDS: Tuple[str, ...] = ("language", "trust_level", "source_type")
+LIST_FIELDS: Tuple[str, ...] = ("content_type", "domain")
+# Listenfelder aus dem semantic-Block, nur als Filterspalte (Record bleibt unverändert)
+SEMANTIC_LIST_FIELDS: Tuple[str, ...] = ("artifact_role",)
+# Kennungen, die zusätzlich ohne Blob lesbar sind (ids.bin)
+ID_FIELDS: Tuple[str, ...] = ("chunk_id", "doc_id")
+
+LIST_IN_BLOB, LIST_IN_COLUMN, LIST_NONE = 0, 1, 2
+
+NOT_IN_COLUMN = 0xFFFF
+_MAX_VOCAB = NOT_IN_COLUMN - 1
+
+
+def key_hash(key: str) -> int:
+    """Stabiler 64-bit-Hash für chunk_uid/chunk_id."""
+    return int.from_bytes(hashlib.sha1(key.encode("utf-8")).digest()[:8], "little")
+
+
+def store_dir_for(meta_path: str) -> str:
+    """contextual_meta.jsonl -> contextual_meta.store"""
+    base, _ = os.path.splitext(meta_path)
+    return base + STORE_SUFFIX
+
+
+class MetaStoreWriter:
+    """
+    Schreibt den Store zeilenweise (Streaming) in ein temporäres Verzeichnis und
+    tauscht es in commit() gegen das bestehende aus.
+    """
+
+    def __init__(self, store_dir: str) -> None:
+        self.store_dir = os.path.abspath(store_dir)
+        self.tmp_dir = self.store_dir + ".tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.num_rows = 0
+
+        all_lists = LIST_FIELDS + SEMANTIC_LIST_FIELDS
+        self._vocab: Dict[str, Dict[Any, int]] = {f: {None: 0} for f in SCALAR_FIELDS + all_lists}
+        self._scalar: Dict[str, array] = {f: array("H") for f in SCALAR_FIELDS}
+        self._list_codes: Dict[str, array] = {f: array("H") for f in all_lists}
+        self._list_offsets: Dict[str, array] = {f: array("q", [0]) for f in all_lists}
+        self._list_present: Dict[str, array] = {f: array("B") for f in all_lists}
+        self._uid_hash = array("Q")
+        self._cid_hash = array("Q")
+        self._cid_row = array("q")
+        self._blob_offsets = array("q", [0])
+        self._blob_f = open(os.path.join(self.tmp_dir, "blob.bin"), "wb")
+        self._ids_offsets = array("q", [0])
+        self._ids_f = open(os.path.join(self.tmp_dir, "ids.bin"), "wb")
+
+    def _code(self, field: str, value: Any) -> Optional[int]:
+        vocab = self._vocab[field]
+        code = vocab.get(value)
+        if code is None:
+            if len(vocab) > _MAX_VOCAB:
+                return None
+            code = vocab[value] = len(vocab)
+        return code
+
+    def _append_list(self, field: str, value: Any, usable: bool) -> bool:
+        """Schreibt ein Listenfeld in die Spalte; True, wenn der Wert nicht in den Blob muss."""
+        present = LIST_IN_BLOB
+        if usable and value is None:
+            present = LIST_NONE
+        elif usable and isinstance(value, list) and all(isinstance(v, str) for v in value):
+            codes = [self._code(field, v) for v in value]
+            if all(c is not None for c in codes):
+                self._list_codes[field].extend(codes)  # type: ignore[arg-type]
+                present = LIST_IN_COLUMN
+        self._list_present[field].append(present)
+        self._list_offsets[field].append(len(self._list_codes[field]))
+        return present != LIST_IN_BLOB
+
+    def append(self, rec: Dict[str, Any]) -> None:
+        """Hängt einen Meta-Record an (Zeile = faiss_id)."""
+        row = self.num_rows
+        fid = rec.get("faiss_id")
+        if fid is not None and int(fid) != row:
+            raise ValueError(f"faiss_id {fid} passt nicht zur Zeile {row}.")
+        rest = {k: v for k, v in rec.items() if k != "faiss_id"}
+
+        for field in SCALAR_FIELDS:
+            code = NOT_IN_COLUMN
+            if field in rest and (rest[field] is None or isinstance(rest[field], str)):
+                c = self._code(field, rest[field])
+                if c is not None:
+                    code = c
+                    del rest[field]
+            self._scalar[field].append(code)
+
+        for field in LIST_FIELDS:
+            if self._append_list(field, rest.get(field), field in rest):
+                del rest[field]
+
+        semantic = rec.get("semantic")
+        for field in SEMANTIC_LIST_FIELDS:
+            value = semantic.get(field) if isinstance(semantic, dict) else None
+            if isinstance(value, str):
+                value = [value]
+            # Top-Level-Wert hätte Vorrang (get_semantic_field) -> dann Blob
+            self._append_list(field, value, field not in rec)
+
+        uid = rec.get("chunk_uid")
+        cid = rec.get("chunk_id")
+        self._uid_hash.append(key_hash(str(uid)) if uid is not None else 0)
+        if cid is not None:
+            self._cid_hash.append(key_hash(str(cid)))
+            self._cid_row.append(row)
+
+        data = json.dumps(rest, ensure_ascii=False).encode("utf-8")
+        self._blob_f.write(data)
+        self._blob_offsets.append(self._blob_offsets[-1] + len(data))
+
+        for field in ID_FIELDS:
+            # leer = None bzw. kein String -> Leser nimmt den Blob
+            value = rec.get(field)
+            data = value.encode("utf-8") if isinstance(value, str) else b""
+            self._ids_f.write(data)
+            self._ids_offsets.append(self._ids_offsets[-1] + len(data))
+        self.num_rows += 1
+
+    def _save(self, name: str, arr: np.ndarray) -> None:
+        np.save(os.path.join(self.tmp_dir, name + ".npy"), arr)
+
+    def commit(self) -> None:
+        self._blob_f.close()
+        self._ids_f.close()
+        n = self.num_rows
+        for field in SCALAR_FIELDS:
+            self._save(field, np.frombuffer(self._scalar[field], dtype=np.uint16))
+        for field in LIST_FIELDS + SEMANTIC_LIST_FIELDS:
+            self._save(field + "_codes", np.frombuffer(self._list_codes[field], dtype=np.uint16))
+            self._save(field + "_offsets", np.frombuffer(self._list_offsets[field], dtype=np.int64))
+            self._save(field + "_present", np.frombuffer(self._list_present[field], dtype=np.uint8))
+
+        uid_hash = np.frombuffer(self._uid_hash, dtype=np.uint64)
+        order = np.argsort(uid_hash, kind="stable")
+        self._save("uid_hash", uid_hash[order])
+        self._save("uid_row", order.astype(np.int64))
+
+        cid_hash = np.frombuffer(self._cid_hash, dtype=np.uint64)
+        cid_row = np.frombuffer(self._cid_row, dtype=np.int64)
+        order = np.lexsort((cid_row, cid_hash))
+        self._save("cid_hash", cid_hash[order])
+        self._save("cid_row", cid_row[order])
+
+        self._save("blob_offsets", np.frombuffer(self._blob_offsets, dtype=np.int64))
+        self._save("ids_offsets", np.frombuffer(self._ids_offsets, dtype=np.int64))
+
+        header = {
+            "version": STORE_VERSION,
+            "num_rows": n,
+            "scalar_fields": list(SCALAR_FIELDS),
+            "list_fields": list(LIST_FIELDS),
+            "semantic_list_fields": list(SEMANTIC_LIST_FIELDS),
+            "id_fields": list(ID_FIELDS),
+            # Index = Code; Code 0 ist immer None
+            "vocab": {
+                f: [v for v, _ in sorted(self._vocab[f].items(), key=lambda kv: kv[1])]
+                for f in SCALAR_FIELDS + LIST_FIELDS + SEMANTIC_LIST_FIELDS
+            },
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(os.path.join(self.tmp_dir, "header.json"), "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False, indent=2)
+
+        old_dir = self.store_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.isdir(self.store_dir):
+            os.replace(self.store_dir, old_dir)
+        os.replace(self.tmp_dir, self.store_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def abort(self) -> None:
+        self._blob_f.close()
+        self._ids_f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def write_meta_store(records: Iterable[Dict[str, Any]], store_dir: str) -> int:
+    writer = MetaStoreWriter(store_dir)
+    try:
+        for rec in records:
+            writer.append(rec)
+    except Exception:
+        writer.abort()
+        raise
+    writer.commit()
+    return writer.num_rows
+
+
+def _iter_jsonl(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield _loads(line)
+
+
+def build_from_jsonl(meta_path: str, store_dir: Optional[str] = None) -> str:
+    """Erzeugt den Store aus contextual_meta.jsonl (Zeile i muss faiss_id i sein)."""
+    store_dir = store_dir or store_dir_for(meta_path)
+    n = write_meta_store(_iter_jsonl(meta_path), store_dir)
+    logger.info("Meta-Store geschrieben: %s (%d Zeilen).", store_dir, n)
+    return store_dir
+
+
+class MetaStore:
+    """
+    Lesezugriff auf den Store. Verhält sich wie eine read-only Liste von
+    Meta-Dicts (store[faiss_id]); jeder Zugriff materialisiert ein neues Dict.
+    """
+
+    def __init__(self, store_dir: str) -> None:
+        self.store_dir = os.path.abspath(store_dir)
+        with open(os.path.join(self.store_dir, "header.json"), "r", encoding="utf-8") as f:
+            self.header: Dict[str, Any] = json.load(f)
+        if int(self.header.get("version", 0)) != STORE_VERSION:
+            raise ValueError(f"Unbekannte Meta-Store-Version in {self.store_dir}: {self.header.get('version')}")
+        self.num_rows = int(self.header["num_rows"])
+        self.vocab: Dict[str, List[Any]] = self.header["vocab"]
+
+        self._scalar = {f: self._load(f) for f in self.header["scalar_fields"]}
+        self._list = {
+            f: (self._load(f + "_codes"), self._load(f + "_offsets"), self._load(f + "_present"))
+            for f in self.header["list_fields"]
+        }
+        # nur Filterspalten (ältere Stores: keine)
+        self._semantic_list = {
+            f: (self._load(f + "_codes"), self._load(f + "_offsets"), self._load(f + "_present"))
+            for f in self.header.get("semantic_list_fields", [])
+        }
+        self._uid_hash = self._load("uid_hash")
+        self._uid_row = self._load("uid_row")
+        self._cid_hash = self._load("cid_hash")
+        self._cid_row = self._load("cid_row")
+        self._blob_offsets = self._load("blob_offsets")
+        blob_path = os.path.join(self.store_dir, "blob.bin")
+        # np.memmap kann keine leeren Dateien abbilden
+        self._blob = (
+            np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.zeros(0, np.uint8)
+        )
+        # Kennungen ohne Blob (ältere Stores: keine)
+        self.id_fields: List[str] = list(self.header.get("id_fields", []))
+        self._ids_offsets: Optional[np.ndarray] = None
+        self._ids = np.zeros(0, np.uint8)
+        if self.id_fields:
+            self._ids_offsets = self._load("ids_offsets")
+            ids_path = os.path.join(self.store_dir, "ids.bin")
+            if os.path.getsize(ids_path):
+                self._ids = np.memmap(ids_path, dtype=np.uint8, mode="r")
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.store_dir, name + ".npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __getitem__(self, faiss_id: int) -> Dict[str, Any]:
+        fid = int(faiss_id)
+        if fid < 0 or fid >= self.num_rows:
+            raise IndexError(f"Ungültige faiss_id: {faiss_id}")
+        rec: Dict[str, Any] = {"faiss_id": fid}
+        rec.update(self.blob_record(fid))
+        return self.add_columns(fid, rec)
+
+    def blob_record(self, faiss_id: int) -> Dict[str, Any]:
+        """Nur die Felder aus dem Blob (chunk_id, doc_id, semantic, ...), ohne Spaltenfelder."""
+        fid = int(faiss_id)
+        start, end = int(self._blob_offsets[fid]), int(self._blob_offsets[fid + 1])
+        return _loads(self._blob[start:end].tobytes())
+
+    def ids(self, faiss_id: int) -> Optional[Tuple[Optional[str], ...]]:
+        """
+        Werte von ID_FIELDS (chunk_id, doc_id) ohne den Blob zu parsen; None bei
+        Stores ohne ids.bin, einzelne None, wenn der Wert nur im Blob steht.
+        """
+        if self._ids_offsets is None:
+            return None
+        base = int(faiss_id) * len(self.id_fields)
+        offsets = self._ids_offsets[base : base + len(self.id_fields) + 1]
+        return tuple(
+            self._ids[int(start) : int(end)].tobytes().decode("utf-8") if end > start else None
+            for start, end in zip(offsets[:-1], offsets[1:])
+        )
+
+    def add_columns(self, faiss_id: int, rec: Dict[str, Any]) -> Dict[str, Any]:
+        """Ergänzt rec (z.B. aus blob_record) um die Felder aus den Spalten."""
+        fid = int(faiss_id)
+        for field, codes in self._scalar.items():
+            code = int(codes[fid])
+            if code != NOT_IN_COLUMN:
+                rec[field] = self.vocab[field][code]
+        for field, (_, _, present) in self._list.items():
+            flag = int(present[fid])
+            if flag == LIST_NONE:
+                rec[field] = None
+            elif flag == LIST_IN_COLUMN:
+                rec[field] = self.list_value(field, fid)
+        return rec
+
+    def column_value(self, faiss_id: int, field: str) -> Tuple[bool, Any]:
+        """
+        (gefunden, Wert) eines Kategorie- oder Listenfelds aus seiner Spalte, ohne
+        den Record zu materialisieren; (False, None), wenn der Wert im Blob steht,
+        fehlt oder field keine Spalte hat (Filterspalten zählen nicht).
+        """
+        fid = int(faiss_id)
+        if field in self._scalar:
+            code = int(self._scalar[field][fid])
+            return (False, None) if code == NOT_IN_COLUMN else (True, self.vocab[field][code])
+        if field in self._list:
+            flag = int(self._list[field][2][fid])
+            if flag == LIST_NONE:
+                return True, None
+            if flag == LIST_IN_COLUMN:
+                return True, self.list_value(field, fid)
+        return False, None
+
+    def list_value(self, field: str, faiss_id: int) -> Optional[List[str]]:
+        """Wert eines Listenfelds aus der Spalte (None = None, steht im Blob bzw. fehlt)."""
+        codes, offsets, present = self.list_columns(field)
+        if int(present[faiss_id]) != LIST_IN_COLUMN:
+            return None
+        vocab = self.vocab[field]
+        return [vocab[int(c)] for c in codes[int(offsets[faiss_id]):int(offsets[faiss_id + 1])]]
+
+    def scalar_codes(self, field: str) -> np.ndarray:
+        """uint16-Codes eines Kategorie-Felds für alle Zeilen (gemappt)."""
+        return self._scalar[field]
+
+    def list_columns(self, field: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(codes, offsets, present) eines Listenfelds für alle Zeilen (gemappt)."""
+        if field in self._list:
+            return self._list[field]
+        return self._semantic_list[field]
+
+    def has_column(self, field: str) -> bool:
+        """True, wenn für field eine Spalte existiert (Kategorie-, Listen- oder Filterspalte)."""
+        return field in self._scalar or field in self._list or field in self._semantic_list
+
+    def _find(self, hashes: np.ndarray, rows: np.ndarray, key: str, field: str) -> Optional[int]:
+        h = np.uint64(key_hash(key))
+        lo = int(np.searchsorted(hashes, h, side="left"))
+        hi = int(np.searchsorted(hashes, h, side="right"))
+        # bei mehreren Zeilen gewinnt die letzte (wie beim früheren Dict-Aufbau)
+        for i in range(hi - 1, lo - 1, -1):
+            row = int(rows[i])
+            if str(self.blob_record(row).get(field)) == key:
+                return row
+        return None
+
+    def lookup(self, chunk_id_or_uid: str) -> Optional[int]:
+        """faiss_id zu chunk_uid (bevorzugt) oder chunk_id; None, wenn unbekannt."""
+        key = str(chunk_id_or_uid)
+        row = self._find(self._uid_hash, self._uid_row, key, "chunk_uid")
+        if row is None:
+            row = self._find(self._cid_hash, self._cid_row, key, "chunk_id")
+        return row
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Meta-Store aus contextual_meta.jsonl erzeugen.")
+    parser.add_argument("--workspace-root", required=True, help="Workspace-Root mit indices/faiss.")
+    parser.add_argument("--meta-name", default="contextual_meta.jsonl", help="Name der Meta-JSONL.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
+    index_dir = resolve_index_dir(os.path.join(os.path.abspath(args.workspace_root), "indices", "faiss"))
+    meta_path = os.path.join(index_dir, args.meta_name)
+    if not os.path.isfile(meta_path):
+        logger.error("Metadaten-Datei nicht gefunden: %s", meta_path)
+        return 1
+    build_from_jsonl(meta_path)
+    refresh_manifest(index_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
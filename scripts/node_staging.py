@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+node_staging.py
+
+Node-lokales Staging für SLURM-Jobs auf BeeGFS.
+
+Hintergrund:
+- Alle Stufen lesen und schreiben zeilenweise direkt im Workspace auf BeeGFS.
+  Bei hoher Last dominieren Metadaten- und Small-IO-Latenzen die Laufzeit.
+- NodeStaging kopiert beim Start die benötigten Eingaben (FAISS-Index, Meta-JSONL,
+  Eingabedateien dieses Shards) nach $TMPDIR auf dem Node, lässt die Ausgaben
+  lokal schreiben und synchronisiert sie gebündelt zurück.
+
+Sync-Semantik:
+- checkpoint(): kopiert geänderte Ausgaben zurück (höchstens alle sync_interval_s,
+  zusätzlich periodisch aus einem Hintergrund-Thread).
+- finalize(): erzwungener Sync am Ende, auch per atexit und bei SIGTERM
+  (SLURM schickt SIGTERM vor dem Kill).
+- Jede Datei wird in eine temporäre Datei neben dem Ziel kopiert, per SHA1 gegen
+  die lokale Quelle verifiziert und erst dann per os.replace() atomar ersetzt.
+  Bei JSONL-Dateien wird nur bis zum letzten Zeilenumbruch kopiert, eine halb
+  geschriebene Zeile landet also nie im Workspace.
+- Ein Kill zwischen zwei Checkpoints verliert nur die Arbeit seit dem letzten
+  Sync; die Resume-Logik der Skripte setzt auf dem zurückgeschriebenen Stand auf.
+
+Geteilte Eingaben (shared_inputs_root):
+- Standardmäßig kopiert jeder Task seine Eingaben in ein eigenes Verzeichnis.
+  Ist shared_inputs_root gesetzt (node-lokaler Pfad, der über Tasks hinweg
+  bestehen bleibt, z.B. /dev/shm/dachs_inputs oder /tmp/dachs_inputs), landen
+  Eingaben unter <shared_inputs_root>/<array_job_id>/ und werden von allen
+  Tasks des Arrays auf dem Node gemeinsam genutzt: eine Kopie, und gemappte
+  Indizes (FaissRetriever, mmap) teilen sich den Page-Cache.
+- Dieses Verzeichnis wird von finalize() nicht gelöscht.
+
+Konfiguration: Abschnitt "staging" in config/paths/paths.json
+(siehe paths_utils.get_staging_config()).
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import logging
+import os
+import shutil
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger("node_staging")
+
+_COPY_BUFSIZE = 8 * 1024 * 1024
+
+
+def _sha1_prefix(path: Path, nbytes: int) -> str:
+    h = hashlib.sha1()
+    remaining = nbytes
+    with path.open("rb") as f:
+        while remaining > 0:
+            buf = f.read(min(_COPY_BUFSIZE, remaining))
+            if not buf:
+                break
+            h.update(buf)
+            remaining -= len(buf)
+    return h.hexdigest()
+
+
+def _complete_size(path: Path) -> int:
+    """Dateigröße bis inkl. letztem Zeilenumbruch (für JSONL), sonst volle Größe."""
+    size = path.stat().st_size
+    if path.suffix != ".jsonl" or size == 0:
+        return size
+    with path.open("rb") as f:
+        pos = size
+        while pos > 0:
+            step = min(65536, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step)
+            idx = buf.rfind(b"\n")
+            if idx != -1:
+                return pos + idx + 1
+    return 0
+
+
+def _copy_prefix(src: Path, dst: Path, nbytes: int) -> None:
+    remaining = nbytes
+    with src.open("rb") as fin, dst.open("wb") as fout:
+        while remaining > 0:
+            buf = fin.read(min(_COPY_BUFSIZE, remaining))
+            if not buf:
+                break
+            fout.write(buf)
+            remaining -= len(buf)
+        fout.flush()
+        os.fsync(fout.fileno())
+
+
+class NodeStaging:
+    """
+    Verwaltet Stage-in von Eingaben und Stage-out von Ausgaben für einen Job.
+
+    Ist das Staging deaktiviert, liefern stage_in()/track_output() einfach die
+    Originalpfade zurück und checkpoint()/finalize() tun nichts – die Aufrufer
+    brauchen keine Sonderfälle.
+    """
+
+    def __init__(
+        self,
+        workspace_root: Path,
+        local_root: Optional[Path],
+        enabled: bool = True,
+        sync_interval_s: float = 300.0,
+        cleanup: bool = True,
+        shared_root: Optional[Path] = None,
+    ) -> None:
+        self.workspace_root = Path(workspace_root).resolve()
+        self.enabled = bool(enabled) and local_root is not None
+        self.sync_interval_s = float(sync_interval_s)
+        self.cleanup = bool(cleanup)
+        self.local_root = Path(local_root) if local_root is not None else None
+        self.shared_root = Path(shared_root) if (shared_root is not None and self.enabled) else None
+
+        # lokaler Pfad -> Workspace-Pfad, bzw. -> zuletzt synchronisierter Stand (Größe, SHA1)
+        self._outputs: Dict[Path, Path] = {}
+        self._synced: Dict[Path, Tuple[int, str]] = {}
+        self._busy: Set[Path] = set()
+        self._lock = threading.RLock()
+        self._last_sync = time.time()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._finalized = False
+        self._sync_errors = 0
+        self._prev_sigterm: Any = None
+
+        if self.enabled:
+            assert self.local_root is not None
+            self.local_root.mkdir(parents=True, exist_ok=True)
+            logger.info("Node-Staging aktiv: %s -> %s", self.workspace_root, self.local_root)
+            if self.shared_root is not None:
+                self.shared_root.mkdir(parents=True, exist_ok=True)
+                logger.info("Geteilte Eingaben: %s", self.shared_root)
+
+    @classmethod
+    def from_config(cls, workspace_root: Path, cfg: Optional[Dict[str, Any]]) -> "NodeStaging":
+        """
+        Erzeugt das Staging aus dem "staging"-Abschnitt von paths.json.
+
+        Ohne SLURM-Job (z.B. Tests auf dem Login-Node) bleibt das Staging aus,
+        außer require_slurm ist explizit false.
+        """
+        cfg = dict(cfg or {})
+        enabled = bool(cfg.get("enabled", False))
+        if enabled and bool(cfg.get("require_slurm", True)) and not os.environ.get("SLURM_JOB_ID"):
+            logger.info("Node-Staging übersprungen (kein SLURM-Job).")
+            enabled = False
+
+        local_root: Optional[Path] = None
+        shared_root: Optional[Path] = None
+        if enabled:
+            job = os.environ.get("SLURM_ARRAY_JOB_ID") or os.environ.get("SLURM_JOB_ID") or "local"
+            task = os.environ.get("SLURM_ARRAY_TASK_ID", "0")
+            local_root = Path(str(cfg.get("local_root") or "/tmp/dachs_stage")) / f"{job}_{task}"
+            if cfg.get("shared_inputs_root"):
+                shared_root = Path(str(cfg["shared_inputs_root"])) / str(job)
+
+        return cls(
+            workspace_root=workspace_root,
+            local_root=local_root,
+            enabled=enabled,
+            sync_interval_s=float(cfg.get("sync_interval_s", 300)),
+            cleanup=bool(cfg.get("cleanup", True)),
+            shared_root=shared_root,
+        )
+
+    # ------------------------------------------------------------------
+    # Pfad-Abbildung
+    # ------------------------------------------------------------------
+
+    def _relative(self, remote: Path) -> Path:
+        remote = Path(remote).resolve()
+        try:
+            return remote.relative_to(self.workspace_root)
+        except ValueError:
+            digest = hashlib.sha1(str(remote.parent).encode("utf-8")).hexdigest()[:12]
+            return Path("ext") / digest / remote.name
+
+    def local_path(self, remote: Path) -> Path:
+        """Lokaler Spiegelpfad: relativ zum Workspace, sonst unter ext/<hash>/."""
+        assert self.local_root is not None
+        return self.local_root / self._relative(remote)
+
+    def input_path(self, remote: Path) -> Path:
+        """Ziel von stage_in(): geteiltes Eingabeverzeichnis, falls konfiguriert, sonst local_path()."""
+        if self.shared_root is not None:
+            return self.shared_root / self._relative(remote)
+        return self.local_path(remote)
+
+    # ------------------------------------------------------------------
+    # Stage-in
+    # ------------------------------------------------------------------
+
+    def stage_in(self, remote: Path) -> Path:
+        """
+        Kopiert eine Eingabedatei auf den Node (falls nötig) und gibt den lokalen Pfad zurück.
+
+        Mehrere Tasks können dieselbe geteilte Datei gleichzeitig stagen: jeder
+        kopiert in eine eigene temporäre Datei, os.replace() ist atomar, und
+        bereits gemappte alte Versionen bleiben für ihre Leser gültig.
+        """
+        remote = Path(remote)
+        if not self.enabled or not remote.is_file():
+            return remote
+        local = self.input_path(remote)
+        st = remote.stat()
+        if local.is_file():
+            lst = local.stat()
+            if lst.st_size == st.st_size and int(lst.st_mtime) == int(st.st_mtime):
+                return local
+        local.parent.mkdir(parents=True, exist_ok=True)
+        tmp = local.with_name(f".{local.name}.{os.getpid()}.stage.tmp")
+        t0 = time.time()
+        shutil.copy2(remote, tmp)
+        tmp.replace(local)
+        logger.info(
+            "Stage-in: %s (%.1f MB, %.1fs)", remote, st.st_size / 1e6, time.time() - t0
+        )
+        return local
+
+    # ------------------------------------------------------------------
+    # Stage-out
+    # ------------------------------------------------------------------
+
+    def track_output(self, remote: Path, append_only: bool = True) -> Path:
+        """
+        Registriert eine Ausgabedatei und gibt den lokalen Schreibpfad zurück.
+
+        Existiert die Datei bereits im Workspace (Resume), wird sie zuerst nach
+        lokal kopiert, damit die Resume-Logik den bisherigen Stand sieht.
+
+        append_only=False für Dateien, die komplett neu geschrieben werden: sie
+        werden erst nach release_output() synchronisiert, damit ein halb neu
+        geschriebener Stand nie einen vollständigeren im Workspace ersetzt.
+        """
+        remote = Path(remote)
+        if not self.enabled:
+            return remote
+        local = self.local_path(remote)
+        with self._lock:
+            if not append_only:
+                self._busy.add(local)
+            if local in self._outputs:
+                return local
+            local.parent.mkdir(parents=True, exist_ok=True)
+            if remote.is_file() and not local.exists():
+                shutil.copy2(remote, local)
+                size = local.stat().st_size
+                self._synced[local] = (size, _sha1_prefix(local, size))
+            self._outputs[local] = remote
+        return local
+
+    def release_output(self, remote: Path) -> None:
+        """Markiert eine mit append_only=False registrierte Datei als fertig geschrieben."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._busy.discard(self.local_path(Path(remote)))
+
+    def _sync_one(self, local: Path, remote: Path) -> bool:
+        if not local.is_file():
+            return False
+        size = _complete_size(local)
+        digest = _sha1_prefix(local, size)
+        if self._synced.get(local) == (size, digest):
+            return False
+
+        remote.parent.mkdir(parents=True, exist_ok=True)
+        tmp = remote.with_name(f".{remote.name}.{os.getpid()}.sync.tmp")
+        try:
+            _copy_prefix(local, tmp, size)
+            remote_digest = _sha1_prefix(tmp, size)
+            if remote_digest != digest:
+                raise IOError(f"Checksumme nach Kopie stimmt nicht: {remote} ({remote_digest} != {digest})")
+            os.replace(tmp, remote)
+        finally:
+            if tmp.exists():
+                try:
+                    tmp.unlink()
+                except OSError:
+                    pass
+        self._synced[local] = (size, digest)
+        return True
+
+    def checkpoint(self, force: bool = False, raise_errors: bool = False) -> int:
+        """
+        Synchronisiert geänderte Ausgaben (gedrosselt auf sync_interval_s, außer force).
+        raise_errors: fehlgeschlagene Stage-outs als IOError melden (z.B. bevor ein
+        Queue-Item als erledigt gilt), statt sie nur zu loggen.
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            if not force and time.time() - self._last_sync < self.sync_interval_s:
+                return 0
+            t0 = time.time()
+            n = 0
+            self._sync_errors = 0
+            for local, remote in list(self._outputs.items()):
+                if local in self._busy:
+                    continue
+                try:
+                    if self._sync_one(local, remote):
+                        n += 1
+                except Exception as e:
+                    self._sync_errors += 1
+                    logger.error("Stage-out fehlgeschlagen für %s: %s", remote, e)
+            self._last_sync = time.time()
+            if n:
+                logger.info("Checkpoint: %d Datei(en) zurück in den Workspace synchronisiert (%.1fs).", n, time.time() - t0)
+            if raise_errors and self._sync_errors:
+                raise IOError(f"Stage-out fehlgeschlagen für {self._sync_errors} Datei(en), siehe Log.")
+            return n
+
+    # ------------------------------------------------------------------
+    # Lebenszyklus
+    # ------------------------------------------------------------------
+
+    def start(self) -> "NodeStaging":
+        """Startet den periodischen Sync und registriert atexit/SIGTERM-Handler."""
+        if not self.enabled:
+            return self
+        atexit.register(self.finalize)
+        if threading.current_thread() is threading.main_thread():
+            self._prev_sigterm = signal.signal(signal.SIGTERM, self._on_sigterm)
+
+        def _loop() -> None:
+            while not self._stop.wait(self.sync_interval_s):
+                self.checkpoint()
+
+        self._thread = threading.Thread(target=_loop, name="node-staging-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def _on_sigterm(self, signum: int, frame: Any) -> None:
+        logger.warning("SIGTERM empfangen – synchronisiere Ausgaben vor dem Beenden.")
+        self.finalize(cleanup=False)
+        prev = self._prev_sigterm
+        if callable(prev):
+            prev(signum, frame)
+        raise SystemExit(128 + signum)
+
+    def finalize(self, cleanup: Optional[bool] = None) -> None:
+        if not self.enabled or self._finalized:
+            return
+        self._stop.set()
+        self.checkpoint(force=True)
+        self._finalized = True
+        if self._sync_errors or self._busy:
+            logger.error("Lokale Kopien bleiben erhalten (nicht synchronisiert): %s", self.local_root)
+            return
+        if cleanup if cleanup is not None else self.cleanup:
+            assert self.local_root is not None
+            shutil.rmtree(self.local_root, ignore_errors=True)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+ollama_warmup.py
+
+Readiness-Check und Warm-up für den Ollama-Server in den Pipeline-Jobs.
+
+Hintergrund:
+- Die SLURM-Jobs starten `ollama serve &` im Job. Ohne Warm-up zahlt der erste
+  echte Request den kompletten Modell-Load (32B-Modell: mehrere Minuten), und
+  nach Ablauf des Default-keep_alive (5 min) wird das Modell ggf. entladen und
+  erneut geladen.
+- Dieses Modul pollt den Server, bis er antwortet, prüft, ob die konfigurierten
+  Modelle lokal vorhanden sind (Name ohne Tag = ":latest", wie bei Ollama),
+  lädt sie mit einem trivialen Request vor und setzt dabei keep_alive für die
+  Job-Laufzeit (-1 = nie entladen). Liegt ein Modell danach (auch nach einem
+  zweiten Versuch) nicht in /api/ps, schlägt der Warm-up fehl.
+- load_duration und die Latenz des ersten Requests werden geloggt und optional
+  als JSONL-Telemetrie unter <workspace_root>/logs/telemetry/ abgelegt.
+
+Wichtig: keep_alive muss bei JEDEM Request mitgeschickt werden – ein Request
+ohne keep_alive setzt den Timer des Modells auf den Server-Default zurück.
+
+Verwendung aus Python:
+
+  from scripts.ollama_warmup import ensure_models_ready
+  ensure_models_ready("http://127.0.0.1:11434", ["qwen2.5:32b-instruct-q4_K_M"], keep_alive=-1)
+
+CLI-Test:
+
+  python scripts/ollama_warmup.py \
+      --endpoint http://127.0.0.1:11434 \
+      --model qwen2.5:32b-instruct-q4_K_M \
+      --keep-alive -1
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import requests
+
+logger = logging.getLogger("ollama_warmup")
+
+KeepAlive = Union[int, str]
+
+DEFAULT_KEEP_ALIVE: KeepAlive = -1
+WARMUP_PROMPT = "Warmup. Reply OK."
+RESIDENT_RETRY_WAIT_S = 2.0
+
+
+@dataclass
+class WarmupResult:
+    model: str
+    base_url: str
+    ready_wait_s: float
+    first_request_s: float
+    load_duration_s: Optional[float]
+    total_duration_s: Optional[float]
+    resident: bool
+    keep_alive: KeepAlive
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def normalize_base_url(url_or_host: Optional[str]) -> str:
+    """
+    Liefert die Basis-URL des Ollama-Servers (ohne /api/...).
+
+    Akzeptiert z.B.:
+      - "http://127.0.0.1:11434"
+      - "http://127.0.0.1:11434/api/chat"   (OLLAMA_API_URL)
+      - "0.0.0.0:11434"                     (OLLAMA_HOST)
+    """
+    base = (url_or_host or "").strip() or "http://127.0.0.1:11434"
+    if not base.startswith("http"):
+        base = f"http://{base}"
+    base = base.rstrip("/")
+    idx = base.find("/api/")
+    if idx != -1:
+        base = base[:idx]
+    # 0.0.0.0 ist eine Bind-Adresse, kein Ziel für Requests
+    return base.replace("://0.0.0.0", "://127.0.0.1")
+
+
+def parse_keep_alive(value: Any) -> KeepAlive:
+    """keep_alive aus Config/CLI: Zahl (Sekunden, -1 = unendlich) oder Dauer-String ("30m", "24h")."""
+    if value is None or value == "":
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, bool):
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        return int(value)
+    s = str(value).strip()
+    try:
+        return int(s)
+    except ValueError:
+        return s
+
+
+def _ns_to_s(value: Any) -> Optional[float]:
+    try:
+        return float(value) / 1e9
+    except (TypeError, ValueError):
+        return None
+
+
+def wait_until_ready(base_url: str, timeout_s: float = 600.0, poll_interval_s: float = 1.0) -> float:
+    """
+    Pollt GET /api/tags, bis der Server antwortet.
+
+    Rückgabe: Wartezeit in Sekunden. Wirft TimeoutError, wenn der Server nicht
+    innerhalb von timeout_s erreichbar ist.
+    """
+    t0 = time.time()
+    last_err: Optional[Exception] = None
+    while True:
+        try:
+            resp = requests.get(base_url + "/api/tags", timeout=5)
+            if resp.status_code == 200:
+                return time.time() - t0
+            last_err = RuntimeError(f"HTTP {resp.status_code}")
+        except requests.RequestException as e:
+            last_err = e
+
+        if time.time() - t0 >= timeout_s:
+            raise TimeoutError(
+                f"Ollama-Server unter {base_url} nach {timeout_s:.0f}s nicht bereit: {last_err}"
+            )
+        time.sleep(poll_interval_s)
+
+
+def normalize_model_name(name: str) -> str:
+    """Modellname wie Ollama ihn auflöst: ohne Tag gilt ":latest" ("llama3" -> "llama3:latest")."""
+    name = name.strip()
+    if ":" not in name.rsplit("/", 1)[-1]:
+        name += ":latest"
+    return name
+
+
+def list_available_models(base_url: str) -> List[str]:
+    resp = requests.get(base_url + "/api/tags", timeout=10)
+    resp.raise_for_status()
+    data = resp.json() or {}
+    names: List[str] = []
+    for m in data.get("models") or []:
+        for key in ("name", "model"):
+            v = m.get(key)
+            if isinstance(v, str) and v:
+                names.append(v)
+    return names
+
+
+def list_loaded_models(base_url: str) -> List[str]:
+    """Modelle, die aktuell im Speicher liegen (GET /api/ps)."""
+    try:
+        resp = requests.get(base_url + "/api/ps", timeout=10)
+        resp.raise_for_status()
+        data = resp.json() or {}
+    except Exception as e:
+        logger.warning("GET /api/ps fehlgeschlagen: %s", e)
+        return []
+    names: List[str] = []
+    for m in data.get("models") or []:
+        for key in ("name", "model"):
+            v = m.get(key)
+            if isinstance(v, str) and v:
+                names.append(v)
+    return names
+
+
+def _is_loaded(base_url: str, model: str) -> bool:
+    return normalize_model_name(model) in {normalize_model_name(m) for m in list_loaded_models(base_url)}
+
+
+def warmup_model(
+    base_url: str,
+    model: str,
+    keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE,
+    request_timeout_s: float = 1800.0,
+) -> Dict[str, Any]:
+    """
+    Lädt ein Modell mit einem trivialen Chat-Request vor und setzt keep_alive.
+
+    Rückgabe: dict mit first_request_s, load_duration_s, total_duration_s.
+    """
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": WARMUP_PROMPT}],
+        "stream": False,
+        "keep_alive": keep_alive,
+        "options": {"num_predict": 1},
+    }
+    t0 = time.time()
+    resp = requests.post(base_url + "/api/chat", json=payload, timeout=request_timeout_s)
+    first_request_s = time.time() - t0
+    if resp.status_code == 404:
+        raise RuntimeError(f"Ollama kennt das Modell nicht (HTTP 404): model='{model}'")
+    resp.raise_for_status()
+    data = resp.json() or {}
+    return {
+        "first_request_s": first_request_s,
+        "load_duration_s": _ns_to_s(data.get("load_duration")),
+        "total_duration_s": _ns_to_s(data.get("total_duration")),
+    }
+
+
+def append_telemetry(path: Path, records: Sequence[Dict[str, Any]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+def ensure_models_ready(
+    base_url: str,
+    models: Sequence[str],
+    keep_alive: KeepAlive = DEFAULT_KEEP_ALIVE,
+    ready_timeout_s: float = 600.0,
+    request_timeout_s: float = 1800.0,
+    telemetry_path: Optional[Path] = None,
+    context: Optional[Dict[str, Any]] = None,
+) -> List[WarmupResult]:
+    """
+    Readiness + Warm-up für alle Modelle. Kehrt erst zurück, wenn jedes Modell
+    im Speicher liegt; wirft sonst eine Exception (Job soll dann nicht starten).
+    """
+    base_url = normalize_base_url(base_url)
+    logger.info("Warte auf Ollama-Server unter %s (timeout=%.0fs) ...", base_url, ready_timeout_s)
+    ready_wait_s = wait_until_ready(base_url, timeout_s=ready_timeout_s)
+    logger.info("Ollama-Server bereit nach %.1fs.", ready_wait_s)
+
+    available = set(list_available_models(base_url))
+    available_norm = {normalize_model_name(m) for m in available}
+    missing = [m for m in models if normalize_model_name(m) not in available_norm]
+    if missing:
+        raise RuntimeError(
+            f"Modell(e) auf diesem Node nicht vorhanden: {missing} (verfügbar: {sorted(available)})"
+        )
+
+    results: List[WarmupResult] = []
+    for model in models:
+        logger.info("Warm-up für Modell '%s' (keep_alive=%s) ...", model, keep_alive)
+        timing = warmup_model(base_url, model, keep_alive=keep_alive, request_timeout_s=request_timeout_s)
+        resident = _is_loaded(base_url, model)
+        if not resident:
+            # /api/ps kann dem Chat-Request kurz hinterherhinken: einmal wiederholen
+            logger.warning("Modell '%s' taucht nach dem Warm-up nicht in /api/ps auf – zweiter Versuch.", model)
+            time.sleep(RESIDENT_RETRY_WAIT_S)
+            warmup_model(base_url, model, keep_alive=keep_alive, request_timeout_s=request_timeout_s)
+            resident = _is_loaded(base_url, model)
+        if not resident:
+            raise RuntimeError(
+                f"Modell '{model}' nach dem Warm-up nicht geladen (/api/ps: {sorted(list_loaded_models(base_url))})"
+            )
+        res = WarmupResult(
+            model=model,
+            base_url=base_url,
+            ready_wait_s=ready_wait_s,
+            first_request_s=timing["first_request_s"],
+            load_duration_s=timing["load_duration_s"],
+            total_duration_s=timing["total_duration_s"],
+            resident=resident,
+            keep_alive=keep_alive,
+        )
+        logger.info(
+            "[WARMUP] model=%s first_request=%.1fs load_duration=%s resident=%s",
+            model,
+            res.first_request_s,
+            f"{res.load_duration_s:.1f}s" if res.load_duration_s is not None else "n/a",
+            resident,
+        )
+        results.append(res)
+
+    if telemetry_path is not None:
+        ts = datetime.now().isoformat(timespec="seconds")
+        extra = dict(context or {})
+        extra.setdefault("slurm_job_id", os.environ.get("SLURM_JOB_ID"))
+        extra.setdefault("slurm_array_task_id", os.environ.get("SLURM_ARRAY_TASK_ID"))
+        extra.setdefault("hostname", socket.gethostname())
+        try:
+            append_telemetry(
+                telemetry_path,
+                [{"event": "llm_warmup", "timestamp": ts, **extra, **r.as_dict()} for r in results],
+            )
+        except OSError as e:
+            logger.warning("Konnte Warm-up-Telemetrie nicht schreiben (%s): %s", telemetry_path, e)
+
+    return results
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ollama-Readiness-Check und Modell-Warm-up.")
+    parser.add_argument(
+        "--endpoint",
+        default=os.environ.get("OLLAMA_API_URL") or os.environ.get("OLLAMA_HOST"),
+        help="Basis-URL oder Host:Port des Ollama-Servers (Default: OLLAMA_API_URL / OLLAMA_HOST).",
+    )
+    parser.add_argument("--model", action="append", required=True, help="Modell-Tag (mehrfach möglich).")
+    parser.add_argument("--keep-alive", default=str(DEFAULT_KEEP_ALIVE), help="keep_alive (-1 = unendlich).")
+    parser.add_argument("--ready-timeout", type=float, default=600.0, help="Max. Wartezeit auf den Server (s).")
+    parser.add_argument("--telemetry", default=None, help="Optional: JSONL-Datei für Warm-up-Telemetrie.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    try:
+        ensure_models_ready(
+            base_url=args.endpoint,
+            models=args.model,
+            keep_alive=parse_keep_alive(args.keep_alive),
+            ready_timeout_s=args.ready_timeout,
+            telemetry_path=Path(args.telemetry) if args.telemetry else None,
+        )
+    except Exception as e:
+        print(f"Fehler beim Warm-up: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
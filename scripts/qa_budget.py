@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+qa_budget.py
+
+Gemeinsames Q/A-Budget (global_qa_limit) über alle Shards eines Array-Jobs.
+
+Bisher wurde global_qa_limit per ceil(limit / num_shards) auf die Shards
+verteilt. Shards mit wenig geeignetem Inhalt lassen ihr Budget liegen, reiche
+Shards hören zu früh auf – das Ziel wird regelmäßig deutlich verfehlt.
+
+Stattdessen liegt ein Ledger (JSON) auf dem Workspace, aus dem jeder Shard
+sein Budget in kleinen Blöcken zieht:
+
+- draw():      reserviert bis zu block_size Q/A-Paare (0 = global erschöpft)
+- give_back(): gibt nicht verbrauchte Reservierungen am Ende zurück
+- Verbrauch pro Shard = allocated - returned, steht im Ledger und im Log
+
+Koordination per O_EXCL-Lockfile neben dem Ledger (BeeGFS-tauglich, kein
+SQLite über Knotengrenzen); das Ledger selbst wird per tmp + os.replace()
+atomar geschrieben. Maximale Abweichung vom Ziel: nicht zurückgegebene Reste
+gecrashter Shards bzw. Reste, die zurückkommen, nachdem alle anderen Shards
+schon fertig sind (jeweils < block_size pro Shard).
+
+CLI (Status):
+
+  python scripts/qa_budget.py --ledger <pfad>/qa_budget_<jobid>.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("qa_budget")
+
+DEFAULT_BLOCK_SIZE = 20
+LOCK_STALE_S = 60.0
+
+
+class BudgetLedger:
+    """
+    Dateibasiertes Budget-Ledger mit blockweiser Reservierung.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        limit: int,
+        owner: str,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        lock_timeout_s: float = 120.0,
+    ) -> None:
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.limit = int(limit)
+        self.owner = owner
+        self.block_size = max(1, int(block_size))
+        self.lock_timeout_s = float(lock_timeout_s)
+        self.drawn_total = 0
+        self.returned_total = 0
+        self._limit_warned = False
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        t0 = time.time()
+        while True:
+            try:
+                fd = os.open(str(self.lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                os.write(fd, self.owner.encode("utf-8"))
+                os.close(fd)
+                break
+            except FileExistsError:
+                try:
+                    age = time.time() - self.lock_path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if age > LOCK_STALE_S:
+                    logger.warning("Veralteter Budget-Lock (%.0fs) wird entfernt: %s", age, self.lock_path)
+                    try:
+                        self.lock_path.unlink()
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if time.time() - t0 > self.lock_timeout_s:
+                    raise TimeoutError(f"Budget-Lock nicht erhalten: {self.lock_path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            try:
+                self.lock_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _load(self) -> Dict[str, Any]:
+        if self.path.is_file():
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if int(data.get("limit", self.limit)) != self.limit and not self._limit_warned:
+                self._limit_warned = True
+                logger.warning(
+                    "Ledger %s hat limit=%s, Config sagt %d – Ledger gewinnt.",
+                    self.path,
+                    data.get("limit"),
+                    self.limit,
+                )
+            return data
+        return {
+            "limit": self.limit,
+            "allocated": 0,
+            "returned": 0,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "shards": {},
+        }
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        data["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        tmp.replace(self.path)
+
+    @staticmethod
+    def _remaining(data: Dict[str, Any]) -> int:
+        return int(data["limit"]) - int(data["allocated"]) + int(data["returned"])
+
+    def draw(self, n: Optional[int] = None) -> int:
+        """Reserviert bis zu n (Default: block_size) Q/A-Paare; 0 = Budget erschöpft."""
+        want = self.block_size if n is None else max(0, int(n))
+        with self._locked():
+            data = self._load()
+            granted = max(0, min(want, self._remaining(data)))
+            if granted:
+                data["allocated"] = int(data["allocated"]) + granted
+                shard = data["shards"].setdefault(self.owner, {"allocated": 0, "returned": 0})
+                shard["allocated"] = int(shard["allocated"]) + granted
+                self._save(data)
+        self.drawn_total += granted
+        return granted
+
+    def give_back(self, n: int) -> None:
+        """Gibt nicht verbrauchte Reservierungen zurück (z.B. wenn der Shard keine Chunks mehr hat)."""
+        n = int(n)
+        if n <= 0:
+            return
+        with self._locked():
+            data = self._load()
+            data["returned"] = int(data["returned"]) + n
+            shard = data["shards"].setdefault(self.owner, {"allocated": 0, "returned": 0})
+            shard["returned"] = int(shard["returned"]) + n
+            self._save(data)
+        self.returned_total += n
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._locked():
+            data = self._load()
+        consumed = int(data["allocated"]) - int(data["returned"])
+        return {
+            "limit": int(data["limit"]),
+            "consumed": consumed,
+            "remaining": self._remaining(data),
+            "shards": {
+                k: int(v.get("allocated", 0)) - int(v.get("returned", 0))
+                for k, v in sorted((data.get("shards") or {}).items())
+            },
+        }
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Status eines Q/A-Budget-Ledgers anzeigen.")
+    parser.add_argument("--ledger", required=True, help="Pfad zum Ledger (JSON).")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    path = Path(args.ledger)
+    if not path.is_file():
+        print(f"Ledger nicht gefunden: {path}")
+        return 1
+    with path.open("r", encoding="utf-8") as f:
+        limit = int(json.load(f).get("limit", 0))
+    ledger = BudgetLedger(path, limit=limit, owner="cli")
+    print(json.dumps(ledger.snapshot(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
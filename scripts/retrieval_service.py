@@ -0,0 +1,628 @@
+#!/usr/bin/env python3
+"""
+retrieval_service.py
+
+Langlaufender Retrieval-Dienst auf Basis von FaissRetriever: Index und
+Metadaten werden einmal pro Node geladen, alle QA-Array-Tasks (und die
+Review-App) fragen über eine lokale HTTP-API (Unix-Socket oder TCP) an.
+
+Endpunkte (JSON):
+
+  GET  /health      Status, ntotal, Generation, Ladezeiten, Batch-Statistik
+  POST /neighbors   {"chunk_ids": [...], "top_k": 10, "include_self": false,
+                     "filter": [[feld, op, [werte]], ...], "top_docs": null,
+                     "threshold": null}
+                    -> {"results": {chunk_id: [treffer, ...]}}  (unbekannte IDs fehlen)
+  POST /query       {"texts": [...], "top_k": 10, "filter": ..., "hybrid": false}
+                    -> {"results": [[treffer, ...], ...]}  (eine Liste pro Text)
+
+Freitext-Anfragen laufen über FaissRetriever.search_text() (Modell aus der
+Index-Config, beim ersten /query geladen; Embedding- und Ergebnis-Cache);
+"hybrid": true kombiniert sie mit dem BM25-Index (search_hybrid).
+
+Micro-Batching: gleichzeitige Anfragen landen in einer Queue; ein Worker
+sammelt bis zu --max-batch Zeilen bzw. --max-wait-ms und führt pro
+(Art, top_k, include_self, Filter) eine einzige Batch-Suche aus.
+
+Start pro Node (mehrere Tasks, genau ein Dienst):
+
+  python scripts/retrieval_service.py --workspace-root <ws> \\
+      --socket /tmp/retrieval_<jobid>.sock --ensure --idle-exit-s 900
+
+--ensure startet den Dienst im Hintergrund, falls er noch nicht läuft (O_EXCL-
+Lock neben dem Socket), und wartet, bis /health antwortet. Ohne Anfragen
+beendet sich der Dienst nach --idle-exit-s Sekunden.
+
+Client: RetrievalClient("unix:/tmp/retrieval_<jobid>.sock") bzw.
+RetrievalClient("http://127.0.0.1:8765") mit derselben Schnittstelle wie
+FaissRetriever.get_neighbors_for_chunk(s). Der Dienst läuft im Job-Kontext des
+Tasks, der ihn gestartet hat, und endet mit diesem; die übrigen Tasks geben
+deshalb einen fallback mit und laden den Index dann selbst.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+from scripts.faiss_retriever import FaissRetriever, NeighborHit  # type: ignore
+from scripts.meta_filter import MetaFilter  # type: ignore
+
+logger = logging.getLogger("retrieval_service")
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 512
+DEFAULT_MAX_WAIT_MS = 5.0
+LOCK_STALE_S = 300.0
+LISTEN_BACKLOG = 128  # viele Tasks verbinden sich gleichzeitig (Default 5 -> EAGAIN)
+
+
+# ----------------------------------------------------------------------
+# Micro-Batching
+# ----------------------------------------------------------------------
+
+
+class _Request:
+    __slots__ = ("kind", "items", "top_k", "include_self", "meta_filter", "top_docs", "threshold", "future")
+
+    def __init__(
+        self,
+        kind: str,
+        items: List[str],
+        top_k: int,
+        include_self: bool,
+        meta_filter: Optional[MetaFilter],
+        top_docs: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> None:
+        self.kind = kind
+        self.items = items
+        self.top_k = top_k
+        self.include_self = include_self
+        self.meta_filter = meta_filter
+        self.top_docs = top_docs
+        self.threshold = threshold
+        self.future: Future = Future()
+
+    def group_key(self) -> Tuple[str, int, bool, str, int, Optional[float]]:
+        return (
+            self.kind,
+            self.top_k,
+            self.include_self,
+            self.meta_filter.key if self.meta_filter else "",
+            self.top_docs or 0,
+            self.threshold,
+        )
+
+
+class MicroBatcher:
+    """
+    Sammelt gleichzeitige Anfragen und führt sie gruppiert als Batch-Suche aus
+    (ein Worker-Thread; FAISS parallelisiert intern per OpenMP).
+    """
+
+    def __init__(
+        self,
+        retriever: FaissRetriever,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        num_threads: Optional[int] = None,
+    ) -> None:
+        self.retriever = retriever
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self.num_threads = num_threads
+        self.stats = {"requests": 0, "batches": 0, "searches": 0, "rows": 0}
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        kind: str,
+        items: List[str],
+        top_k: int,
+        include_self: bool = False,
+        meta_filter: Optional[MetaFilter] = None,
+        top_docs: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> Any:
+        """Blockiert bis zum Ergebnis (neighbors: Dict, query: Liste pro Text)."""
+        req = _Request(kind, items, top_k, include_self, meta_filter, top_docs, threshold)
+        self._queue.put(req)
+        return req.future.result()
+
+    def _collect(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        rows = len(batch[0].items)
+        deadline = time.time() + self.max_wait_s
+        while rows < self.max_batch:
+            remaining = deadline - time.time()
+            try:
+                req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(req)
+            rows += len(req.items)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            groups: Dict[Tuple[str, int, bool, str, int, Optional[float]], List[_Request]] = {}
+            for req in batch:
+                groups.setdefault(req.group_key(), []).append(req)
+            for reqs in groups.values():
+                try:
+                    self._execute(reqs)
+                except Exception as exc:
+                    for req in reqs:
+                        if not req.future.done():
+                            req.future.set_exception(exc)
+
+    def _execute(self, reqs: List[_Request]) -> None:
+        first = reqs[0]
+        self.stats["searches"] += 1
+        if first.kind == "neighbors":
+            ids = list(dict.fromkeys(cid for req in reqs for cid in req.items))
+            self.stats["rows"] += len(ids)
+            found = self.retriever.get_neighbors_for_chunks(
+                ids,
+                top_k=first.top_k,
+                include_self=first.include_self,
+                num_threads=self.num_threads,
+                meta_filter=first.meta_filter,
+                top_docs=first.top_docs,
+                threshold=first.threshold,
+            )
+            for req in reqs:
+                req.future.set_result({cid: found[cid] for cid in req.items if cid in found})
+            return
+
+        texts = [t for req in reqs for t in req.items]
+        self.stats["rows"] += len(texts)
+        hits = self.retriever.search_text(
+            texts,
+            top_k=first.top_k,
+            num_threads=self.num_threads,
+            meta_filter=first.meta_filter,
+            hybrid=first.kind == "hybrid",
+        )
+        start = 0
+        for req in reqs:
+            req.future.set_result(hits[start : start + len(req.items)])
+            start += len(req.items)
+
+
+# ----------------------------------------------------------------------
+# HTTP-Server
+# ----------------------------------------------------------------------
+
+
+class ServiceState:
+    def __init__(self, retriever: FaissRetriever, batcher: MicroBatcher, idle_exit_s: float) -> None:
+        self.retriever = retriever
+        self.batcher = batcher
+        self.idle_exit_s = idle_exit_s
+        self.started = time.time()
+        self.last_request = time.time()
+
+
+def _json_default(obj: Any) -> Any:
+    """Treffer der Nachbarsuche (NeighborHit) als vollständiges Metadaten-Dict senden."""
+    if isinstance(obj, NeighborHit):
+        return obj.to_dict()
+    raise TypeError(f"{type(obj).__name__} ist nicht JSON-serialisierbar")
+
+
+class RetrievalHandler(BaseHTTPRequestHandler):
+    server_version = "RetrievalService/1"
+    state: ServiceState  # wird in make_server gesetzt
+
+    def address_string(self) -> str:
+        # Unix-Socket: client_address ist ein leerer String
+        return str(self.client_address[0]) if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") != "/health":
+            self._send(404, {"error": f"unbekannter Pfad: {self.path}"})
+            return
+        retriever = self.state.retriever
+        self._send(
+            200,
+            {
+                "status": "ok",
+                "pid": os.getpid(),
+                "ntotal": int(retriever.index.ntotal),
+                "indices_root": retriever.indices_root,
+                "load_stats": retriever.load_stats,
+                "uptime_s": round(time.time() - self.state.started, 1),
+                "batching": dict(self.state.batcher.stats),
+                "queries": dict(retriever.query_stats),
+            },
+        )
+
+    def do_POST(self) -> None:
+        self.state.last_request = time.time()
+        path = self.path.rstrip("/")
+        if path not in ("/neighbors", "/query"):
+            self._send(404, {"error": f"unbekannter Pfad: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            top_k = int(req.get("top_k", 5))
+            meta_filter = MetaFilter.from_spec(req["filter"]) if req.get("filter") else None
+            top_docs = int(req["top_docs"]) if req.get("top_docs") else None
+            threshold = float(req["threshold"]) if req.get("threshold") is not None else None
+            if path == "/neighbors":
+                kind = "neighbors"
+                items = [str(c) for c in req.get("chunk_ids") or []]
+                include_self = bool(req.get("include_self", False))
+            else:
+                kind = "hybrid" if req.get("hybrid") else "query"
+                items = [str(t) for t in req.get("texts") or []]
+                include_self = True
+        except (ValueError, TypeError, KeyError) as exc:
+            self._send(400, {"error": f"ungültige Anfrage: {exc}"})
+            return
+        if not items:
+            self._send(200, {"results": {} if path == "/neighbors" else []})
+            return
+        try:
+            results = self.state.batcher.submit(
+                kind, items, top_k, include_self, meta_filter, top_docs, threshold
+            )
+        except RuntimeError as exc:
+            self._send(503, {"error": str(exc)})
+            return
+        except Exception as exc:
+            logger.exception("Fehler bei %s", path)
+            self._send(500, {"error": str(exc)})
+            return
+        self._send(200, {"results": results})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def server_bind(self) -> None:
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+class TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+def make_server(state: ServiceState, socket_path: Optional[str], host: str, port: int) -> socketserver.BaseServer:
+    handler = type("BoundRetrievalHandler", (RetrievalHandler,), {"state": state})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # verwaister Socket; ein laufender Dienst wurde vorher per health() erkannt
+        return UnixHTTPServer(socket_path, handler)
+    return TCPHTTPServer((host, port), handler)
+
+
+def _idle_watchdog(server: socketserver.BaseServer, state: ServiceState) -> None:
+    while True:
+        time.sleep(min(30.0, max(1.0, state.idle_exit_s / 10.0)))
+        idle = time.time() - state.last_request
+        if idle > state.idle_exit_s:
+            logger.info("Keine Anfragen seit %.0fs – Dienst wird beendet.", idle)
+            server.shutdown()
+            return
+
+
+# ----------------------------------------------------------------------
+# Client
+# ----------------------------------------------------------------------
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class RetrievalClient:
+    """
+    Client für den Retrieval-Dienst mit der Schnittstelle von FaissRetriever
+    (get_neighbors_for_chunk/-chunks); address: "unix:<pfad>" oder "http://host:port".
+
+    fallback: lädt bei Bedarf einen FaissRetriever im Prozess. Ist der Dienst
+    mitten im Lauf nicht mehr erreichbar (z.B. mit dem startenden Array-Task
+    beendet), laufen alle weiteren Nachbar-Anfragen über diesen.
+    """
+
+    def __init__(
+        self, address: str, timeout_s: float = 300.0, fallback: Optional[Callable[[], Any]] = None
+    ) -> None:
+        self.address = address
+        self.timeout_s = float(timeout_s)
+        self.fallback = fallback
+        self.local: Optional[Any] = None
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.address.startswith("unix:"):
+            return _UnixHTTPConnection(self.address[len("unix:") :], self.timeout_s)
+        hostport = self.address.split("://", 1)[-1].rstrip("/")
+        return http.client.HTTPConnection(hostport, timeout=self.timeout_s)
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        conn = self._connection()
+        try:
+            body = json.dumps(payload).encode("utf-8") if payload is not None else None
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = json.loads(resp.read() or b"{}")
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise RuntimeError(f"Retrieval-Dienst {self.address}{path}: HTTP {resp.status}: {data.get('error')}")
+        return data
+
+    def health(self) -> Dict[str, Any]:
+        return self._request("GET", "/health")
+
+    def get_neighbors_for_chunks(
+        self,
+        chunk_ids_or_uids: Sequence[str],
+        top_k: int = 5,
+        include_self: bool = False,
+        num_threads: Optional[int] = None,
+        meta_filter: Optional[MetaFilter] = None,
+        top_docs: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Wie FaissRetriever.get_neighbors_for_chunks (num_threads legt der Dienst fest)."""
+        if self.local is None:
+            try:
+                return self._remote_neighbors(chunk_ids_or_uids, top_k, include_self, meta_filter, top_docs, threshold)
+            except (OSError, http.client.HTTPException) as e:
+                if self.fallback is None:
+                    raise
+                logger.warning(
+                    "Retrieval-Dienst %s nicht mehr erreichbar (%s) – lade Index im Prozess.", self.address, e
+                )
+                self.local = self.fallback()
+        return self.local.get_neighbors_for_chunks(
+            chunk_ids_or_uids,
+            top_k=top_k,
+            include_self=include_self,
+            num_threads=num_threads,
+            meta_filter=meta_filter,
+            top_docs=top_docs,
+            threshold=threshold,
+        )
+
+    def _remote_neighbors(
+        self,
+        chunk_ids_or_uids: Sequence[str],
+        top_k: int,
+        include_self: bool,
+        meta_filter: Optional[MetaFilter],
+        top_docs: Optional[int],
+        threshold: Optional[float],
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        payload: Dict[str, Any] = {
+            "chunk_ids": list(chunk_ids_or_uids),
+            "top_k": int(top_k),
+            "include_self": bool(include_self),
+        }
+        if meta_filter:
+            payload["filter"] = meta_filter.to_spec()
+        if top_docs:
+            payload["top_docs"] = int(top_docs)
+        if threshold is not None:
+            payload["threshold"] = float(threshold)
+        return self._request("POST", "/neighbors", payload)["results"]
+
+    def get_neighbors_for_chunk(
+        self,
+        chunk_id_or_uid: str,
+        top_k: int = 5,
+        include_self: bool = False,
+        meta_filter: Optional[MetaFilter] = None,
+        top_docs: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        found = self.get_neighbors_for_chunks(
+            [chunk_id_or_uid], top_k, include_self, meta_filter=meta_filter, top_docs=top_docs, threshold=threshold
+        )
+        if chunk_id_or_uid not in found:
+            raise KeyError(f"chunk_id/chunk_uid nicht im Index gefunden: {chunk_id_or_uid}")
+        return found[chunk_id_or_uid]
+
+    def query(
+        self,
+        texts: Sequence[str],
+        top_k: int = 5,
+        meta_filter: Optional[MetaFilter] = None,
+        hybrid: bool = False,
+    ) -> List[List[Dict[str, Any]]]:
+        """Freitext-Suche, eine Trefferliste pro Text (hybrid: BM25 + Dense)."""
+        payload: Dict[str, Any] = {"texts": list(texts), "top_k": int(top_k), "hybrid": bool(hybrid)}
+        if meta_filter:
+            payload["filter"] = meta_filter.to_spec()
+        return self._request("POST", "/query", payload)["results"]
+
+
+def service_address(socket_path: Optional[str], host: str, port: int) -> str:
+    return f"unix:{socket_path}" if socket_path else f"http://{host}:{port}"
+
+
+def _is_up(address: str) -> bool:
+    try:
+        RetrievalClient(address, timeout_s=5.0).health()
+        return True
+    except (OSError, RuntimeError, ValueError):
+        return False
+
+
+def ensure_running(argv: List[str], address: str, lock_path: str, timeout_s: float) -> bool:
+    """
+    Startet den Dienst im Hintergrund, falls er unter address noch nicht
+    antwortet; genau ein Aufrufer pro Node startet (O_EXCL-Lock), die anderen warten.
+    """
+    if _is_up(address):
+        return True
+    owner = False
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        os.write(fd, str(os.getpid()).encode("utf-8"))
+        os.close(fd)
+        owner = True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_S:
+                logger.warning("Veralteter Start-Lock wird entfernt: %s", lock_path)
+                os.remove(lock_path)
+                return ensure_running(argv, address, lock_path, timeout_s)
+        except FileNotFoundError:
+            pass
+
+    try:
+        if owner:
+            args = [a for a in argv if a != "--ensure"]
+            log_path = lock_path.replace(".lock", "") + ".log"
+            with open(log_path, "ab") as log_f:
+                subprocess.Popen(
+                    [sys.executable, str(THIS_FILE), *args],
+                    stdout=log_f,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL,
+                    start_new_session=True,
+                )
+            logger.info("Retrieval-Dienst gestartet (Log: %s), warte auf %s ...", log_path, address)
+        t0 = time.time()
+        while time.time() - t0 < timeout_s:
+            if _is_up(address):
+                return True
+            time.sleep(1.0)
+        return False
+    finally:
+        if owner:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Retrieval-Dienst (FAISS-Index einmal pro Node laden).")
+    parser.add_argument("--workspace-root", required=True, help="Workspace-Root mit indices/faiss.")
+    parser.add_argument("--indices-root", default=None, help="Abweichendes Index-Verzeichnis (z.B. Staging-Kopie).")
+    parser.add_argument("--socket", default=None, help="Unix-Socket-Pfad (statt TCP).")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP-Host (ohne --socket).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP-Port (ohne --socket).")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="Max. Zeilen pro Micro-Batch.")
+    parser.add_argument(
+        "--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS, help="Max. Wartezeit zum Sammeln eines Batches."
+    )
+    parser.add_argument("--threads", type=int, default=None, help="OpenMP-Threads für FAISS (Default: alle).")
+    parser.add_argument("--model-name", default=None, help="Query-Modell (Default: model_name aus der Index-Config).")
+    parser.add_argument("--device", default="cpu", help="Gerät für das Query-Modell.")
+    parser.add_argument(
+        "--idle-exit-s", type=float, default=0.0, help="Beenden nach so vielen Sekunden ohne Anfrage (0 = nie)."
+    )
+    parser.add_argument("--no-mmap", action="store_true", help="Index komplett lesen statt mappen.")
+    parser.add_argument("--ensure", action="store_true", help="Im Hintergrund starten, falls nicht schon aktiv.")
+    parser.add_argument("--ensure-timeout-s", type=float, default=600.0, help="Wartezeit für --ensure.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    raw_argv = list(sys.argv[1:] if argv is None else argv)
+    args = parse_args(raw_argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s", datefmt="%H:%M:%S")
+    address = service_address(args.socket, args.host, args.port)
+
+    if args.ensure:
+        lock_path = (args.socket or os.path.join("/tmp", f"retrieval_{args.port}")) + ".lock"
+        if not ensure_running(raw_argv, address, lock_path, args.ensure_timeout_s):
+            logger.error("Retrieval-Dienst unter %s nicht erreichbar.", address)
+            return 1
+        print(address)
+        return 0
+
+    if _is_up(address):
+        logger.error("Unter %s läuft bereits ein Retrieval-Dienst.", address)
+        return 1
+
+    retriever = FaissRetriever(
+        workspace_root=args.workspace_root,
+        indices_root=args.indices_root,
+        mmap=not args.no_mmap,
+        query_model=args.model_name,
+        query_device=args.device,
+    )
+    batcher = MicroBatcher(retriever, args.max_batch, args.max_wait_ms, args.threads)
+    state = ServiceState(retriever, batcher, args.idle_exit_s)
+    server = make_server(state, args.socket, args.host, args.port)
+    if args.idle_exit_s > 0:
+        threading.Thread(target=_idle_watchdog, args=(server, state), daemon=True).start()
+
+    logger.info("Retrieval-Dienst bereit unter %s (ntotal=%d).", address, retriever.index.ntotal)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    logger.info("Retrieval-Dienst beendet: %s", batcher.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
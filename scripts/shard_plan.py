@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+shard_plan.py
+
+Größenbewusste Shard-Planung für SLURM-Array-Jobs (annotate_semantics.py,
+generate_qa_candidates.py).
+
+Problem:
+- Bisher werden Dateien per `idx % num_shards == shard_id` verteilt. Dokumente
+  haben zwischen 3 und 5.000 Chunks, d.h. ein Task läuft 20 h, die anderen 2 h.
+
+Lösung:
+- Pro Eingabedatei werden die tatsächlich anstehenden Arbeitseinheiten gezählt:
+    annotate: Chunks, die in der Ausgabe noch nicht annotiert sind
+              (semantic.trust_level fehlt)
+    qa:       Ankerchunks, die is_candidate_chunk() erfüllen und noch nicht
+              in der QA-Ausgabedatei stehen
+- Verteilung per LPT (Longest Processing Time first): Dateien absteigend nach
+  Arbeit sortieren, jeweils dem aktuell leichtesten Shard zuweisen.
+- Ergebnis ist eine JSON-Plan-Datei, die beide Skripte über --shard-plan lesen.
+
+Beispiel:
+
+  python scripts/shard_plan.py --stage annotate --num-shards 6 \
+      --output /beegfs/.../logs/shard_plans/annotate_6.json
+
+  python scripts/shard_plan.py --stage qa --num-shards 5 \
+      --workspace-root /beegfs/scratch/workspace/es_phdoeble-rag_pipeline \
+      --output /beegfs/.../logs/shard_plans/qa_5.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import logging
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+THIS_FILE = Path(__file__).resolve()
+DEFAULT_REPO_ROOT = THIS_FILE.parent.parent
+
+if str(DEFAULT_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(DEFAULT_REPO_ROOT))
+
+logger = logging.getLogger("shard_plan")
+
+PLAN_VERSION = 1
+
+
+# ---------------------------------------------------------------------------
+# Arbeitseinheiten zählen
+# ---------------------------------------------------------------------------
+
+
+def _iter_json_lines(path: Path):
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def count_annotate_work(in_path: Path, out_dir: Path) -> int:
+    """
+    Anzahl Chunks in in_path, die in out_dir/<name> noch nicht annotiert sind
+    (gleiches Kriterium wie annotate_semantics.process_file).
+    """
+    annotated: set[str] = set()
+    out_path = out_dir / in_path.name
+    if out_path.is_file():
+        for rec in _iter_json_lines(out_path):
+            cid = rec.get("chunk_id")
+            sem = rec.get("semantic") or {}
+            if cid and isinstance(sem, dict) and sem.get("trust_level"):
+                annotated.add(str(cid))
+
+    todo = 0
+    for rec in _iter_json_lines(in_path):
+        cid = rec.get("chunk_id")
+        if cid and str(cid) in annotated:
+            continue
+        todo += 1
+    return todo
+
+
+def count_qa_work(in_path: Path, out_path: Optional[Path], cfg: Any) -> int:
+    """
+    Anzahl Ankerchunks in in_path, für die generate_qa_candidates noch Q/A
+    erzeugen würde (is_candidate_chunk + noch nicht in der Ausgabe).
+    """
+    from scripts.generate_qa_candidates import (  # type: ignore
+        is_candidate_chunk,
+        load_semantic_file,
+        read_existing_anchor_ids,
+    )
+
+    processed: set[str] = set()
+    if out_path is not None:
+        processed = set(read_existing_anchor_ids(out_path))
+
+    todo = 0
+    for chunk in load_semantic_file(in_path):
+        cid = chunk.get("chunk_id")
+        if not cid or str(cid) in processed:
+            continue
+        if is_candidate_chunk(chunk, cfg):
+            todo += 1
+    return todo
+
+
+# ---------------------------------------------------------------------------
+# LPT-Bin-Packing
+# ---------------------------------------------------------------------------
+
+
+def plan_lpt(work_units: Dict[str, int], num_shards: int) -> List[Dict[str, Any]]:
+    """
+    Longest-Processing-Time-first: größte Datei zuerst auf den Shard mit der
+    bisher geringsten Last. Deterministisch (Tie-Break über Dateiname / shard_id).
+    """
+    if num_shards < 1:
+        raise ValueError(f"num_shards muss >= 1 sein, erhalten: {num_shards}")
+
+    shards: List[Dict[str, Any]] = [
+        {"shard_id": i, "work_units": 0, "files": []} for i in range(num_shards)
+    ]
+    # (Last, Anzahl Dateien, shard_id) -> Dateien ohne Arbeit verteilen sich gleichmäßig
+    heap = [(0, 0, i) for i in range(num_shards)]
+    heapq.heapify(heap)
+
+    for name, units in sorted(work_units.items(), key=lambda kv: (-int(kv[1]), kv[0])):
+        load, nfiles, sid = heapq.heappop(heap)
+        shards[sid]["files"].append(name)
+        shards[sid]["work_units"] += int(units)
+        heapq.heappush(heap, (load + int(units), nfiles + 1, sid))
+
+    return shards
+
+
+def build_plan(stage: str, input_dir: Path, work_units: Dict[str, int], num_shards: int) -> Dict[str, Any]:
+    shards = plan_lpt(work_units, num_shards)
+    total = sum(int(v) for v in work_units.values())
+    loads = [s["work_units"] for s in shards]
+    return {
+        "plan_version": PLAN_VERSION,
+        "stage": stage,
+        "num_shards": num_shards,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "input_dir": str(input_dir),
+        "total_work_units": total,
+        "max_shard_work_units": max(loads) if loads else 0,
+        "min_shard_work_units": min(loads) if loads else 0,
+        "work_units": dict(sorted(work_units.items())),
+        "shards": shards,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Plan lesen (von annotate_semantics.py / generate_qa_candidates.py genutzt)
+# ---------------------------------------------------------------------------
+
+
+def load_shard_plan(path: Path) -> Dict[str, Any]:
+    if not path.is_file():
+        raise FileNotFoundError(f"Shard-Plan nicht gefunden: {path}")
+    with path.open("r", encoding="utf-8") as f:
+        plan = json.load(f)
+    if not isinstance(plan, dict) or not isinstance(plan.get("shards"), list):
+        raise ValueError(f"Ungültiger Shard-Plan (kein 'shards'-Array): {path}")
+    return plan
+
+
+def files_for_shard(
+    plan: Dict[str, Any],
+    shard_id: int,
+    num_shards: int,
+    available: Sequence[Path],
+    stage: Optional[str] = None,
+) -> List[Path]:
+    """
+    Liefert die Dateien dieses Shards laut Plan (in der Reihenfolge der verfügbaren Liste).
+
+    Dateien, die nach der Planung neu hinzugekommen sind (nicht im Plan), werden
+    per Modulo verteilt, damit nichts verloren geht.
+    """
+    plan_shards = int(plan.get("num_shards", len(plan["shards"])))
+    if plan_shards != num_shards:
+        raise ValueError(
+            f"Shard-Plan wurde für num_shards={plan_shards} erstellt, Job läuft mit num_shards={num_shards}."
+        )
+    if stage is not None and plan.get("stage") not in (None, stage):
+        raise ValueError(f"Shard-Plan ist für stage='{plan.get('stage')}', erwartet: '{stage}'.")
+
+    owner: Dict[str, int] = {}
+    for s in plan["shards"]:
+        sid = int(s.get("shard_id", 0))
+        for name in s.get("files") or []:
+            owner[str(name)] = sid
+
+    selected: List[Path] = []
+    unplanned = 0
+    for idx, p in enumerate(available):
+        sid = owner.get(p.name)
+        if sid is None:
+            unplanned += 1
+            sid = idx % num_shards
+        if sid == shard_id:
+            selected.append(p)
+
+    if unplanned:
+        logger.warning(
+            "%d Datei(en) sind nicht im Shard-Plan enthalten und werden per Modulo verteilt.",
+            unplanned,
+        )
+    missing = len(set(owner) - {p.name for p in available})
+    if missing:
+        logger.warning("%d Datei(en) aus dem Shard-Plan existieren nicht (mehr).", missing)
+
+    return selected
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Erzeugt einen größenbewussten Shard-Plan (LPT) für annotate- oder QA-Array-Jobs."
+    )
+    parser.add_argument("--stage", choices=["annotate", "qa"], required=True, help="Pipeline-Schritt.")
+    parser.add_argument("--num-shards", type=int, required=True, help="Anzahl Array-Tasks.")
+    parser.add_argument("--output", required=True, help="Pfad der Plan-Datei (JSON).")
+    parser.add_argument(
+        "--input-dir",
+        default=None,
+        help="annotate: Eingabeverzeichnis (Default: paths.normalized_json).",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="annotate: Ausgabeverzeichnis (Default: paths.semantic_json).",
+    )
+    parser.add_argument("--limit-files", type=int, default=None, help="annotate: wie --limit-files im Job.")
+    parser.add_argument("--workspace-root", default=None, help="qa: Workspace-Root.")
+    parser.add_argument("--config", default=None, help="qa: QA-Config (Default: qa_generation.default.json).")
+    parser.add_argument("--limit-num-files", type=int, default=None, help="qa: wie --limit-num-files im Job.")
+    return parser.parse_args(argv)
+
+
+def _plan_annotate(args: argparse.Namespace) -> Dict[str, Any]:
+    from config.paths.paths_utils import get_path  # type: ignore
+
+    input_dir = Path(args.input_dir or get_path("normalized_json")).expanduser().resolve()
+    output_dir = Path(args.output_dir or get_path("semantic_json")).expanduser().resolve()
+
+    files = sorted(input_dir.glob("*.jsonl"))
+    if args.limit_files is not None:
+        files = files[: args.limit_files]
+
+    work: Dict[str, int] = {}
+    for p in files:
+        work[p.name] = count_annotate_work(p, output_dir)
+        logger.debug("%s: %d offene Chunks", p.name, work[p.name])
+    return build_plan("annotate", input_dir, work, args.num_shards)
+
+
+def _plan_qa(args: argparse.Namespace) -> Dict[str, Any]:
+    from scripts.generate_qa_candidates import (  # type: ignore
+        iter_semantic_files,
+        load_qa_config,
+        resolve_workspace_root,
+    )
+
+    cfg = load_qa_config(args.config)
+    workspace_root = resolve_workspace_root(args.workspace_root, cfg)
+    semantic_dir = workspace_root / cfg.paths.get("semantic_dir", "semantic/json")
+    qa_candidates_dir = workspace_root / cfg.paths.get("qa_candidates_dir", "qa_candidates/jsonl")
+    resume_mode = cfg.runtime.get("resume_mode", "append")
+    pattern = cfg.output.get("output_file_pattern", "{input_basename}.qa_candidates.jsonl")
+
+    limit = args.limit_num_files if args.limit_num_files else int(cfg.debug.get("limit_num_files", 0))
+
+    work: Dict[str, int] = {}
+    for p in iter_semantic_files(semantic_dir, limit):
+        out_path = qa_candidates_dir / pattern.format(input_basename=p.stem)
+        done_ref = out_path if resume_mode in ("append", "resume") else None
+        work[p.name] = count_qa_work(p, done_ref, cfg)
+        logger.debug("%s: %d offene Anker", p.name, work[p.name])
+    return build_plan("qa", semantic_dir, work, args.num_shards)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+    plan = _plan_annotate(args) if args.stage == "annotate" else _plan_qa(args)
+
+    out = Path(args.output).expanduser().resolve()
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(out.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    tmp.replace(out)
+
+    logger.info(
+        "Shard-Plan geschrieben: %s (stage=%s, Dateien=%d, Arbeit gesamt=%d, max/min pro Shard=%d/%d)",
+        out,
+        plan["stage"],
+        len(plan["work_units"]),
+        plan["total_work_units"],
+        plan["max_shard_work_units"],
+        plan["min_shard_work_units"],
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+work_queue.py
+
+Dateibasierte Work-Queue mit Leases auf dem gemeinsamen Workspace (BeeGFS),
+für dynamische Lastverteilung über SLURM-Array-Tasks.
+
+Warum Dateien statt SQLite:
+- SQLite im WAL-Modus braucht Shared Memory und funktioniert nicht über
+  Knotengrenzen auf einem Netzwerk-Dateisystem. Ein rename() innerhalb eines
+  Dateisystems ist dagegen auch auf BeeGFS atomar.
+
+Layout:
+  <queue_dir>/
+    queue.json          # Metadaten; existiert erst, wenn die Queue befüllt ist
+    .seed.lock          # O_EXCL-Lock während des Befüllens
+    pending/<rang>__<item>
+    leased/<rang>__<item>   # mtime = letzter Heartbeat, Inhalt = Owner + Versuche
+    done/<rang>__<item>
+    failed/<rang>__<item>   # nach max_attempts abgelaufenen/fehlgeschlagenen Leases
+
+Ablauf:
+- Der erste Task befüllt die Queue (größte Items zuerst, damit lange Dateien
+  nicht am Ende allein laufen), alle anderen warten auf queue.json.
+- claim():    pending/x -> leased/x per rename (genau ein Gewinner)
+- Heartbeat:  Hintergrund-Thread aktualisiert die mtime von leased/x
+- complete(): leased/x -> done/x
+- Abgelaufene Leases (Task gecrasht/gekillt) werden bei jedem claim()
+  automatisch nach pending/ zurückgelegt.
+
+Weitere Array-Tasks können jederzeit dazukommen; sie ziehen einfach aus
+pending/, ein Re-Sharding ist nicht nötig.
+
+CLI (Status / Wartung):
+
+  python scripts/work_queue.py --queue-dir <dir> status
+  python scripts/work_queue.py --queue-dir <dir> reclaim
+  python scripts/work_queue.py --queue-dir <dir> retry-failed
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("work_queue")
+
+DEFAULT_LEASE_TTL_S = 900.0
+DEFAULT_MAX_ATTEMPTS = 3
+SEED_LOCK_STALE_S = 600.0
+
+
+def default_owner() -> str:
+    job = os.environ.get("SLURM_ARRAY_JOB_ID") or os.environ.get("SLURM_JOB_ID") or "local"
+    task = os.environ.get("SLURM_ARRAY_TASK_ID", "0")
+    return f"{socket.gethostname()}:{os.getpid()}:{job}_{task}"
+
+
+def _write_json_atomic(path: Path, obj: Any) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    tmp.replace(path)
+
+
+def _read_json(path: Path) -> Dict[str, Any]:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+@dataclass
+class Lease:
+    key: str  # Dateiname in pending/leased/done ("<rang>__<item>")
+    item: str
+    owner: str
+    attempts: int
+    lost: bool = False
+
+
+class WorkQueue:
+    """
+    Lease-basierte Queue über atomare Renames in einem gemeinsamen Verzeichnis.
+    """
+
+    def __init__(
+        self,
+        queue_dir: Path,
+        lease_ttl_s: float = DEFAULT_LEASE_TTL_S,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        self.queue_dir = Path(queue_dir)
+        self.lease_ttl_s = float(lease_ttl_s)
+        self.max_attempts = int(max_attempts)
+        self.pending_dir = self.queue_dir / "pending"
+        self.leased_dir = self.queue_dir / "leased"
+        self.done_dir = self.queue_dir / "done"
+        self.failed_dir = self.queue_dir / "failed"
+        self.meta_path = self.queue_dir / "queue.json"
+        self.lock_path = self.queue_dir / ".seed.lock"
+
+    # ------------------------------------------------------------------
+    # Befüllen
+    # ------------------------------------------------------------------
+
+    def is_seeded(self) -> bool:
+        return self.meta_path.is_file()
+
+    def ensure_seeded(
+        self,
+        items: Sequence[Tuple[str, int]],
+        stage: Optional[str] = None,
+        wait_timeout_s: float = 600.0,
+    ) -> bool:
+        """
+        Befüllt die Queue genau einmal (items: (name, gewicht)). Gibt True zurück,
+        wenn dieser Prozess befüllt hat, False wenn die Queue schon existierte.
+        """
+        self.queue_dir.mkdir(parents=True, exist_ok=True)
+        t0 = time.time()
+        while not self.is_seeded():
+            try:
+                fd = os.open(str(self.lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                try:
+                    age = time.time() - self.lock_path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if age > SEED_LOCK_STALE_S:
+                    logger.warning("Veralteter Seed-Lock (%.0fs) wird entfernt: %s", age, self.lock_path)
+                    try:
+                        self.lock_path.unlink()
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if time.time() - t0 > wait_timeout_s:
+                    raise TimeoutError(f"Queue wurde nicht innerhalb von {wait_timeout_s:.0f}s befüllt: {self.queue_dir}")
+                time.sleep(2.0)
+                continue
+
+            try:
+                os.write(fd, default_owner().encode("utf-8"))
+                os.close(fd)
+                if self.is_seeded():
+                    return False
+                self._seed(items, stage)
+                return True
+            finally:
+                try:
+                    self.lock_path.unlink()
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def _seed(self, items: Sequence[Tuple[str, int]], stage: Optional[str]) -> None:
+        for d in (self.pending_dir, self.leased_dir, self.done_dir, self.failed_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+        ordered = sorted(items, key=lambda kv: (-int(kv[1]), kv[0]))
+        width = max(6, len(str(len(ordered))))
+        for rank, (name, weight) in enumerate(ordered):
+            key = f"{rank:0{width}d}__{name}"
+            with (self.pending_dir / key).open("w", encoding="utf-8") as f:
+                json.dump({"item": name, "weight": int(weight), "attempts": 0}, f)
+
+        _write_json_atomic(
+            self.meta_path,
+            {
+                "stage": stage,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "created_by": default_owner(),
+                "num_items": len(ordered),
+                "lease_ttl_s": self.lease_ttl_s,
+            },
+        )
+        logger.info("Work-Queue befüllt: %s (%d Items)", self.queue_dir, len(ordered))
+
+    # ------------------------------------------------------------------
+    # Leases
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _item_of(key: str) -> str:
+        return key.split("__", 1)[1] if "__" in key else key
+
+    def reclaim_expired(self) -> int:
+        """Abgelaufene Leases zurück nach pending/ (bzw. failed/ nach max_attempts)."""
+        if not self.leased_dir.is_dir():
+            return 0
+        now = time.time()
+        reclaimed = 0
+        for p in sorted(self.leased_dir.iterdir()):
+            try:
+                age = now - p.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if age <= self.lease_ttl_s:
+                continue
+            info = _read_json(p)
+            attempts = int(info.get("attempts", 0))
+            target_dir = self.failed_dir if attempts >= self.max_attempts else self.pending_dir
+            try:
+                os.rename(p, target_dir / p.name)
+            except FileNotFoundError:
+                continue  # parallel zurückgeholt oder doch noch abgeschlossen
+            reclaimed += 1
+            logger.warning(
+                "Lease abgelaufen (%.0fs ohne Heartbeat, owner=%s, Versuch %d) -> %s: %s",
+                age,
+                info.get("owner"),
+                attempts,
+                target_dir.name,
+                p.name,
+            )
+        return reclaimed
+
+    def claim(self, owner: Optional[str] = None) -> Optional[Lease]:
+        """Nächstes Item leasen; None, wenn nichts mehr offen ist."""
+        owner = owner or default_owner()
+        self.reclaim_expired()
+        if not self.pending_dir.is_dir():
+            return None
+        for p in sorted(self.pending_dir.iterdir()):
+            if p.name.startswith("."):
+                continue
+            target = self.leased_dir / p.name
+            try:
+                # mtime vor dem Rename auffrischen, sonst erbt die Lease das Alter
+                # der pending-Datei und wirkt sofort abgelaufen
+                os.utime(p, None)
+                os.rename(p, target)
+            except FileNotFoundError:
+                continue  # ein anderer Task war schneller
+
+            info = _read_json(target)
+            attempts = int(info.get("attempts", 0)) + 1
+            info.update(
+                {
+                    "owner": owner,
+                    "attempts": attempts,
+                    "claimed_at": datetime.now().isoformat(timespec="seconds"),
+                }
+            )
+            try:
+                with target.open("w", encoding="utf-8") as f:
+                    json.dump(info, f)
+            except FileNotFoundError:
+                continue
+            return Lease(key=p.name, item=self._item_of(p.name), owner=owner, attempts=attempts)
+        return None
+
+    def renew(self, lease: Lease) -> bool:
+        try:
+            os.utime(self.leased_dir / lease.key, None)
+            return True
+        except FileNotFoundError:
+            lease.lost = True
+            return False
+
+    def complete(self, lease: Lease) -> None:
+        try:
+            os.rename(self.leased_dir / lease.key, self.done_dir / lease.key)
+            return
+        except FileNotFoundError:
+            pass
+        # Lease wurde zwischenzeitlich zurückgeholt: Wiederholung verhindern
+        try:
+            os.rename(self.pending_dir / lease.key, self.done_dir / lease.key)
+            logger.warning("Lease war abgelaufen, Item trotzdem abgeschlossen: %s", lease.key)
+        except FileNotFoundError:
+            logger.warning("Lease verloren, Item wird ggf. von einem anderen Task wiederholt: %s", lease.key)
+
+    def release(self, lease: Lease, count_attempt: bool = True) -> None:
+        """
+        Item nach Fehler freigeben (bzw. nach max_attempts nach failed/).
+        count_attempt=False: zurück nach pending/, ohne dass der Versuch zählt
+        (Item nicht fertig, aber auch nicht fehlgeschlagen, z.B. Budget erschöpft).
+        """
+        path = self.leased_dir / lease.key
+        if not count_attempt:
+            info = _read_json(path)
+            info["attempts"] = max(0, int(info.get("attempts", lease.attempts)) - 1)
+            try:
+                with path.open("w", encoding="utf-8") as f:
+                    json.dump(info, f)
+            except FileNotFoundError:
+                return
+        target_dir = self.failed_dir if count_attempt and lease.attempts >= self.max_attempts else self.pending_dir
+        try:
+            os.rename(path, target_dir / lease.key)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def heartbeat(self, lease: Lease, interval_s: Optional[float] = None) -> Iterator[Lease]:
+        """Hält die Lease per Hintergrund-Thread frisch, solange der Block läuft."""
+        interval = interval_s if interval_s is not None else max(5.0, self.lease_ttl_s / 3.0)
+        stop = threading.Event()
+
+        def _beat() -> None:
+            while not stop.wait(interval):
+                if not self.renew(lease):
+                    logger.warning("Heartbeat: Lease nicht mehr vorhanden: %s", lease.key)
+                    return
+
+        t = threading.Thread(target=_beat, name=f"lease-heartbeat-{lease.item}", daemon=True)
+        t.start()
+        try:
+            yield lease
+        finally:
+            stop.set()
+            t.join(timeout=5.0)
+
+    # ------------------------------------------------------------------
+    # Status
+    # ------------------------------------------------------------------
+
+    def status(self) -> Dict[str, Any]:
+        def _count(d: Path) -> int:
+            return sum(1 for p in d.iterdir() if not p.name.startswith(".")) if d.is_dir() else 0
+
+        return {
+            "queue_dir": str(self.queue_dir),
+            "seeded": self.is_seeded(),
+            "pending": _count(self.pending_dir),
+            "leased": _count(self.leased_dir),
+            "done": _count(self.done_dir),
+            "failed": _count(self.failed_dir),
+        }
+
+    def retry_failed(self) -> int:
+        n = 0
+        if not self.failed_dir.is_dir():
+            return 0
+        for p in sorted(self.failed_dir.iterdir()):
+            info = _read_json(p)
+            info["attempts"] = 0
+            try:
+                with p.open("w", encoding="utf-8") as f:
+                    json.dump(info, f)
+                os.rename(p, self.pending_dir / p.name)
+                n += 1
+            except FileNotFoundError:
+                continue
+        return n
+
+
+def drain_queue(
+    queue: WorkQueue,
+    handler: Callable[[str], Any],
+    owner: Optional[str] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Dict[str, int]:
+    """
+    Zieht Items, bis die Queue leer ist (oder should_stop() True liefert), und
+    ruft handler(item) pro Item auf. Fehler im Handler geben die Lease frei
+    (Retry durch einen anderen Task), der Task macht mit dem nächsten Item weiter.
+    Liefert should_stop() direkt nach dem Handler True, wurde das Item evtl. nur
+    teilweise bearbeitet: es bleibt offen (pending/, Versuch zählt nicht).
+    """
+    owner = owner or default_owner()
+    stats = {"done": 0, "failed": 0, "deferred": 0}
+    while True:
+        if should_stop is not None and should_stop():
+            logger.info("Work-Queue: Abbruchbedingung erreicht, keine weiteren Leases.")
+            break
+        lease = queue.claim(owner)
+        if lease is None:
+            break
+        logger.info("Lease: %s (Versuch %d, owner=%s)", lease.item, lease.attempts, owner)
+        try:
+            with queue.heartbeat(lease):
+                handler(lease.item)
+        except Exception:
+            logger.exception("Fehler bei Item %s – Lease wird freigegeben.", lease.item)
+            queue.release(lease)
+            stats["failed"] += 1
+            continue
+        if should_stop is not None and should_stop():
+            logger.info("Abbruchbedingung während %s – Item bleibt offen.", lease.item)
+            queue.release(lease, count_attempt=False)
+            stats["deferred"] += 1
+            break
+        queue.complete(lease)
+        stats["done"] += 1
+    logger.info(
+        "Work-Queue beendet: %s (diesem Task: done=%d, failed=%d, offen gelassen=%d)",
+        queue.queue_dir,
+        stats["done"],
+        stats["failed"],
+        stats["deferred"],
+    )
+    return stats
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Status/Wartung einer dateibasierten Work-Queue.")
+    parser.add_argument("--queue-dir", required=True, help="Queue-Verzeichnis auf dem Workspace.")
+    parser.add_argument("--lease-ttl", type=float, default=DEFAULT_LEASE_TTL_S, help="Lease-Timeout (s).")
+    parser.add_argument("command", choices=["status", "reclaim", "retry-failed"], help="Aktion.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    queue = WorkQueue(Path(args.queue_dir), lease_ttl_s=args.lease_ttl)
+    if args.command == "reclaim":
+        logger.info("Zurückgeholte Leases: %d", queue.reclaim_expired())
+    elif args.command == "retry-failed":
+        logger.info("Wieder eingereihte Items: %d", queue.retry_failed())
+    print(json.dumps(queue.status(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())